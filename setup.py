@@ -27,6 +27,9 @@ setup(name='tap-snapchat-ads',
           ]
       },
       extras_require={
+          'async': [
+              'aiohttp==3.9.5'
+          ],
           'dev': [
               'pylint',
               'ipdb',
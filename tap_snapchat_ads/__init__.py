@@ -6,6 +6,7 @@ import argparse
 import singer
 from singer import metadata, utils
 from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.concurrency import AdaptiveConcurrencyLimiter, MAX_LIMIT
 from tap_snapchat_ads.discover import discover
 from tap_snapchat_ads.sync import sync as _sync
 
@@ -20,10 +21,10 @@ REQUIRED_CONFIG_KEYS = [
     'org_account_ids'
 ]
 
-def do_discover():
+def do_discover(config=None):
 
     LOGGER.info('Starting discover')
-    catalog = discover()
+    catalog = discover(config)
     json.dump(catalog.to_dict(), sys.stdout, indent=2)
     LOGGER.info('Finished discover')
 
@@ -44,7 +45,10 @@ def main():
                         parsed_args.config['client_secret'],
                         parsed_args.config['refresh_token'],
                         parsed_args.config.get('request_timeout'),
-                        parsed_args.config['user_agent']) as client:
+                        parsed_args.config['user_agent'],
+                        parsed_args.config.get('max_parallel_parents'),
+                        concurrency_limiter=AdaptiveConcurrencyLimiter(
+                            parsed_args.config.get('max_concurrent_requests') or MAX_LIMIT)) as client:
 
         state = {}
         if parsed_args.state:
@@ -55,7 +59,7 @@ def main():
             config = parsed_args.config
 
         if parsed_args.discover:
-            do_discover()
+            do_discover(config)
         elif parsed_args.catalog:
             _sync(client=client,
                  config=config,
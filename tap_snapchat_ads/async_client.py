@@ -0,0 +1,187 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+import backoff
+import singer
+from singer import metrics
+from tap_snapchat_ads.client import (API_URL, API_VERSION, SNAPCHAT_TOKEN_URL, REQUEST_TIMEOUT,
+                                     Server5xxError, Server429Error, SnapchatError,
+                                     raise_for_error_code)
+from tap_snapchat_ads.concurrency import AdaptiveConcurrencyLimiter
+from tap_snapchat_ads.rate_limit import RateLimiter
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+LOGGER = singer.get_logger()
+
+# Default number of requests in flight at the same time
+MAX_CONCURRENT_REQUESTS = 100
+
+RETRY_EXCEPTIONS = (Server5xxError, Server429Error, asyncio.TimeoutError)
+if aiohttp:
+    RETRY_EXCEPTIONS = RETRY_EXCEPTIONS + (aiohttp.ClientConnectionError,)
+
+
+class AsyncSnapchatClient: # pylint: disable=too-many-instance-attributes
+    """
+    asyncio counterpart of SnapchatClient, built on aiohttp (pip install tap-snapchat-ads[async]).
+    Same error mapping, token refresh and rate limit handling as SnapchatClient,
+    without a thread per request in flight.
+    """
+    def __init__(self,
+                 client_id,
+                 client_secret,
+                 refresh_token,
+                 request_timeout,
+                 user_agent=None,
+                 max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+                 rate_limiter=None,
+                 concurrency_limiter=None):
+        if aiohttp is None:
+            raise SnapchatError('aiohttp is required for async requests, install tap-snapchat-ads[async]')
+        self.__client_id = client_id
+        self.__client_secret = client_secret
+        self.__refresh_token = refresh_token
+        self.__user_agent = user_agent
+        self.__access_token = None
+        self.__expires = None
+        self.__session = None
+        self.__token_lock = None
+        self.max_concurrent_requests = int(max_concurrent_requests or MAX_CONCURRENT_REQUESTS)
+        self.base_url = '{}/{}'.format(API_URL, API_VERSION)
+        # shared with the SnapchatClient of the sync, when given
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.concurrency_limiter = concurrency_limiter or AdaptiveConcurrencyLimiter(self.max_concurrent_requests)
+
+        # if request_timeout is other than 0, "0" or "" then use request_timeout
+        if request_timeout and float(request_timeout):
+            self.request_timeout = float(request_timeout)
+        else: # If value is 0, "0" or "" then set the default which is 300 seconds.
+            self.request_timeout = REQUEST_TIMEOUT
+
+    async def __aenter__(self):
+        self.__token_lock = asyncio.Lock()
+        self.__session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            connector=aiohttp.TCPConnector(limit=self.max_concurrent_requests))
+        try:
+            await self.get_access_token()
+        except Exception:
+            await self.__session.close()
+            raise
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        await self.__session.close()
+
+    async def get_access_token(self):
+        # The refresh_token never expires and may be used many times to generate each access_token
+        if self.__access_token is not None and self.__expires > datetime.utcnow():
+            return
+
+        async with self.__token_lock:
+            # another task may have refreshed the token while we were waiting
+            if self.__access_token is not None and self.__expires > datetime.utcnow():
+                return
+            await self.__refresh_access_token()
+
+    @backoff.on_exception(backoff.expo,
+                          RETRY_EXCEPTIONS,
+                          max_tries=7,
+                          factor=3)
+    async def __refresh_access_token(self):
+        headers = {}
+        if self.__user_agent:
+            headers['User-Agent'] = self.__user_agent
+
+        async with self.__session.post(
+                SNAPCHAT_TOKEN_URL,
+                headers=headers,
+                data={
+                    'grant_type': 'refresh_token',
+                    'client_id': self.__client_id,
+                    'client_secret': self.__client_secret,
+                    'refresh_token': self.__refresh_token,
+                }) as response:
+            data = await self.__read_json(response)
+            if response.status != 200:
+                raise_for_error_code(response.status, data)
+
+        self.__access_token = data.get('access_token')
+        expires_in = int(data.get('expires_in', '3600'))
+        self.__expires = datetime.utcnow() + timedelta(seconds=expires_in)
+        LOGGER.info('Authorized, token expires = {}'.format(self.__expires))
+
+    @staticmethod
+    async def __read_json(response):
+        # some status codes does not contains json response, thus set to empty if not found
+        try:
+            return await response.json(content_type=None)
+        except Exception:
+            return {}
+
+    @backoff.on_exception(backoff.expo,
+                          RETRY_EXCEPTIONS,
+                          max_tries=7,
+                          factor=3)
+    async def request(self, method, path=None, url=None, **kwargs):
+
+        await self.get_access_token()
+
+        if not url and path:
+            url = '{}/{}'.format(self.base_url, path)
+
+        # endpoint = stream_name (from sync.py API call)
+        endpoint = kwargs.pop('endpoint', None)
+
+        if 'headers' not in kwargs:
+            kwargs['headers'] = {}
+        kwargs['headers']['Authorization'] = 'Bearer {}'.format(self.__access_token)
+
+        if self.__user_agent:
+            kwargs['headers']['User-Agent'] = self.__user_agent
+
+        if method == 'POST':
+            kwargs['headers']['Content-Type'] = 'application/json'
+
+        await self.rate_limiter.async_wait()
+        started = await self.concurrency_limiter.async_acquire()
+        status_code = None
+        try:
+            with metrics.http_request_timer(endpoint) as timer:
+                async with self.__session.request(method, url, **kwargs) as response:
+                    timer.tags[metrics.Tag.http_status_code] = response.status
+                    text = await response.text()
+                    headers = response.headers
+                    status_code = response.status
+        finally:
+            self.concurrency_limiter.release(started, status_code)
+
+        self.rate_limiter.update(headers)
+
+        if status_code != 200:
+            LOGGER.error('{}: {}'.format(status_code, text))
+            try:
+                response_json = json.loads(text) if text else {}
+            except ValueError:
+                response_json = {}
+            raise_for_error_code(status_code, response_json if isinstance(response_json, dict) else {})
+
+        # Catch invalid json response
+        try:
+            response_json = json.loads(text)
+        except Exception as err:
+            LOGGER.error('{}'.format(err))
+            LOGGER.error('response.headers = {}'.format(headers))
+            raise
+
+        return response_json
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url=url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url=url, **kwargs)
@@ -0,0 +1,179 @@
+import asyncio
+from collections import deque
+from itertools import islice
+import singer
+from singer import utils
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.async_client import AsyncSnapchatClient, MAX_CONCURRENT_REQUESTS
+from tap_snapchat_ads.context import get_timezone
+from tap_snapchat_ads.lookback import get_lookback_days
+from tap_snapchat_ads.stats_cache import is_final_window, open_stats_cache
+from tap_snapchat_ads.windows import get_date_window_size
+
+LOGGER = singer.get_logger()
+
+# Date windows of a parent requested ahead of the window being written, their records held in memory
+MAX_PARENT_WINDOWS = 4
+
+
+class AsyncStatsSync:
+    """
+    Syncs a stats stream for many parents (ad accounts, campaigns, ad squads, ads) from one event loop.
+
+    The parents are synced concurrently, with at most `max_concurrent_requests` requests in
+    flight, and the next MAX_PARENT_WINDOWS date windows of each parent are requested ahead.
+    Records and bookmarks of each parent are still written in date window order, same as
+    SnapchatAds.sync_endpoint. The AsyncioExecutor shares one client (one session and one
+    access token) between the batches of a sync.
+    """
+
+    def __init__(self, stream_obj, config, catalog, state, sync_streams, selected_streams, rate_limiter=None, concurrency_limiter=None, # pylint: disable=too-many-arguments
+                 lookback_policy=None, stats_dedupe=None):
+        self.stream_obj = stream_obj
+        self.config = config
+        self.catalog = catalog
+        self.state = state
+        self.sync_streams = sync_streams
+        self.selected_streams = selected_streams
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.lookback_policy = lookback_policy
+        self.stats_dedupe = stats_dedupe
+        self.max_concurrent_requests = int(config.get('max_concurrent_requests') or MAX_CONCURRENT_REQUESTS)
+
+    def open_client(self):
+        """Returns the AsyncSnapchatClient of the config, sharing the limits of the sync client"""
+        return AsyncSnapchatClient(self.config['client_id'],
+                                   self.config['client_secret'],
+                                   self.config['refresh_token'],
+                                   self.config.get('request_timeout'),
+                                   self.config.get('user_agent'),
+                                   self.max_concurrent_requests,
+                                   self.rate_limiter,
+                                   self.concurrency_limiter)
+
+    async def sync_parents(self, client, stream_name, stream_class, child_parents):
+        """
+        Syncs stream_name for each (parent_id, timezone_desc, lifetime) of child_parents with the
+        open client of the AsyncioExecutor, returns the total number of records
+        """
+        request_semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        parent_semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        async def sync_parent(child_parent):
+            async with parent_semaphore:
+                return await self.__sync_parent(client, request_semaphore, stream_name, stream_class, *child_parent)
+
+        totals = await asyncio.gather(*[sync_parent(child_parent) for child_parent in child_parents])
+        return sum(totals)
+
+    async def __fetch_window(self, client, request_semaphore, stream_name, stream_class, params, parent_id, # pylint: disable=too-many-arguments
+                             window_cache=None):
+        """Returns the transformed records of all the pages of a date window, window_cache: the cache of a final window"""
+        next_url = self.stream_obj.get_endpoint_url(
+            client.base_url, stream_name, stream_class, params, self.config, parent_id=parent_id)
+        transformed_data = []
+        while next_url is not None:
+            try:
+                data = window_cache.get(next_url) if window_cache is not None else None
+                if data is None:
+                    async with request_semaphore:
+                        data = await client.get(url=next_url, endpoint=stream_name)
+                    if window_cache is not None and data and data.get('request_status') == 'SUCCESS':
+                        window_cache.put(next_url, data)
+            except Exception as err:
+                LOGGER.error('{}'.format(err))
+                LOGGER.error('URL for Stream {}: {}'.format(stream_name, next_url))
+                raise
+
+            if not data:
+                LOGGER.info('No data results returned')
+                break # No data results
+
+            request_status = data.get('request_status')
+            if request_status != 'SUCCESS':
+                raise RuntimeError(data)
+
+            # Get pagination next_url
+            next_url = data.get('paging', {}).get('next_link', None)
+            transformed_data.extend(self.stream_obj.transform_data(data, stream_name, stream_class, parent_id=parent_id))
+
+        return transformed_data, utils.now()
+
+    async def __sync_parent(self, client, request_semaphore, stream_name, stream_class, parent_id, timezone_desc, # pylint: disable=too-many-arguments
+                            lifetime=None):
+        bookmark_field = next(iter(stream_class.replication_keys), None)
+        parent = stream_class.parent
+        params = self.stream_obj.get_stream_params(stream_name, stream_class, self.config, self.catalog)
+        _, _, attribution_window = self.stream_obj.get_attribution_windows(self.config)
+        timezone = get_timezone(timezone_desc)
+        report_granularity = params.get('granularity', 'HOUR')
+
+        last_datetime = self.stream_obj.get_bookmark(
+            self.state, stream_name, self.config.get('start_date'), bookmark_field, parent, parent_id)
+        max_bookmark_value = last_datetime
+        now_datetime = utils.now()
+        lifetime_bounds = self.stream_obj.get_lifetime_bounds(self.config, lifetime, attribution_window)
+        date_windows = self.stream_obj.get_date_windows(
+            stream_class, strptime_to_utc(last_datetime), now_datetime,
+            get_lookback_days(self.lookback_policy, stream_name, attribution_window,
+                              strptime_to_utc(last_datetime), now_datetime), lifetime_bounds,
+            # the windows are requested ahead, concurrently: not adaptive, the configured size
+            get_date_window_size(self.config, self.state, stream_name, stream_class, adaptive=False)[0])
+
+        # Request the next date windows of the parent ahead, the final windows may be cached
+        stats_cache = open_stats_cache(self.config)
+
+        def fetch_window(start_window, end_window):
+            window_params = dict(params)
+            window_params[stream_class.bookmark_query_field_from], window_params[stream_class.bookmark_query_field_to] = \
+                self.stream_obj.get_window_query_dates(start_window, end_window, timezone, report_granularity)
+            window_cache = stats_cache if stats_cache and is_final_window(end_window, now_datetime, attribution_window) else None
+            return asyncio.ensure_future(self.__fetch_window(
+                client, request_semaphore, stream_name, stream_class, window_params, parent_id, window_cache))
+
+        date_windows = iter(date_windows)
+        tasks = deque()
+
+        def fetch_next_windows():
+            for start_window, end_window in islice(date_windows, MAX_PARENT_WINDOWS - len(tasks)):
+                tasks.append(fetch_window(start_window, end_window))
+
+        endpoint_total = 0
+        try:
+            # Write records and bookmarks in date window order
+            fetch_next_windows()
+            while tasks:
+                transformed_data, time_extracted = await tasks.popleft()
+                fetch_next_windows()
+                if transformed_data and self.stats_dedupe is not None and \
+                        stream_name in self.selected_streams and stream_name in self.sync_streams:
+                    transformed_data = self.stats_dedupe.filter_changed(stream_name, transformed_data)
+                if transformed_data and stream_name in self.selected_streams and stream_name in self.sync_streams:
+                    max_bookmark_value, record_count = self.stream_obj.process_records(
+                        catalog=self.catalog,
+                        stream_name=stream_name,
+                        records=transformed_data,
+                        time_extracted=time_extracted,
+                        bookmark_field=bookmark_field,
+                        max_bookmark_value=max_bookmark_value,
+                        last_datetime=last_datetime)
+                    endpoint_total = endpoint_total + record_count
+                    if self.stats_dedupe is not None:
+                        self.stats_dedupe.record_written(stream_name, transformed_data, bookmark_field, last_datetime)
+
+                if bookmark_field and stream_name in self.selected_streams:
+                    self.stream_obj.write_bookmark(self.state, stream_name, max_bookmark_value, bookmark_field, parent, parent_id)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        # The stats of an entity which ended are final, do not request them again
+        final_bookmark = self.stream_obj.get_final_bookmark(max_bookmark_value, lifetime_bounds, now_datetime)
+        if final_bookmark and bookmark_field and stream_name in self.selected_streams:
+            self.stream_obj.write_bookmark(self.state, stream_name, final_bookmark, bookmark_field, parent, parent_id)
+
+        LOGGER.info('FINISHED Sync for Stream: {}, parent_id: {}, total_records: {}'.format(
+            stream_name, parent_id, endpoint_total))
+        return endpoint_total
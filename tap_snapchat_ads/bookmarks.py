@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+import pytz
+from singer.utils import strptime_to_utc, strftime
+
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def get_epoch(value):
+    """Returns a date-time string as integer microseconds since the epoch"""
+    return (strptime_to_utc(value) - EPOCH) // MICROSECOND
+
+
+class BookmarkTracker:
+    """
+    Max bookmark of the records of a page, compared as integer epochs: each distinct
+    bookmark value of the page (a few hours or days for thousands of stats rows) is
+    parsed once, and the max bookmark is formatted once, at the end of the page.
+    """
+
+    def __init__(self, last_datetime, max_bookmark_value):
+        self.last_datetime = last_datetime
+        self.max_bookmark_value = max_bookmark_value
+        self.__epochs = {}
+        self.__last_epoch = None
+        self.__max_epoch = None
+        self.__max_value = None
+
+    def get_epoch(self, value):
+        epoch = self.__epochs.get(value)
+        if epoch is None:
+            epoch = self.__epochs[value] = get_epoch(value)
+        return epoch
+
+    def is_new(self, bookmark_value):
+        """Tracks the bookmark of a record, returns True if it is not before last_datetime"""
+        epoch = self.get_epoch(bookmark_value)
+        if self.__last_epoch is None:
+            self.__last_epoch = self.get_epoch(self.last_datetime)
+            if not self.max_bookmark_value:
+                self.max_bookmark_value = self.last_datetime
+            self.__max_epoch = self.get_epoch(self.max_bookmark_value)
+
+        if epoch > self.__max_epoch:
+            self.__max_epoch = epoch
+            self.__max_value = bookmark_value
+        return epoch >= self.__last_epoch
+
+    def get_max_bookmark_value(self):
+        """Returns the max bookmark, formatted if a record moved it"""
+        if self.__max_value is not None:
+            return strftime(strptime_to_utc(self.__max_value))
+        return self.max_bookmark_value
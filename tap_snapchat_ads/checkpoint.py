@@ -0,0 +1,90 @@
+import time
+from contextlib import contextmanager
+import singer
+from tap_snapchat_ads.parallel import OUTPUT_LOCK
+from tap_snapchat_ads.state_layout import CompactStateLayout, use_compact_state
+
+LOGGER = singer.get_logger()
+
+
+class CheckpointManager:
+    """
+    Coalesces the STATE messages of the sync. A change of the state (bookmarks, currently_syncing)
+    marks it dirty, and it is written once `state_interval_seconds` passed or `state_interval_records`
+    records were written since the previous STATE message. Without an interval every change is
+    written, as before. With `compact_state` the per-parent bookmarks of the STATE messages
+    are written in the compact layout (CompactStateLayout).
+
+    The bookmarks are only set in the state after their records are written, so a later STATE
+    message is always safe to resume from. The dirty state is still written at the end of each
+    stream (currently_syncing removed) and when the sync ends or fails.
+    """
+
+    def __init__(self):
+        self.interval_seconds = None
+        self.interval_records = None
+        self.layout = None
+        self.states_written = 0
+        self.__dirty = False
+        self.__records = 0
+        self.__written_at = time.monotonic()
+
+    def configure(self, config):
+        interval_seconds = config.get('state_interval_seconds')
+        interval_records = config.get('state_interval_records')
+        with OUTPUT_LOCK:
+            self.interval_seconds = float(interval_seconds) if interval_seconds not in (None, '') else None
+            self.interval_records = int(interval_records) if interval_records not in (None, '') else None
+            self.layout = CompactStateLayout() if use_compact_state(config) else None
+            self.states_written = 0
+            self.__dirty = False
+            self.__records = 0
+            self.__written_at = time.monotonic()
+
+    def add_records(self, count):
+        """Counts the records written since the previous STATE message"""
+        with OUTPUT_LOCK:
+            self.__records += count
+
+    def is_due(self):
+        if self.interval_seconds is None and self.interval_records is None:
+            return True
+        if self.interval_seconds is not None and time.monotonic() - self.__written_at >= self.interval_seconds:
+            return True
+        return self.interval_records is not None and self.__records >= self.interval_records
+
+    def write_state(self, state, force=False, stream=None, keys=None):
+        """Marks the state (and the bookmark keys of the stream) changed, writes it if the interval passed (or force)"""
+        with OUTPUT_LOCK:
+            self.__dirty = True
+            if stream is not None and self.layout is not None:
+                self.layout.mark_changed(stream, keys)
+            if force or self.is_due():
+                self.__write(state)
+
+    def flush(self, state):
+        """Writes the state if it changed since the previous STATE message"""
+        with OUTPUT_LOCK:
+            if self.__dirty:
+                self.__write(state)
+
+    def __write(self, state):
+        singer.write_state(self.layout.encode(state) if self.layout is not None else state)
+        self.states_written += 1
+        self.__dirty = False
+        self.__records = 0
+        self.__written_at = time.monotonic()
+
+
+CHECKPOINTS = CheckpointManager()
+
+
+@contextmanager
+def open_checkpoints(config, state):
+    """Configures the state checkpoints for a sync, the dirty state is written when it ends or fails"""
+    CHECKPOINTS.configure(config)
+    try:
+        yield CHECKPOINTS
+    finally:
+        CHECKPOINTS.flush(state)
+        LOGGER.info('STATE messages written: {}'.format(CHECKPOINTS.states_written))
@@ -1,17 +1,19 @@
-from decimal import Decimal
 from datetime import datetime, timedelta
-import time
+import threading
 import backoff
 import requests
 from requests.exceptions import ConnectionError, Timeout
 import singer
 from singer import metrics
+from tap_snapchat_ads.concurrency import AdaptiveConcurrencyLimiter
+from tap_snapchat_ads.rate_limit import RateLimiter
 
 
 API_URL = 'https://adsapi.snapchat.com'
 API_VERSION = 'v1'
 SNAPCHAT_TOKEN_URL = 'https://accounts.snapchat.com/login/oauth2/access_token'
 REQUEST_TIMEOUT = 300 # 5 minutes default timeout
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 LOGGER = singer.get_logger()
 
 class Server5xxError(Exception):
@@ -136,28 +138,37 @@ def raise_for_error(response):
                 response_json = response.json()
             except Exception:
                 response_json = {}
-
-            error_code = response_json.get('error_code', "")
-            if error_code:
-                error_code = ", " + error_code
-            debug_message = response_json.get('debug_message', response_json.get('error_description', ERROR_CODE_EXCEPTION_MAPPING.get(status_code, {}).get("message", "Unknown Error")))
-            error_message = '{}{}: {}'.format(status_code, error_code, debug_message)
-            LOGGER.error(error_message)
-            if status_code > 500 and status_code != 503:
-                exception = Server5xxError
-            else:
-                exception = get_exception_for_error_code(status_code)
-            raise exception(error_message) from error
+            raise_for_error_code(status_code, response_json, error)
         except (ValueError, TypeError) as err:
             raise SnapchatError(err) from err
 
+def raise_for_error_code(status_code, response_json, error=None):
+    """
+    Raises the exception mapped to an error status code and error response,
+    shared by the requests based and the asyncio based clients
+    """
+    error_code = response_json.get('error_code', "")
+    if error_code:
+        error_code = ", " + error_code
+    debug_message = response_json.get('debug_message', response_json.get('error_description', ERROR_CODE_EXCEPTION_MAPPING.get(status_code, {}).get("message", "Unknown Error")))
+    error_message = '{}{}: {}'.format(status_code, error_code, debug_message)
+    LOGGER.error(error_message)
+    if status_code > 500 and status_code != 503:
+        exception = Server5xxError
+    else:
+        exception = get_exception_for_error_code(status_code)
+    raise exception(error_message) from error
+
 class SnapchatClient: # pylint: disable=too-many-instance-attributes
     def __init__(self,
                  client_id,
                  client_secret,
                  refresh_token,
                  request_timeout,
-                 user_agent=None):
+                 user_agent=None,
+                 pool_maxsize=None,
+                 rate_limiter=None,
+                 concurrency_limiter=None):
         self.__client_id = client_id
         self.__client_secret = client_secret
         self.__refresh_token = refresh_token
@@ -165,7 +176,17 @@ class SnapchatClient: # pylint: disable=too-many-instance-attributes
         self.__access_token = None
         self.__expires = None
         self.__session = requests.Session()
+        self.__token_lock = threading.Lock()
         self.base_url = '{}/{}'.format(API_URL, API_VERSION)
+        # one rate limit budget for all the requests of the sync
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # adaptive limit of the requests in flight, shared by all the sync threads
+        self.concurrency_limiter = concurrency_limiter or AdaptiveConcurrencyLimiter()
+
+        # the session is shared by all sync threads, keep one connection per thread
+        if pool_maxsize and int(pool_maxsize) > requests.adapters.DEFAULT_POOLSIZE:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=int(pool_maxsize))
+            self.__session.mount('https://', adapter)
 
 
         # if request_timeout is other than 0, "0" or "" then use request_timeout
@@ -191,6 +212,13 @@ class SnapchatClient: # pylint: disable=too-many-instance-attributes
         if self.__access_token is not None and self.__expires > datetime.utcnow():
             return
 
+        with self.__token_lock:
+            # another thread may have refreshed the token while we were waiting
+            if self.__access_token is not None and self.__expires > datetime.utcnow():
+                return
+            self.__refresh_access_token()
+
+    def __refresh_access_token(self):
         headers = {}
         if self.__user_agent:
             headers['User-Agent'] = self.__user_agent
@@ -247,31 +275,22 @@ class SnapchatClient: # pylint: disable=too-many-instance-attributes
         if method == 'POST':
             kwargs['headers']['Content-Type'] = 'application/json'
 
-        with metrics.http_request_timer(endpoint) as timer:
-            response = self.__session.request(method, url, timeout=self.request_timeout, **kwargs)
-            timer.tags[metrics.Tag.http_status_code] = response.status_code
+        self.rate_limiter.wait()
+        started = self.concurrency_limiter.acquire()
+        status_code = None
+        try:
+            with metrics.http_request_timer(endpoint) as timer:
+                response = self.__session.request(method, url, timeout=self.request_timeout, **kwargs)
+                status_code = response.status_code
+                timer.tags[metrics.Tag.http_status_code] = response.status_code
+        finally:
+            self.concurrency_limiter.release(started, status_code)
 
         # Rate limits: https://developers.snapchat.com/api/docs/#rate-limits
         # Use retry functionality in backoff to wait and retry if
         # response code equals 429 because rate limit has been exceeded
         # LOGGER.info('headers = {}'.format(response.headers))
-        rate_limit = int(response.headers.get('X-Rate-Limit-Limit', 0))
-        rate_limit_remaining = int(response.headers.get('X-Rate-Limit-Remaining', 0))
-        rate_limit_reset = int(response.headers.get('X-Rate-Limit-Reset', 0))
-
-        if rate_limit == 0:
-            rate_limit_percent_remaining = 100
-        else:
-            rate_limit_percent_remaining = 100 * (Decimal(
-                rate_limit_remaining) / Decimal(rate_limit))
-
-        # Wait for reset if remaining calls are less than 5%
-        if rate_limit_percent_remaining < 5:
-            LOGGER.warning('Rate Limit Warning: {}; remaining calls: {}; remaining %: {}% '.format(
-                rate_limit, rate_limit_remaining, int(rate_limit_percent_remaining)))
-            wait_time = rate_limit_reset - int(time.time())
-            LOGGER.warning('Waiting for {} seconds.'.format(wait_time))
-            time.sleep(int(wait_time))
+        self.rate_limiter.update(response.headers)
 
         if response.status_code != 200:
             LOGGER.error('{}: {}'.format(response.status_code, response.text))
@@ -291,5 +310,24 @@ class SnapchatClient: # pylint: disable=too-many-instance-attributes
     def get(self, url, **kwargs):
         return self.request('GET', url=url, **kwargs)
 
+    @backoff.on_exception(backoff.expo,
+                          (Server5xxError, ConnectionError, Server429Error, Timeout),
+                          max_tries=7,
+                          factor=3)
+    def download(self, url, fileobj, endpoint=None):
+        """
+        Streams the file at url (a report file, the url is signed) into fileobj
+        """
+        fileobj.seek(0)
+        fileobj.truncate()
+        with metrics.http_request_timer(endpoint) as timer:
+            with self.__session.get(url, stream=True, timeout=self.request_timeout) as response:
+                timer.tags[metrics.Tag.http_status_code] = response.status_code
+                if response.status_code != 200:
+                    LOGGER.error('{}: {}'.format(response.status_code, response.text))
+                    raise_for_error(response)
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    fileobj.write(chunk)
+
     def post(self, url, **kwargs):
         return self.request('POST', url=url, **kwargs)
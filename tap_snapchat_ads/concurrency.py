@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+import singer
+from singer import metrics
+
+LOGGER = singer.get_logger()
+
+# Default maximum number of requests in flight
+MAX_LIMIT = 100
+
+
+def is_overloaded(status_code):
+    """429, 5xx and requests without a response (timeout, connection error) mean the API is overloaded"""
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+class AdaptiveConcurrencyLimiter: # pylint: disable=too-many-instance-attributes
+    """
+    AIMD limit of the requests in flight, shared by the threads and the asyncio tasks of the sync.
+
+    The limit grows by 1 for every `limit` healthy responses (additive increase) and is
+    multiplied by `decrease_ratio` on a 429, a 5xx, a timeout (multiplicative decrease), or
+    by `latency_decrease_ratio` when the latency is more than `latency_tolerance` times the
+    average latency. Only the responses of requests started after the last decrease may
+    decrease the limit again, so a burst of 429s cuts the limit once.
+    """
+
+    def __init__(self, # pylint: disable=too-many-arguments
+                 max_limit=MAX_LIMIT,
+                 min_limit=1,
+                 initial_limit=None,
+                 decrease_ratio=0.5,
+                 latency_decrease_ratio=0.9,
+                 latency_tolerance=2.0,
+                 clock=time.monotonic):
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.limit = float(initial_limit or self.max_limit)
+        self.decrease_ratio = decrease_ratio
+        self.latency_decrease_ratio = latency_decrease_ratio
+        self.latency_tolerance = latency_tolerance
+        self.clock = clock
+        self.in_flight = 0
+        self.average_latency = None
+        self.last_decrease = None
+        self.__condition = threading.Condition()
+        self.__async_waiters = []
+
+    def get_limit(self):
+        """Returns the current number of requests allowed in flight"""
+        return max(self.min_limit, int(self.limit))
+
+    def __try_acquire(self):
+        if self.in_flight < self.get_limit():
+            self.in_flight = self.in_flight + 1
+            return self.clock()
+        return None
+
+    def acquire(self):
+        """Blocks until a request may be sent, returns its start time for release"""
+        with self.__condition:
+            started = self.__try_acquire()
+            while started is None:
+                self.__condition.wait()
+                started = self.__try_acquire()
+            return started
+
+    async def async_acquire(self):
+        """Suspends the calling task until a request may be sent, returns its start time for release"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.__condition:
+                started = self.__try_acquire()
+                if started is not None:
+                    return started
+                waiter = loop.create_future()
+                self.__async_waiters.append((loop, waiter))
+            await waiter
+
+    @staticmethod
+    def __wake(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def release(self, started, status_code):
+        """Releases the slot of a request and adapts the limit to its outcome"""
+        with self.__condition:
+            self.in_flight = self.in_flight - 1
+            previous_limit = self.get_limit()
+            latency = self.clock() - started
+
+            if is_overloaded(status_code):
+                self.__decrease(started, self.decrease_ratio)
+            elif self.average_latency and latency > self.latency_tolerance * self.average_latency:
+                self.__decrease(started, self.latency_decrease_ratio)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.get_limit())
+
+            if status_code is not None:
+                self.average_latency = latency if self.average_latency is None else \
+                    0.95 * self.average_latency + 0.05 * latency
+
+            if self.get_limit() != previous_limit:
+                self.__log_limit()
+
+            self.__condition.notify_all()
+            waiters, self.__async_waiters = self.__async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(self.__wake, waiter)
+
+    def __decrease(self, started, ratio):
+        if self.last_decrease is not None and started < self.last_decrease:
+            return
+        self.limit = max(self.min_limit, self.limit * ratio)
+        self.last_decrease = self.clock()
+
+    def __log_limit(self):
+        LOGGER.info('Concurrency limit: {}, requests in flight: {}'.format(self.get_limit(), self.in_flight))
+        metrics.log(LOGGER, metrics.Point('gauge', 'concurrency_limit', self.get_limit(), {}))
@@ -0,0 +1,90 @@
+import functools
+from collections import namedtuple
+from dateutil import tz
+from singer import metadata
+from tap_snapchat_ads.transform import RecordTransformer
+
+# What the sync needs from the catalog for one stream, built once per stream and catalog and
+#   shared (read only) by the pages, parents and threads syncing the stream:
+#   schema: the schema dict, stream_metadata: the metadata map,
+#   selected_fields: the properties selected (or automatic) in the metadata,
+#   bookmark_field: the replication key, stats_projection: the stats fields and conversion
+#   source types requested for the selected properties, transformer: the RecordTransformer
+StreamContext = namedtuple('StreamContext', [
+    'catalog', 'stream_name', 'schema', 'key_properties', 'stream_metadata', 'selected_fields',
+    'bookmark_field', 'stats_projection', 'transformer'])
+
+# stream_name: StreamContext of the catalog of the sync
+STREAM_CONTEXTS = {}
+
+
+@functools.lru_cache(maxsize=256)
+def get_timezone(timezone_desc=None):
+    """Returns the tzinfo of an ad account timezone, UTC by default"""
+    return tz.gettz(timezone_desc or 'UTC')
+
+
+def get_selected_fields(stream_metadata):
+    """Returns the properties selected in the metadata, same rule as singer's Transformer"""
+    selected_fields = set()
+    for breadcrumb, field_metadata in stream_metadata.items():
+        if len(breadcrumb) != 2:
+            continue
+        inclusion = field_metadata.get('inclusion')
+        if inclusion == 'automatic' or (inclusion != 'unsupported' and field_metadata.get('selected') is not False):
+            selected_fields.add(breadcrumb[-1])
+    return frozenset(selected_fields)
+
+
+def get_stats_projection(stream_metadata, selected_fields, params):
+    """
+    Returns the stats params restricted to the selected properties: the `fields` (a metric is
+    requested if the metric or its _web/_app variant is selected) and the `conversion_source_types`
+    of the selected variants. Empty (every field requested) without properties in the metadata.
+    """
+    if not params.get('fields') or not any(len(breadcrumb) == 2 for breadcrumb in stream_metadata):
+        return {}
+
+    all_fields = params['fields'].split(',')
+    fields = []
+    source_types = set()
+    for field in all_fields:
+        selected_types = [source_type for source_type, suffix in (('total', ''), ('web', '_web'), ('app', '_app'))
+                          if field + suffix in selected_fields]
+        if selected_types:
+            fields.append(field)
+            source_types.update(selected_types)
+
+    projection = {'fields': ','.join(fields or all_fields[:1])}
+    if params.get('conversion_source_types'):
+        # total is always requested, it is returned without the _web/_app suffix
+        projection['conversion_source_types'] = ','.join(
+            source_type for source_type in params['conversion_source_types'].split(',')
+            if source_type == 'total' or source_type in source_types)
+    return projection
+
+
+def build_stream_context(catalog, stream_name, stream_class):
+    stream = catalog.get_stream(stream_name)
+    schema = stream.schema.to_dict()
+    stream_metadata = metadata.to_map(getattr(stream, 'metadata', None) or [])
+    selected_fields = get_selected_fields(stream_metadata)
+    return StreamContext(
+        catalog=catalog,
+        stream_name=stream_name,
+        schema=schema,
+        key_properties=stream.key_properties,
+        stream_metadata=stream_metadata,
+        selected_fields=selected_fields,
+        bookmark_field=next(iter(stream_class.replication_keys), None),
+        stats_projection=get_stats_projection(stream_metadata, selected_fields, stream_class.params),
+        transformer=RecordTransformer(schema, stream_metadata))
+
+
+def get_stream_context(catalog, stream_name, stream_class):
+    """Returns the StreamContext of a stream of the catalog, built on the first call"""
+    context = STREAM_CONTEXTS.get(stream_name)
+    if context is None or context.catalog is not catalog:
+        context = build_stream_context(catalog, stream_name, stream_class)
+        STREAM_CONTEXTS[stream_name] = context
+    return context
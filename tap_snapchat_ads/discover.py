@@ -1,8 +1,8 @@
 from singer.catalog import Catalog, CatalogEntry, Schema
 from tap_snapchat_ads.schema import get_schemas
 
-def discover():
-    schemas, field_metadata = get_schemas()
+def discover(config=None):
+    schemas, field_metadata = get_schemas(config)
     catalog = Catalog([])
 
     for stream_name, schema_dict in schemas.items():
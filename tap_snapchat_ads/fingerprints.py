@@ -0,0 +1,171 @@
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+import singer
+from tap_snapchat_ads.checkpoint import CHECKPOINTS
+from tap_snapchat_ads.parallel import OUTPUT_LOCK
+
+LOGGER = singer.get_logger()
+
+FINGERPRINT_FILE = 'fingerprints.sqlite'
+# Property of the schema the deleted records are written with (a deletion signal), if the schema has it
+DELETED_AT_FIELD = '_sdc_deleted_at'
+# Key of the state with the generation of the fingerprints, also kept in the meta table
+GENERATION_KEY = 'fingerprint_generation'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS fingerprints (
+        stream_name TEXT NOT NULL,
+        scope TEXT NOT NULL,
+        key TEXT NOT NULL,
+        digest BLOB NOT NULL,
+        PRIMARY KEY (stream_name, scope, key))''',
+    '''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT)'''
+]
+
+
+def use_change_only(config):
+    return bool(config.get('fingerprint_cache_dir'))
+
+
+def open_fingerprint_store(config, state=None):
+    """
+    Returns the FingerprintStore in the `fingerprint_cache_dir` of the config, tied to the state,
+    a null context when the change-only mode is not enabled
+    """
+    if not use_change_only(config):
+        return contextlib.nullcontext()
+    cache_dir = config['fingerprint_cache_dir']
+    os.makedirs(cache_dir, exist_ok=True)
+    return FingerprintStore(os.path.join(cache_dir, FINGERPRINT_FILE), state)
+
+
+def get_digest(record):
+    """Returns the content fingerprint of a record"""
+    return hashlib.blake2b(json.dumps(record, sort_keys=True, default=str).encode(), digest_size=16).digest()
+
+
+class FingerprintListing:
+    """
+    The fingerprints of one full listing of a FULL_TABLE stream (a parent record and a country code).
+    The fingerprints seen replace the stored ones only when the listing is finished.
+    """
+
+    def __init__(self, store, stream_name, scope, key_properties, fingerprints):
+        self.store = store
+        self.stream_name = stream_name
+        self.scope = scope
+        self.key_properties = key_properties
+        self.fingerprints = fingerprints
+        self.seen = {}
+
+    def get_key(self, record):
+        return json.dumps([record.get(key_property) for key_property in self.key_properties], default=str)
+
+    def changed(self, records):
+        """Returns the records which are new or changed since the previous listing"""
+        changed_records = []
+        for record in records:
+            key = self.get_key(record)
+            digest = get_digest(record)
+            self.seen[key] = digest
+            if self.fingerprints.get(key) != digest:
+                changed_records.append(record)
+        return changed_records
+
+    def finish(self):
+        """Stores the fingerprints of the listing, returns the key values of the deleted records"""
+        deleted = [json.loads(key) for key in self.fingerprints if key not in self.seen]
+        self.store.replace(self.stream_name, self.scope, self.seen)
+        LOGGER.info('Stream: {}, {}: {} records listed, {} deleted since the previous sync'.format(
+            self.stream_name, self.scope, len(self.seen), len(deleted)))
+        return [dict(zip(self.key_properties, values)) for values in deleted]
+
+
+class FingerprintStore:
+    """
+    Persistent fingerprints (key -> hash of the record) of the FULL_TABLE streams, in a SQLite file,
+    so only the records which are new or changed since the previous sync are written.
+
+    The fingerprints are tied to the state: a completed sync sets a new generation id in the
+    fingerprints and in its state. They are dropped, and every record written, when the state has
+    another generation (a state reset, another target, a failed sync, a final STATE message not
+    kept by the target).
+    """
+
+    def __init__(self, path, state=None):
+        self.path = path
+        self.state = state
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self.__lock:
+            for statement in SCHEMA:
+                self.__connection.execute(statement)
+        if state is not None:
+            self.__check_generation()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        try:
+            if self.state is not None and exception_type is None:
+                self.__write_generation(uuid.uuid4().hex)
+        finally:
+            self.close()
+
+    def __get_generation(self):
+        row = self.__connection.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else None
+
+    def __set_generation(self, generation):
+        self.__connection.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (generation,))
+
+    def __check_generation(self):
+        with self.__lock:
+            generation = self.__get_generation()
+            if not generation or generation != self.state.get(GENERATION_KEY):
+                LOGGER.info('Fingerprints of generation {} do not match the state ({}), writing all the records'.format(
+                    generation, self.state.get(GENERATION_KEY)))
+                self.__connection.execute('DELETE FROM fingerprints')
+            # until the sync completes, the fingerprints are ahead of the state
+            self.__set_generation('')
+
+    def __write_generation(self, generation):
+        with self.__lock:
+            self.__set_generation(generation)
+        with OUTPUT_LOCK:
+            self.state[GENERATION_KEY] = generation
+            CHECKPOINTS.write_state(self.state)
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def start(self, stream_name, scope, key_properties):
+        """Returns a FingerprintListing with the fingerprints of the previous listing of the scope"""
+        with self.__lock:
+            rows = self.__connection.execute(
+                'SELECT key, digest FROM fingerprints WHERE stream_name = ? AND scope = ?',
+                (stream_name, scope)).fetchall()
+        return FingerprintListing(self, stream_name, scope, key_properties, dict(rows))
+
+    def replace(self, stream_name, scope, fingerprints):
+        with self.__lock:
+            self.__connection.execute('BEGIN')
+            try:
+                self.__connection.execute(
+                    'DELETE FROM fingerprints WHERE stream_name = ? AND scope = ?', (stream_name, scope))
+                self.__connection.executemany(
+                    'INSERT INTO fingerprints VALUES (?, ?, ?, ?)',
+                    ((stream_name, scope, key, digest) for key, digest in fingerprints.items()))
+                self.__connection.execute('COMMIT')
+            except Exception:
+                self.__connection.execute('ROLLBACK')
+                raise
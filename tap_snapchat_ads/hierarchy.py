@@ -0,0 +1,174 @@
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import singer
+from tap_snapchat_ads.scheduler import ChildParent, ParentPage
+
+LOGGER = singer.get_logger()
+
+# Default hours the cached child records of a parent are used before they are requested again
+HIERARCHY_TTL_HOURS = 24
+# Number of cached records handed to the child streams at a time
+CACHE_PAGE_SIZE = 500
+HIERARCHY_FILE = 'hierarchy.sqlite'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS entities (
+        stream_name TEXT NOT NULL,
+        parent_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        id TEXT,
+        timezone TEXT,
+        start_time TEXT,
+        end_time TEXT,
+        updated_at TEXT,
+        PRIMARY KEY (stream_name, parent_id, position))''',
+    '''CREATE TABLE IF NOT EXISTS refreshes (
+        stream_name TEXT NOT NULL,
+        parent_id TEXT NOT NULL,
+        refreshed_at REAL NOT NULL,
+        PRIMARY KEY (stream_name, parent_id))''',
+    '''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT)'''
+]
+
+
+def get_config_key(config):
+    """The index is cleared when the profiles selected in the config change"""
+    return hashlib.sha256(json.dumps(
+        [config.get('org_account_ids'), str(config.get('stats_breakdown', 'false')).lower()],
+        sort_keys=True, default=str).encode()).hexdigest()
+
+
+def open_hierarchy_index(config):
+    """
+    Returns the HierarchyIndex in the `hierarchy_cache_dir` of the config,
+    a null context when the index is not enabled
+    """
+    cache_dir = config.get('hierarchy_cache_dir')
+    if not cache_dir:
+        return contextlib.nullcontext()
+    refresh = config.get('hierarchy_refresh') or 'ttl'
+    if refresh not in ('full', 'ttl'):
+        raise ValueError('Unknown hierarchy_refresh: {}, expected full or ttl'.format(refresh))
+    ttl_hours = float(config.get('hierarchy_ttl_hours') or HIERARCHY_TTL_HOURS)
+    os.makedirs(cache_dir, exist_ok=True)
+    return HierarchyIndex(os.path.join(cache_dir, HIERARCHY_FILE), get_config_key(config),
+                          ttl_hours * 3600, full_refresh=refresh == 'full')
+
+
+class HierarchyIndex:
+    """
+    Persistent index of the parent records (organizations -> ad accounts -> campaigns ->
+    ad squads -> ads) the child streams are synced for, in a SQLite file.
+
+    The (id, timezone, lifetime, updated_at) of the records of each (stream, parent_id) are
+    recorded while the stream is requested. With `hierarchy_refresh` ttl, the next runs hand
+    the cached records to the child streams instead of requesting a stream which is not
+    selected, until they are older than the ttl. With `hierarchy_refresh` full (full_refresh),
+    every parent stream is requested on every run and the cached records are never used,
+    the index is only kept up to date. A partial listing (failed sync) is never used.
+    """
+
+    def __init__(self, path, config_key, ttl_seconds, clock=time.time, full_refresh=False): # pylint: disable=too-many-arguments
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.full_refresh = full_refresh
+        self.clock = clock
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self.__lock:
+            for statement in SCHEMA:
+                self.__connection.execute(statement)
+            row = self.__connection.execute("SELECT value FROM meta WHERE key = 'config_key'").fetchone()
+            if row is None or row[0] != config_key:
+                if row is not None:
+                    LOGGER.info('Hierarchy index {}: selected profiles changed, clearing the index'.format(path))
+                self.__connection.execute('DELETE FROM entities')
+                self.__connection.execute('DELETE FROM refreshes')
+                self.__connection.execute("INSERT OR REPLACE INTO meta VALUES ('config_key', ?)", (config_key,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def get_child_parents(self, stream_name, parent_id):
+        """
+        Returns the cached (ChildParent, updated_at) list of a stream, None if missing or expired,
+        always None with full_refresh
+        """
+        if self.full_refresh:
+            return None
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT refreshed_at FROM refreshes WHERE stream_name = ? AND parent_id = ?',
+                (stream_name, parent_id or '')).fetchone()
+            if row is None or row[0] + self.ttl_seconds < self.clock():
+                return None
+            rows = self.__connection.execute(
+                'SELECT id, timezone, start_time, end_time, updated_at FROM entities '
+                'WHERE stream_name = ? AND parent_id = ? ORDER BY position',
+                (stream_name, parent_id or '')).fetchall()
+        return [(ChildParent(entity_id, timezone_desc, (start_time, end_time) if start_time or end_time else None),
+                 updated_at) for entity_id, timezone_desc, start_time, end_time, updated_at in rows]
+
+    def iter_cached(self, stream_name, parent_id, cached):
+        """Yields the cached records as ParentPages, same as SnapchatAds.iter_endpoint, returns 0 records"""
+        LOGGER.info('Stream: {}, parent_id: {}, {} records from the hierarchy index'.format(
+            stream_name, parent_id, len(cached)))
+        for i in range(0, len(cached), CACHE_PAGE_SIZE):
+            page = cached[i:i + CACHE_PAGE_SIZE]
+            yield ParentPage(stream_name, [child_parent for child_parent, _ in page],
+                             [updated_at for _, updated_at in page])
+        return 0
+
+    def record(self, stream_name, parent_id, pages):
+        """Passes the ParentPages of a stream through, indexes them once the stream is synced"""
+        key = (stream_name, parent_id or '')
+        with self.__lock:
+            self.__connection.execute('DELETE FROM refreshes WHERE stream_name = ? AND parent_id = ?', key)
+            self.__connection.execute('DELETE FROM entities WHERE stream_name = ? AND parent_id = ?', key)
+
+        position = 0
+        total_records = None
+        while True:
+            try:
+                page = next(pages)
+            except StopIteration as done:
+                total_records = done.value
+                break
+            rows = []
+            for child_parent, updated_at in zip(page.child_parents, page.updated_at or [None] * len(page.child_parents)):
+                start_time, end_time = child_parent.lifetime or (None, None)
+                rows.append(key + (position, child_parent.parent_id, child_parent.timezone_desc,
+                                   start_time, end_time, updated_at))
+                position = position + 1
+            with self.__lock:
+                self.__connection.executemany('INSERT INTO entities VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            yield page
+
+        with self.__lock:
+            self.__connection.execute('INSERT INTO refreshes VALUES (?, ?, ?)', key + (self.clock(),))
+        return total_records
+
+    def open(self, item, selected_streams, open_endpoint):
+        """
+        Returns the generator of a work item: the cached records of a stream which is not
+        selected (only synced for its children), else the stream requested and indexed
+        """
+        if item.stream_name not in selected_streams:
+            cached = self.get_child_parents(item.stream_name, item.parent_id)
+            if cached is not None:
+                return self.iter_cached(item.stream_name, item.parent_id, cached)
+        return self.record(item.stream_name, item.parent_id, open_endpoint())
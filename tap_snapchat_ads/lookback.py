@@ -0,0 +1,72 @@
+import threading
+from datetime import timedelta
+import singer
+from singer import utils
+from singer.utils import strptime_to_utc, strftime
+
+LOGGER = singer.get_logger()
+
+# Default hours before the bookmark re-synced on the runs without the full attribution window lookback
+LOOKBACK_RECENT_HOURS = 24
+
+
+class LookbackPolicy:
+    """
+    How far back the stats are re-synced before their bookmark, decided once per stream and run.
+
+    Without `lookback_refresh_hours` the whole attribution window is re-synced on every run.
+    Otherwise it is re-synced at most once every `lookback_refresh_hours`, the other runs only
+    re-sync the last `lookback_recent_hours` before the bookmark (also when the bookmark lags
+    behind now, never further back than the attribution window from now). The start of the last
+    run with the full lookback is kept in the state (last_full_lookback) once the run completes.
+    """
+
+    def __init__(self, config, state, now_datetime=None):
+        refresh_hours = config.get('lookback_refresh_hours')
+        self.refresh_hours = float(refresh_hours) if refresh_hours not in (None, '') else None
+        self.recent_hours = float(config.get('lookback_recent_hours') or LOOKBACK_RECENT_HOURS)
+        self.state = state
+        self.started = now_datetime or utils.now()
+        self.__full_lookbacks = {}
+        self.__lock = threading.Lock()
+
+    def is_full_lookback(self, stream_name):
+        """Returns True if the whole attribution window of the stream is re-synced in this run"""
+        if self.refresh_hours is None:
+            return True
+        with self.__lock:
+            if stream_name not in self.__full_lookbacks:
+                last_full_lookback = (self.state or {}).get('last_full_lookback', {}).get(stream_name)
+                self.__full_lookbacks[stream_name] = not last_full_lookback or \
+                    self.started - strptime_to_utc(last_full_lookback) >= timedelta(hours=self.refresh_hours)
+                LOGGER.info('Stream: {}, re-syncing {} before the bookmarks'.format(
+                    stream_name, 'the attribution window' if self.__full_lookbacks[stream_name]
+                    else 'the last {} hours'.format(self.recent_hours)))
+            return self.__full_lookbacks[stream_name]
+
+    def get_lookback_days(self, stream_name, attribution_window, last_dttm=None, now_datetime=None):
+        """
+        Returns the days before now the date windows of a stats stream start from (at the latest
+        the bookmark last_dttm): the attribution window, or the days from now to
+        `lookback_recent_hours` before the bookmark
+        """
+        if self.is_full_lookback(stream_name):
+            return attribution_window
+        behind_days = 0
+        if last_dttm:
+            behind_days = max(0, ((now_datetime or self.started) - last_dttm).total_seconds() / 86400)
+        return min(attribution_window, behind_days + self.recent_hours / 24)
+
+    def finish(self):
+        """Records the streams which had the full lookback in this (completed) run"""
+        with self.__lock:
+            for stream_name, full_lookback in self.__full_lookbacks.items():
+                if full_lookback:
+                    self.state.setdefault('last_full_lookback', {})[stream_name] = strftime(self.started)
+
+
+def get_lookback_days(lookback_policy, stream_name, attribution_window, last_dttm=None, now_datetime=None):
+    """Returns the days before now the date windows start from, the attribution window without a policy"""
+    if lookback_policy is None:
+        return attribution_window
+    return lookback_policy.get_lookback_days(stream_name, attribution_window, last_dttm, now_datetime)
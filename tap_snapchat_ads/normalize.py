@@ -0,0 +1,73 @@
+import humps
+
+# Keys kept translated per stream, the other keys are decamelized on every record
+MAX_TRANSLATED_KEYS = 10000
+# Fields of a stats row which are not copied from its base record (the timeseries stat)
+BASE_RECORD_EXCLUDED_KEYS = ('start_time', 'end_time', 'timeseries', 'stats')
+
+
+class KeyNormalizer:
+    """
+    Decamelizes the keys of the records of a stream, same output as humps.decamelize,
+    with a table of the keys already translated: the records of a stream have the same
+    few keys, so the regular expressions of humps run once per key instead of once per
+    key of every record.
+    """
+
+    def __init__(self):
+        self.keys = {}
+
+    def get_key(self, key):
+        snake_key = self.keys.get(key)
+        if snake_key is None:
+            snake_key = humps.decamelize(key)
+            if len(self.keys) < MAX_TRANSLATED_KEYS:
+                self.keys[key] = snake_key
+        return snake_key
+
+    def normalize(self, value):
+        """Returns the value (a record, a list or a scalar) with its keys decamelized at every level"""
+        if isinstance(value, dict):
+            result = {}
+            self.update(result, value)
+            return result
+        if isinstance(value, list):
+            return [self.normalize(item) for item in value]
+        return value
+
+    def update(self, result, record, excluded_keys=()):
+        """Adds the decamelized fields of record to result, except excluded_keys"""
+        keys = self.keys
+        for key, value in record.items():
+            if key in excluded_keys:
+                continue
+            snake_key = keys.get(key)
+            if snake_key is None:
+                snake_key = self.get_key(key)
+            if isinstance(value, (dict, list)):
+                value = self.normalize(value)
+            result[snake_key] = value
+
+    def denest_stats(self, record, base_record):
+        """
+        Returns a stats row (a record of the timeseries of base_record) with the fields of its
+        base record and its stats at the top level, decamelized in one pass. The stats overwrite
+        the fields of the base record, which overwrite the fields of the row.
+        """
+        result = {}
+        self.update(result, record, ('stats',))
+        self.update(result, base_record, BASE_RECORD_EXCLUDED_KEYS)
+        self.update(result, record.get('stats', {}), ('stats',))
+        return result
+
+
+# stream_name: KeyNormalizer
+NORMALIZERS = {}
+
+
+def get_key_normalizer(stream_name):
+    """Returns the KeyNormalizer of a stream"""
+    normalizer = NORMALIZERS.get(stream_name)
+    if normalizer is None:
+        normalizer = NORMALIZERS.setdefault(stream_name, KeyNormalizer())
+    return normalizer
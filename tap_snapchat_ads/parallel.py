@@ -0,0 +1,127 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import singer
+
+LOGGER = singer.get_logger()
+
+# Singer messages (SCHEMA, RECORD, STATE) are written to stdout and the state
+#  dict is shared by every stream; both must only be touched by one thread at a time.
+OUTPUT_LOCK = threading.RLock()
+
+
+class SyncPool:
+    """
+    Bounded thread pool used to sync the children of several parents at the same time.
+
+    A task is handed to a worker thread only when one is free, otherwise it runs
+    inline in the calling thread. Nested fan-outs (ad accounts -> campaigns -> stats)
+    therefore never wait on a task that is queued behind them and cannot deadlock,
+    and the total number of busy threads never exceeds max_workers.
+
+    The pool also tracks the streams in flight so `currently_syncing` always points
+    at the earliest unfinished stream (in STREAMS order), which is where an interrupted
+    sync has to resume from.
+    """
+
+    def __init__(self, state, max_workers, stream_order, update_currently_syncing):
+        self.max_workers = max(1, int(max_workers or 1))
+        self.state = state
+        self.stream_order = {stream_name: idx for idx, stream_name in enumerate(stream_order)}
+        self.update_currently_syncing = update_currently_syncing
+        self.__permits = threading.Semaphore(self.max_workers - 1)
+        self.__executor = None
+        if self.max_workers > 1:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=self.max_workers - 1,
+                thread_name_prefix='tap-snapchat-ads')
+        self.__in_flight = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.shutdown()
+
+    @property
+    def parallel(self):
+        return self.__executor is not None
+
+    def shutdown(self):
+        if self.__executor:
+            self.__executor.shutdown(wait=True)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run func on a free worker thread, or inline if every worker is busy.
+        Always returns a Future.
+        """
+        if self.__executor and self.__permits.acquire(blocking=False): # pylint: disable=consider-using-with
+            try:
+                future = self.__executor.submit(func, *args, **kwargs)
+            except Exception:
+                self.__permits.release()
+                raise
+            future.add_done_callback(lambda _: self.__permits.release())
+            return future
+
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as err:
+            future.set_exception(err)
+        return future
+
+    def run_all(self, func, items):
+        """
+        Call func(item) for every item, in parallel where workers are free.
+        Waits for all of them and re-raises the first error (in item order).
+        """
+        futures = [self.submit(func, item) for item in items]
+        results = []
+        first_error = None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as err:
+                if first_error is None:
+                    first_error = err
+        if first_error is not None:
+            raise first_error
+        return results
+
+    def map_ordered(self, func, items, lookahead):
+        """
+        Yields func(item) for every item, in item order. Up to lookahead items
+        are computed ahead of the one being consumed, on free workers.
+        """
+        pending = deque()
+        for item in items:
+            pending.append(self.submit(func, item))
+            if len(pending) >= lookahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def start_stream(self, stream_name):
+        """Register a (child) stream as in flight and refresh currently_syncing."""
+        with OUTPUT_LOCK:
+            self.__in_flight[stream_name] = self.__in_flight.get(stream_name, 0) + 1
+            self.__refresh_currently_syncing()
+
+    def finish_stream(self, stream_name):
+        """Unregister a (child) stream; currently_syncing is left on the last stream
+        until a new one starts, same as the serial sync."""
+        with OUTPUT_LOCK:
+            count = self.__in_flight.get(stream_name, 0) - 1
+            if count > 0:
+                self.__in_flight[stream_name] = count
+            else:
+                self.__in_flight.pop(stream_name, None)
+            if self.__in_flight:
+                self.__refresh_currently_syncing()
+
+    def __refresh_currently_syncing(self):
+        earliest = min(self.__in_flight, key=lambda name: self.stream_order.get(name, len(self.stream_order)))
+        if earliest != singer.get_currently_syncing(self.state):
+            self.update_currently_syncing(self.state, earliest)
@@ -0,0 +1,104 @@
+import threading
+from datetime import timedelta
+import singer
+from singer import utils
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.checkpoint import CHECKPOINTS
+from tap_snapchat_ads.parallel import OUTPUT_LOCK
+from tap_snapchat_ads.state_layout import split_parent_key
+
+LOGGER = singer.get_logger()
+
+
+def use_bookmark_pruning(config):
+    return str(config.get('prune_bookmarks', 'false')).lower() == 'true'
+
+
+class BookmarkPruner:
+    """
+    Garbage collection of the per-parent bookmarks of the state. With `prune_bookmarks` the
+    bookmark keys read or written during the sync are tracked (every parent walked reads its
+    bookmark), and when the sync completes the bookmarks of the other parents of the streams
+    synced are removed: the campaigns, ad squads and ads deleted or archived, the ad accounts
+    removed from org_account_ids.
+
+    With `bookmark_retention_days` the bookmark of a parent not seen is only removed once it
+    is older than that many days, so a parent missing from one run (an ad account removed then
+    added back to org_account_ids) resumes from its bookmark.
+
+    The entity bookmarks of the stats synced with `stats_breakdown` are kept: the breakdown only
+    returns the entities with rows, an entity without stats in the windows synced is not seen.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.retention_days = None
+        self.__seen = {}
+        self.__kept_groups = {}
+        self.__lock = threading.Lock()
+
+    def configure(self, config):
+        retention_days = config.get('bookmark_retention_days')
+        with self.__lock:
+            self.enabled = use_bookmark_pruning(config)
+            self.retention_days = float(retention_days) if retention_days not in (None, '') else None
+            self.__seen = {}
+            self.__kept_groups = {}
+
+    def keep_group(self, stream, group):
+        """Keeps the bookmarks of a group, {bookmark_field}(parent_{parent}_id), of a stream"""
+        if self.enabled:
+            with self.__lock:
+                self.__kept_groups.setdefault(stream, set()).add(group)
+
+    def mark_seen(self, stream, key):
+        """Records a bookmark key read or written during the sync"""
+        if self.enabled:
+            with self.__lock:
+                self.__seen.setdefault(stream, set()).add(key)
+
+    def is_pruned(self, stream, key, value, now_datetime):
+        if key in self.__seen.get(stream, ()):
+            return False
+        parent_key = split_parent_key(key)
+        if parent_key is None or parent_key[0] in self.__kept_groups.get(stream, ()):
+            return False
+        return self.is_expired(value, now_datetime)
+
+    def is_expired(self, value, now_datetime):
+        if self.retention_days is None:
+            return True
+        return now_datetime - strptime_to_utc(value) >= timedelta(days=self.retention_days)
+
+    def prune(self, state, streams, now_datetime=None):
+        """
+        Removes the bookmarks of the parents not seen during the sync of the streams,
+        returns the removed {stream: [key]}
+        """
+        if not self.enabled:
+            return {}
+        now_datetime = now_datetime or utils.now()
+        removed = {}
+        with OUTPUT_LOCK:
+            for stream in sorted(streams):
+                bookmarks = (state or {}).get('bookmarks', {}).get(stream)
+                if not bookmarks:
+                    continue
+                keys = [key for key, value in bookmarks.items() if self.is_pruned(stream, key, value, now_datetime)]
+                if not keys:
+                    continue
+                removed_by_group = {}
+                for key in keys:
+                    del bookmarks[key]
+                    group, parent_id = split_parent_key(key)
+                    removed_by_group.setdefault(group, []).append(parent_id)
+                for group, parent_ids in removed_by_group.items():
+                    LOGGER.info('Stream: {}, removed {} bookmarks {} of the parents not seen in this sync: {}'.format(
+                        stream, len(parent_ids), group, ', '.join(parent_ids)))
+                removed[stream] = keys
+                CHECKPOINTS.write_state(state, stream=stream, keys=keys)
+        LOGGER.info('Bookmarks removed: {}'.format(sum(len(keys) for keys in removed.values())))
+        return removed
+
+
+BOOKMARK_PRUNER = BookmarkPruner()
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+import singer
+
+LOGGER = singer.get_logger()
+
+# Percent of the rate limit kept in reserve, never spent by the paced requests
+RESERVE_PERCENT = 5
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every request of the sync (threads and asyncio tasks).
+    Rate limits: https://developers.snapchat.com/api/docs/#rate-limits
+
+    The bucket is refilled from the X-Rate-Limit-Limit/Remaining/Reset headers of each
+    response. Between two responses each request takes a token, and the tokens left above
+    the reserve are spread evenly until the reset, so concurrent workers share one budget
+    instead of all bursting to the 5% reserve and then all sleeping until the reset.
+    """
+
+    def __init__(self, reserve_percent=RESERVE_PERCENT, clock=time.time):
+        self.reserve_percent = reserve_percent
+        self.clock = clock
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.next_slot = 0
+        self.__lock = threading.Lock()
+
+    def update(self, headers):
+        """Updates the bucket from the rate limit headers of a response"""
+        try:
+            limit = int(headers.get('X-Rate-Limit-Limit', 0))
+            remaining = int(headers.get('X-Rate-Limit-Remaining', 0))
+            reset = int(headers.get('X-Rate-Limit-Reset', 0))
+        except (TypeError, ValueError):
+            return
+        if limit <= 0:
+            return
+
+        with self.__lock:
+            if reset == self.reset and self.remaining is not None:
+                # the tokens taken by the requests still in flight are not in the headers yet
+                remaining = min(remaining, self.remaining)
+            self.limit, self.remaining, self.reset = limit, remaining, reset
+
+    def acquire(self):
+        """Takes a token, returns the number of seconds to wait before sending the request"""
+        with self.__lock:
+            now = self.clock()
+            if self.limit is None or self.reset is None or self.reset <= now:
+                # no rate limit known, or the limit has been reset since the last response
+                return 0
+
+            tokens = self.remaining - self.limit * self.reserve_percent / 100.0
+            if tokens < 1:
+                wait_time = self.reset - now
+                if self.next_slot < self.reset:
+                    LOGGER.warning('Rate Limit Warning: {}; remaining calls: {}; waiting for {} seconds.'.format(
+                        self.limit, self.remaining, int(wait_time)))
+                    self.next_slot = self.reset
+                return max(0, wait_time)
+
+            # spread the tokens above the reserve until the reset
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + (self.reset - now) / tokens
+            self.remaining = self.remaining - 1
+            return slot - now
+
+    def wait(self):
+        """Blocks the calling thread until the request may be sent"""
+        wait_time = self.acquire()
+        if wait_time:
+            time.sleep(wait_time)
+
+    async def async_wait(self):
+        """Suspends the calling task until the request may be sent"""
+        wait_time = self.acquire()
+        if wait_time:
+            await asyncio.sleep(wait_time)
@@ -0,0 +1,218 @@
+import json
+import tempfile
+import time
+from collections import namedtuple
+import singer
+from singer import utils
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.context import get_timezone
+from tap_snapchat_ads.lookback import get_lookback_days
+from tap_snapchat_ads.windows import get_date_window_size
+
+LOGGER = singer.get_logger()
+
+# Default maximum number of report jobs submitted and not downloaded yet
+MAX_REPORT_JOBS = 50
+# Seconds between two polls of the report jobs, doubled up to MAX_POLL_INTERVAL
+POLL_INTERVAL = 5
+MAX_POLL_INTERVAL = 60
+# Seconds to wait for the report jobs to complete
+REPORT_JOB_TIMEOUT = 3600
+
+# Report job statuses (async_status)
+COMPLETED = 'COMPLETED'
+FAILED = 'FAILED'
+
+# A report job for a parent record and a date window
+ReportJob = namedtuple('ReportJob', ['parent', 'report_run_id', 'ad_account_id'])
+
+
+def use_report_jobs(config, stream_class):
+    """
+    Stats streams are synced with asynchronous report jobs when `stats_report_jobs` is enabled in the config
+    """
+    return str(config.get('stats_report_jobs', 'false')).lower() == 'true' and \
+        bool(stream_class.bookmark_query_field_from and stream_class.bookmark_query_field_to)
+
+
+class StatsReportJobs: # pylint: disable=too-many-instance-attributes
+    """
+    Syncs a stats stream for many parents with asynchronous stats report jobs.
+    Reference: https://developers.snapchat.com/api/docs/#asynchronous-stats-reports
+
+    The date windows of the parents are submitted as report jobs (the stats request with
+    async=true), up to `max_report_jobs` at a time. The jobs are polled with an increasing
+    interval, then the report files are downloaded to a temporary file and parsed. The
+    records and bookmarks of each parent are written in date window order, same as
+    SnapchatAds.iter_endpoint.
+
+    A report job is the stats of one parent and one date window (at most date_window_size days
+    of hourly rows), the same rows the synchronous sync holds for a window: a report file is
+    parsed whole, one file at a time, the jobs waiting to be parsed stay on the API side.
+    """
+
+    def __init__(self, stream_obj, client, config, catalog, state, sync_streams, selected_streams, # pylint: disable=too-many-arguments
+                 lookback_policy=None, stats_dedupe=None):
+        self.stream_obj = stream_obj
+        self.client = client
+        self.config = config
+        self.catalog = catalog
+        self.state = state
+        self.sync_streams = sync_streams
+        self.selected_streams = selected_streams
+        self.lookback_policy = lookback_policy
+        self.stats_dedupe = stats_dedupe
+        self.max_report_jobs = int(config.get('max_report_jobs') or MAX_REPORT_JOBS)
+        self.poll_interval = float(config.get('report_poll_interval') or POLL_INTERVAL)
+        self.report_job_timeout = float(config.get('report_job_timeout') or REPORT_JOB_TIMEOUT)
+
+    def sync(self, stream_name, stream_class, child_parents):
+        """
+        Syncs stream_name for each (parent_id, timezone_desc, lifetime) of child_parents,
+        returns the total number of records
+        """
+        parents = [self.__get_parent(stream_name, stream_class, *child_parent) for child_parent in child_parents]
+        windows = [(parent, window_params) for parent in parents for window_params in parent['windows']]
+
+        for i in range(0, len(windows), self.max_report_jobs):
+            self.__sync_windows(stream_name, stream_class, windows[i:i + self.max_report_jobs])
+
+        for parent in parents:
+            # The stats of an entity which ended are final, do not request them again
+            final_bookmark = self.stream_obj.get_final_bookmark(
+                parent['max_bookmark_value'], parent['lifetime_bounds'], parent['now_datetime'])
+            bookmark_field = next(iter(stream_class.replication_keys), None)
+            if final_bookmark and bookmark_field and stream_name in self.selected_streams:
+                self.stream_obj.write_bookmark(self.state, stream_name, final_bookmark, bookmark_field,
+                                               stream_class.parent, parent['parent_id'])
+            LOGGER.info('FINISHED Sync for Stream: {}, parent_id: {}, total_records: {}'.format(
+                stream_name, parent['parent_id'], parent['total_records']))
+        return sum(parent['total_records'] for parent in parents)
+
+    def __get_parent(self, stream_name, stream_class, parent_id, timezone_desc, lifetime=None): # pylint: disable=too-many-arguments
+        """Returns the bookmark and the query params of the date windows of a parent"""
+        bookmark_field = next(iter(stream_class.replication_keys), None)
+        params = self.stream_obj.get_stream_params(stream_name, stream_class, self.config, self.catalog)
+        params['async'] = 'true'
+        params['async_format'] = 'json'
+        _, _, attribution_window = self.stream_obj.get_attribution_windows(self.config)
+        timezone = get_timezone(timezone_desc)
+        report_granularity = params.get('granularity', 'HOUR')
+
+        last_datetime = self.stream_obj.get_bookmark(
+            self.state, stream_name, self.config.get('start_date'), bookmark_field, stream_class.parent, parent_id)
+        now_datetime = utils.now()
+        lifetime_bounds = self.stream_obj.get_lifetime_bounds(self.config, lifetime, attribution_window)
+        windows = []
+        for start_window, end_window in self.stream_obj.get_date_windows(
+                stream_class, strptime_to_utc(last_datetime), now_datetime,
+                get_lookback_days(self.lookback_policy, stream_name, attribution_window,
+                                  strptime_to_utc(last_datetime), now_datetime), lifetime_bounds,
+                # the windows are submitted together as report jobs: not adaptive, the configured size
+                get_date_window_size(self.config, self.state, stream_name, stream_class, adaptive=False)[0]):
+            window_params = dict(params)
+            window_params[stream_class.bookmark_query_field_from], window_params[stream_class.bookmark_query_field_to] = \
+                self.stream_obj.get_window_query_dates(start_window, end_window, timezone, report_granularity)
+            windows.append(window_params)
+
+        return {
+            'parent_id': parent_id,
+            'last_datetime': last_datetime,
+            'max_bookmark_value': last_datetime,
+            'windows': windows,
+            'lifetime_bounds': lifetime_bounds,
+            'now_datetime': now_datetime,
+            'total_records': 0
+        }
+
+    @staticmethod
+    def __get_report(data):
+        request_status = data.get('request_status')
+        if request_status != 'SUCCESS':
+            raise RuntimeError(data)
+        return data.get('async_stats_reports', [{}])[0].get('async_stats_report', {})
+
+    def __submit(self, stream_name, stream_class, parent, window_params):
+        """Submits the report job of a date window"""
+        url = self.stream_obj.get_endpoint_url(
+            self.client.base_url, stream_name, stream_class, window_params, self.config, parent_id=parent['parent_id'])
+        report = self.__get_report(self.client.get(url=url, endpoint=stream_name))
+        # the ad account stats jobs are polled with their parent_id
+        ad_account_id = report.get('ad_account_id') or parent['parent_id']
+        LOGGER.info('Stream: {}, parent_id: {}, submitted report job: {}'.format(
+            stream_name, parent['parent_id'], report.get('report_run_id')))
+        return ReportJob(parent, report.get('report_run_id'), ad_account_id)
+
+    def __poll(self, stream_name, jobs):
+        """Polls the report jobs until they all complete, returns {report_run_id: result url}"""
+        results = {}
+        pending = list(jobs)
+        poll_interval = self.poll_interval
+        deadline = time.monotonic() + self.report_job_timeout
+        while True:
+            still_pending = []
+            for job in pending:
+                url = '{}/adaccounts/{}/stats_report?report_run_id={}'.format(
+                    self.client.base_url, job.ad_account_id, job.report_run_id)
+                report = self.__get_report(self.client.get(url=url, endpoint=stream_name))
+                async_status = report.get('async_status')
+                if async_status == COMPLETED:
+                    results[job.report_run_id] = report.get('result')
+                elif async_status == FAILED:
+                    raise RuntimeError('Report job {} failed: {}'.format(job.report_run_id, report))
+                else:
+                    still_pending.append(job)
+
+            pending = still_pending
+            if not pending:
+                return results
+            if time.monotonic() > deadline:
+                raise RuntimeError('Report jobs not completed after {} seconds: {}'.format(
+                    self.report_job_timeout, [job.report_run_id for job in pending]))
+            LOGGER.info('Stream: {}, {} report jobs pending, next poll in {} seconds'.format(
+                stream_name, len(pending), poll_interval))
+            time.sleep(poll_interval)
+            poll_interval = min(MAX_POLL_INTERVAL, poll_interval * 2)
+
+    def __download(self, stream_name, result_url):
+        """
+        Streams the report file to a temporary file and parses it, the file of one parent and
+        date window is parsed whole like the response of a synchronous stats request
+        """
+        with tempfile.TemporaryFile() as report_file:
+            self.client.download(result_url, report_file, endpoint=stream_name)
+            report_file.seek(0)
+            return json.load(report_file)
+
+    def __sync_windows(self, stream_name, stream_class, windows):
+        jobs = [self.__submit(stream_name, stream_class, parent, window_params) for parent, window_params in windows]
+        results = self.__poll(stream_name, jobs)
+
+        bookmark_field = next(iter(stream_class.replication_keys), None)
+        # Write records and bookmarks of each parent in date window order
+        for job in jobs:
+            parent = job.parent
+            data = self.__download(stream_name, results[job.report_run_id])
+            time_extracted = utils.now()
+            transformed_data = self.stream_obj.transform_data(
+                data, stream_name, stream_class, parent_id=parent['parent_id'])
+            if transformed_data and self.stats_dedupe is not None and \
+                    stream_name in self.selected_streams and stream_name in self.sync_streams:
+                transformed_data = self.stats_dedupe.filter_changed(stream_name, transformed_data)
+
+            if transformed_data and stream_name in self.selected_streams and stream_name in self.sync_streams:
+                parent['max_bookmark_value'], record_count = self.stream_obj.process_records(
+                    catalog=self.catalog,
+                    stream_name=stream_name,
+                    records=transformed_data,
+                    time_extracted=time_extracted,
+                    bookmark_field=bookmark_field,
+                    max_bookmark_value=parent['max_bookmark_value'],
+                    last_datetime=parent['last_datetime'])
+                parent['total_records'] = parent['total_records'] + record_count
+                if self.stats_dedupe is not None:
+                    self.stats_dedupe.record_written(stream_name, transformed_data, bookmark_field, parent['last_datetime'])
+
+            if bookmark_field and stream_name in self.selected_streams:
+                self.stream_obj.write_bookmark(self.state, stream_name, parent['max_bookmark_value'],
+                                               bookmark_field, stream_class.parent, parent['parent_id'])
@@ -0,0 +1,382 @@
+import asyncio
+import concurrent.futures
+import threading
+from collections import namedtuple
+import singer
+from tap_snapchat_ads.async_sync import AsyncStatsSync
+from tap_snapchat_ads.reports import StatsReportJobs, use_report_jobs
+
+LOGGER = singer.get_logger()
+
+# A stream to sync for one parent record (parent_id is None for root streams)
+WorkItem = namedtuple('WorkItem', ['stream_name', 'parent_id', 'timezone_desc', 'parent_stream', 'lifetime'],
+                      defaults=(None,))
+
+# A parent record of child streams, lifetime is its (start, end) for the stats date windows
+ChildParent = namedtuple('ChildParent', ['parent_id', 'timezone_desc', 'lifetime'], defaults=(None,))
+
+# A page of parent records: a ChildParent (and the updated_at) of each record whose children must be synced
+ParentPage = namedtuple('ParentPage', ['stream_name', 'child_parents', 'updated_at'], defaults=(None,))
+
+# The child work items of one child stream for a page of parent records
+ChildBatch = namedtuple('ChildBatch', ['stream_name', 'parent_stream', 'child_parents'])
+
+# The stats streams with a breakdown are synced for each ad account in bulk mode
+BREAKDOWN_PARENT_STREAM = 'ad_accounts'
+
+
+def use_stats_breakdown(config, stream_class):
+    """
+    The campaign, ad squad and ad stats are requested for the whole ad account with a breakdown
+    (adaccounts/{id}/stats?breakdown=...) when `stats_breakdown` is enabled in the config
+    """
+    return str(config.get('stats_breakdown', 'false')).lower() == 'true' and bool(stream_class.breakdown)
+
+
+def get_work_item(batch, child_parent):
+    """Returns the work item of a child stream for a parent record of the batch"""
+    child_parent = ChildParent(*child_parent)
+    return WorkItem(batch.stream_name, child_parent.parent_id, child_parent.timezone_desc,
+                    batch.parent_stream, child_parent.lifetime)
+
+
+def build_stream_dag(streams, stats_breakdown=False):
+    """
+    Returns {stream_name: [child stream names]} for the parent/child relationships of streams.
+    With stats_breakdown, the stats streams with a breakdown are children of the ad accounts.
+    """
+    dag = {stream_name: [] for stream_name in streams}
+    breakdown_streams = []
+    for stream_name, stream_class in streams.items():
+        for child_stream_name in stream_class.children:
+            if streams[child_stream_name].parent_stream != stream_name:
+                raise ValueError('Stream {} is a child of {} but its parent_stream is {}'.format(
+                    child_stream_name, stream_name, streams[child_stream_name].parent_stream))
+            if stats_breakdown and getattr(streams[child_stream_name], 'breakdown', None):
+                breakdown_streams.append(child_stream_name)
+            else:
+                dag[stream_name].append(child_stream_name)
+    if breakdown_streams:
+        dag[BREAKDOWN_PARENT_STREAM].extend(breakdown_streams)
+    return dag
+
+
+class SerialExecutor:
+    """
+    Runs every child work item in the scheduler thread, depth first: the executor without
+    parallelism, and the fallback of the other executors
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        return False
+
+    def run_batch(self, scheduler, batch): # pylint: disable=unused-argument
+        """
+        Runs nothing and returns False: the scheduler then yields the child work items of the
+        batch and runs them itself. The other executors return True when they ran the batch.
+        """
+        return False
+
+
+class ThreadExecutor:
+    """Runs the child work items of a batch on the SyncPool workers"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        return False
+
+    def run_batch(self, scheduler, batch):
+        if not (self.pool and self.pool.parallel):
+            return False
+        # a failed child stream stays in flight, the sync resumes from it
+        self.pool.start_stream(batch.stream_name)
+        self.pool.run_all(
+            lambda child_parent: scheduler.run(get_work_item(batch, child_parent)),
+            batch.child_parents)
+        self.pool.finish_stream(batch.stream_name)
+        return True
+
+
+class AsyncioExecutor:
+    """
+    Runs the stats batches from one asyncio event loop (AsyncStatsSync),
+    the other batches with the fallback executor.
+
+    The event loop runs in a thread of its own, started with the first stats batch, and
+    its AsyncSnapchatClient (one aiohttp session, one access token) is shared by all the
+    batches of the sync, run from the scheduler thread or the SyncPool workers. The client
+    is held open by a task of the loop (`async with client`) until the executor exits.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.__lock = threading.Lock()
+        self.__loop = None
+        self.__thread = None
+        self.__client = None
+        self.__client_task = None
+        self.__closing = None
+
+    def __enter__(self):
+        self.fallback.__enter__()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        try:
+            self.close()
+        finally:
+            self.fallback.__exit__(exception_type, exception_value, traceback)
+
+    @staticmethod
+    async def __hold_client(client, opened):
+        """Opens the client, sets the closing event in opened and holds the client open until it is set"""
+        try:
+            async with client:
+                closing = asyncio.Event()
+                opened.set_result(closing)
+                await closing.wait()
+        except BaseException as err:
+            if not opened.done():
+                opened.set_exception(err)
+            raise
+
+    def __get_client(self, engine):
+        """Returns the client of the sync, opened in the event loop thread on the first call"""
+        with self.__lock:
+            if self.__client is None:
+                if self.__loop is None:
+                    self.__loop = asyncio.new_event_loop()
+                    self.__thread = threading.Thread(target=self.__loop.run_forever, name='asyncio-stats', daemon=True)
+                    self.__thread.start()
+                client = engine.open_client()
+                opened = concurrent.futures.Future()
+                client_task = asyncio.run_coroutine_threadsafe(self.__hold_client(client, opened), self.__loop)
+                # raises the error of a client which could not be opened
+                self.__closing = opened.result()
+                self.__client_task = client_task
+                self.__client = client
+            return self.__client
+
+    def close(self):
+        with self.__lock:
+            if self.__loop is None:
+                return
+            try:
+                if self.__client_task is not None:
+                    if self.__closing is not None:
+                        self.__loop.call_soon_threadsafe(self.__closing.set)
+                    self.__client_task.result()
+            finally:
+                self.__loop.call_soon_threadsafe(self.__loop.stop)
+                self.__thread.join()
+                self.__loop.close()
+                self.__loop = self.__thread = self.__client = self.__client_task = self.__closing = None
+
+    def run_batch(self, scheduler, batch):
+        stream_class = scheduler.streams[batch.stream_name]
+        if not (stream_class.bookmark_query_field_from and stream_class.bookmark_query_field_to) or \
+                use_stats_breakdown(scheduler.config, stream_class):
+            return self.fallback.run_batch(scheduler, batch)
+
+        # request the date windows of all parent records concurrently from the event loop,
+        #   within the rate limit budget and concurrency limit of the sync client
+        pool = scheduler.pool if scheduler.pool and scheduler.pool.parallel else None
+        if pool:
+            # a failed child stream stays in flight, the sync resumes from it
+            pool.start_stream(batch.stream_name)
+        else:
+            scheduler.update_currently_syncing(scheduler.state, batch.stream_name)
+        engine = AsyncStatsSync(scheduler.stream_obj, scheduler.config, scheduler.catalog, scheduler.state,
+                                scheduler.sync_streams, scheduler.selected_streams,
+                                getattr(scheduler.client, 'rate_limiter', None),
+                                getattr(scheduler.client, 'concurrency_limiter', None),
+                                scheduler.lookback_policy, scheduler.stats_dedupe)
+        client = self.__get_client(engine)
+        asyncio.run_coroutine_threadsafe(
+            engine.sync_parents(client, batch.stream_name, stream_class, batch.child_parents), self.__loop).result()
+        if pool:
+            pool.finish_stream(batch.stream_name)
+        return True
+
+
+class ReportJobExecutor:
+    """
+    Runs the stats batches with asynchronous report jobs (StatsReportJobs),
+    the other batches with the fallback executor
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def __enter__(self):
+        self.fallback.__enter__()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        return self.fallback.__exit__(exception_type, exception_value, traceback)
+
+    def run_batch(self, scheduler, batch):
+        stream_class = scheduler.streams[batch.stream_name]
+        if not use_report_jobs(scheduler.config, stream_class) or use_stats_breakdown(scheduler.config, stream_class):
+            return self.fallback.run_batch(scheduler, batch)
+
+        scheduler.update_currently_syncing(scheduler.state, batch.stream_name)
+        StatsReportJobs(scheduler.stream_obj, scheduler.client, scheduler.config, scheduler.catalog,
+                        scheduler.state, scheduler.sync_streams, scheduler.selected_streams,
+                        scheduler.lookback_policy, scheduler.stats_dedupe).sync(
+                            batch.stream_name, stream_class, batch.child_parents)
+        return True
+
+
+def get_executor(config, pool):
+    """
+    Returns the executor selected with the `sync_executor` config (serial, threads or asyncio).
+    Defaults to asyncio when `async_stats` is enabled, threads when the SyncPool has workers.
+    The stats are synced with report jobs when `stats_report_jobs` is enabled.
+    """
+    threads = ThreadExecutor(pool)
+    executor_name = config.get('sync_executor')
+    if not executor_name:
+        if str(config.get('async_stats', 'false')).lower() == 'true':
+            executor_name = 'asyncio'
+        elif pool and pool.parallel:
+            executor_name = 'threads'
+        else:
+            executor_name = 'serial'
+
+    if executor_name == 'serial':
+        executor = SerialExecutor()
+    elif executor_name == 'threads':
+        executor = threads
+    elif executor_name == 'asyncio':
+        executor = AsyncioExecutor(threads)
+    else:
+        raise ValueError('Unknown sync_executor: {}, expected serial, threads or asyncio'.format(executor_name))
+
+    if str(config.get('stats_report_jobs', 'false')).lower() == 'true':
+        return ReportJobExecutor(executor)
+    return executor
+
+
+class SyncScheduler: # pylint: disable=too-many-instance-attributes
+    """
+    Syncs a stream and all its descendants (children, grandchildren, ...) from an explicit
+    work stack instead of recursion.
+
+    Each work item is a generator (SnapchatAds.iter_endpoint) yielding a ParentPage after
+    every page of parent records. The scheduler turns the page into a ChildBatch per child
+    stream, hands it to the executor, or runs it depth first in the current thread (same
+    output order as the recursive sync). Only (parent_id, timezone_desc) pairs are kept
+    for the pages waiting on their children, not the parent records.
+    """
+
+    def __init__(self, stream_obj, streams, client, config, catalog, state, sync_streams, # pylint: disable=too-many-arguments
+                 selected_streams, pool, update_currently_syncing, hierarchy_index=None, fingerprint_store=None,
+                 lookback_policy=None, stats_dedupe=None):
+        self.stream_obj = stream_obj
+        self.streams = streams
+        self.dag = build_stream_dag(streams, str(config.get('stats_breakdown', 'false')).lower() == 'true')
+        self.client = client
+        self.config = config
+        self.catalog = catalog
+        self.state = state
+        self.sync_streams = sync_streams
+        self.selected_streams = selected_streams
+        self.pool = pool
+        self.update_currently_syncing = update_currently_syncing
+        self.executor = get_executor(config, pool)
+        self.hierarchy_index = hierarchy_index
+        self.fingerprint_store = fingerprint_store
+        self.lookback_policy = lookback_policy
+        self.stats_dedupe = stats_dedupe
+
+    def __enter__(self):
+        self.executor.__enter__()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        # the executor releases what it holds for the sync (the asyncio client)
+        return self.executor.__exit__(exception_type, exception_value, traceback)
+
+    def open(self, item):
+        """Returns the generator syncing a work item"""
+        if item.parent_stream:
+            LOGGER.info('START Sync for Stream: {}, parent_stream: {}, parent_id: {}'.format(
+                item.stream_name, item.parent_stream, item.parent_id))
+        # the parent records of the child streams may come from the hierarchy index
+        if self.hierarchy_index is not None and \
+                any(child_stream_name in self.sync_streams for child_stream_name in self.dag[item.stream_name]):
+            return self.hierarchy_index.open(item, self.selected_streams, lambda: self.open_endpoint(item))
+        return self.open_endpoint(item)
+
+    def open_endpoint(self, item):
+        """Returns the generator requesting a work item from the API"""
+        return self.stream_obj.iter_endpoint(
+            client=self.client,
+            config=self.config,
+            catalog=self.catalog,
+            state=self.state,
+            stream_name=item.stream_name,
+            stream_class=self.streams[item.stream_name],
+            sync_streams=self.sync_streams,
+            selected_streams=self.selected_streams,
+            timezone_desc=item.timezone_desc,
+            parent_id=item.parent_id,
+            lifetime=item.lifetime,
+            pool=self.pool,
+            child_streams=self.dag[item.stream_name],
+            fingerprint_store=self.fingerprint_store,
+            lookback_policy=self.lookback_policy,
+            stats_dedupe=self.stats_dedupe)
+
+    def iter_children(self, page):
+        """Yields the child work items of a page of parent records to run in the current thread"""
+        for child_stream_name in self.dag[page.stream_name]:
+            if child_stream_name not in self.sync_streams:
+                continue
+            LOGGER.info('START Syncing: {}'.format(child_stream_name))
+            self.stream_obj.write_schema(self.catalog, child_stream_name, self.sync_streams, self.selected_streams)
+            batch = ChildBatch(child_stream_name, page.stream_name, page.child_parents)
+            if self.executor.run_batch(self, batch):
+                continue
+            # For each parent record
+            for child_parent in batch.child_parents:
+                # set currently syncing as child stream
+                self.update_currently_syncing(self.state, child_stream_name)
+                yield get_work_item(batch, child_parent)
+
+    def run(self, item):
+        """
+        Syncs a work item and its descendants, returns the number of records of the work item
+        """
+        # stack of (work item, generator), the work item is None for the children of a page
+        stack = [(item, self.open(item))]
+        total_records = 0
+        while stack:
+            frame_item, frame = stack[-1]
+            try:
+                task = next(frame)
+            except StopIteration as done:
+                stack.pop()
+                if frame_item is not None:
+                    total_records = done.value or 0
+                    if frame_item.parent_stream:
+                        LOGGER.info('FINISHED Sync for Stream: {}, parent_id: {}, total_records: {}'.format(
+                            frame_item.stream_name, frame_item.parent_id, total_records))
+                continue
+
+            if isinstance(task, WorkItem):
+                stack.append((task, self.open(task)))
+            else:
+                stack.append((None, self.iter_children(task)))
+
+        # the last work item to finish is the one the stack started with
+        return total_records
@@ -2,6 +2,7 @@ import os
 import json
 import singer
 from singer import metadata
+from tap_snapchat_ads.fingerprints import DELETED_AT_FIELD, use_change_only
 from tap_snapchat_ads.streams import STREAMS
 
 LOGGER = singer.get_logger()
@@ -12,7 +13,7 @@ LOGGER = singer.get_logger()
 def get_abs_path(path):
     return os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
 
-def get_schemas():
+def get_schemas(config=None):
     schemas = {}
     field_metadata = {}
 
@@ -22,6 +23,9 @@ def get_schemas():
         schema_path = get_abs_path(schema_file_path)
         with open(schema_path) as file:
             schema = json.load(file)
+        # with the change-only mode, the records deleted from the FULL_TABLE streams are written with _sdc_deleted_at
+        if use_change_only(config or {}) and stream_class.replication_method == 'FULL_TABLE':
+            schema['properties'][DELETED_AT_FIELD] = {'type': ['null', 'string'], 'format': 'date-time'}
         schemas[stream_name] = schema
         mdata = metadata.new()
 
@@ -40,6 +44,8 @@ def get_schemas():
         # update inclusion of "replication keys" as "automatic"
         for replication_key in (stream_class.replication_keys or []):
             mdata_map[('properties', replication_key)]['inclusion'] = 'automatic'
+        if DELETED_AT_FIELD in schema['properties']:
+            mdata_map[('properties', DELETED_AT_FIELD)]['inclusion'] = 'automatic'
 
         field_metadata[stream_name] = metadata.to_list(mdata_map)
 
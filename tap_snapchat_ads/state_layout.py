@@ -0,0 +1,212 @@
+from collections import Counter
+
+# Version of the compact layout of the per-parent bookmarks in the state
+STATE_LAYOUT_VERSION = 1
+# Key of the compact per-parent bookmarks in the bookmarks of a stream
+PARENT_BOOKMARKS_KEY = 'parent_bookmarks'
+
+# The bookmarks of the parents of a stream are kept in memory with the legacy keys
+#   {bookmark_field}(parent_{parent}_id:{parent_id}): value
+# With `compact_state` the STATE messages group them by bookmark field and parent:
+#   "parent_bookmarks": {
+#     "version": 1,
+#     "{bookmark_field}(parent_{parent}_id)": {
+#       "watermark": the most common value,
+#       "ids": the comma separated ids of the parents at the watermark,
+#       "exceptions": {parent_id: value} of the other parents
+#     }
+#   }
+
+
+def use_compact_state(config):
+    return str(config.get('compact_state', 'false')).lower() == 'true'
+
+
+def split_parent_key(key):
+    """Returns (group, parent_id) of a legacy per-parent key, None for the other keys"""
+    if not key.endswith(')') or '(parent_' not in key:
+        return None
+    group, separator, parent_id = key[:-1].rpartition(':')
+    if not separator or not group.endswith('_id'):
+        return None
+    return group + ')', parent_id
+
+
+class ParentBookmarks:
+    """
+    The {parent_id: value} bookmarks of a group kept as a watermark (the most common value),
+    the ids of the parents at it and the other parents (exceptions), updated in place as the
+    parents move. A parent moving to the value of many exceptions (the next window) is only an
+    exception until that value is more common than the watermark, which then moves to it.
+    """
+
+    def __init__(self, values):
+        self.__counts = Counter(values.values())
+        self.watermark = self.__counts.most_common(1)[0][0]
+        del self.__counts[self.watermark]
+        self.ids = dict.fromkeys(parent_id for parent_id, value in values.items() if value == self.watermark)
+        self.exceptions = {parent_id: value for parent_id, value in values.items() if value != self.watermark}
+        self.__encoded_ids = None
+
+    def __len__(self):
+        return len(self.ids) + len(self.exceptions)
+
+    def set(self, parent_id, value):
+        """Sets the bookmark of a parent, removes it if the value is None"""
+        if parent_id in self.ids:
+            del self.ids[parent_id]
+            self.__encoded_ids = None
+        elif parent_id in self.exceptions:
+            self.__discount(self.exceptions.pop(parent_id))
+
+        if value is None:
+            return
+        if value == self.watermark:
+            self.ids[parent_id] = None
+            self.__encoded_ids = None
+            return
+        self.exceptions[parent_id] = value
+        self.__counts[value] += 1
+        if self.__counts[value] > len(self.ids):
+            self.__move_watermark(value)
+
+    def __discount(self, value):
+        self.__counts[value] -= 1
+        if not self.__counts[value]:
+            del self.__counts[value]
+
+    def __move_watermark(self, watermark):
+        ids = dict.fromkeys(parent_id for parent_id, value in self.exceptions.items() if value == watermark)
+        for parent_id in ids:
+            del self.exceptions[parent_id]
+        del self.__counts[watermark]
+        if self.ids:
+            self.exceptions.update(dict.fromkeys(self.ids, self.watermark))
+            self.__counts[self.watermark] = len(self.ids)
+        self.watermark = watermark
+        self.ids = ids
+        self.__encoded_ids = None
+
+    def encode(self):
+        if self.__encoded_ids is None:
+            self.__encoded_ids = ','.join(self.ids)
+        return {'watermark': self.watermark, 'ids': self.__encoded_ids, 'exceptions': self.exceptions}
+
+
+class StreamBookmarks:
+    """The bookmarks of a stream: the per-parent bookmarks by group, the other keys as they are"""
+
+    def __init__(self, bookmarks):
+        self.other = {}
+        self.groups = {}
+        values_by_group = {}
+        for key, value in bookmarks.items():
+            parent_key = split_parent_key(key)
+            if parent_key is None:
+                self.other[key] = value
+            else:
+                values_by_group.setdefault(parent_key[0], {})[parent_key[1]] = value
+        for group, values in values_by_group.items():
+            self.groups[group] = ParentBookmarks(values)
+
+    def set(self, key, value):
+        parent_key = split_parent_key(key)
+        if parent_key is None:
+            if value is None:
+                self.other.pop(key, None)
+            else:
+                self.other[key] = value
+            return
+        group, parent_id = parent_key
+        if group not in self.groups:
+            if value is not None:
+                self.groups[group] = ParentBookmarks({parent_id: value})
+            return
+        self.groups[group].set(parent_id, value)
+        if not self.groups[group]:
+            del self.groups[group]
+
+    def encode(self):
+        encoded = dict(self.other)
+        if self.groups:
+            encoded[PARENT_BOOKMARKS_KEY] = {'version': STATE_LAYOUT_VERSION}
+            for group, parent_bookmarks in self.groups.items():
+                encoded[PARENT_BOOKMARKS_KEY][group] = parent_bookmarks.encode()
+        return encoded
+
+
+def decode_parent_bookmarks(parent_bookmarks):
+    """Returns the legacy {key: value} bookmarks of the compact per-parent bookmarks of a stream"""
+    version = parent_bookmarks.get('version')
+    if version != STATE_LAYOUT_VERSION:
+        raise ValueError('Unknown {} version: {}, expected {}'.format(
+            PARENT_BOOKMARKS_KEY, version, STATE_LAYOUT_VERSION))
+
+    bookmarks = {}
+    for group, encoded in parent_bookmarks.items():
+        if group == 'version':
+            continue
+        prefix = group[:-1] + ':'
+        if encoded.get('ids'):
+            bookmarks.update(dict.fromkeys(
+                [prefix + parent_id + ')' for parent_id in encoded['ids'].split(',')], encoded['watermark']))
+        for parent_id, value in encoded.get('exceptions', {}).items():
+            bookmarks[prefix + parent_id + ')'] = value
+    return bookmarks
+
+
+def expand_state(state):
+    """
+    Expands the compact per-parent bookmarks of the state, in place, to the legacy keys read
+    by the sync. A legacy key already in the state is kept: it was written after the compact
+    bookmarks, by a version of the tap without the compact layout.
+    """
+    all_bookmarks = (state or {}).get('bookmarks', {})
+    for stream, bookmarks in list(all_bookmarks.items()):
+        if not isinstance(bookmarks, dict) or PARENT_BOOKMARKS_KEY not in bookmarks:
+            continue
+        decoded_bookmarks = decode_parent_bookmarks(bookmarks.pop(PARENT_BOOKMARKS_KEY))
+        decoded_bookmarks.update(bookmarks)
+        all_bookmarks[stream] = decoded_bookmarks
+    return state
+
+
+class CompactStateLayout:
+    """
+    Encoder of the STATE messages in the compact layout. Most parents of a stream share the
+    same bookmark (the end of the last window synced), so a stream is written as one watermark,
+    the ids of the parents at it, in one string, and the few parents behind or ahead of it.
+    The bookmarks of a stream are grouped once, then only the changed keys are updated: a STATE
+    message costs the join of the ids, not a pass over the parents.
+    """
+
+    def __init__(self):
+        self.__streams = {}
+        self.__changed = {}
+
+    def mark_changed(self, stream, keys=None):
+        """Marks keys of the bookmarks of a stream changed, all of them without keys"""
+        if keys is None:
+            self.__streams.pop(stream, None)
+            self.__changed.pop(stream, None)
+        elif stream in self.__streams:
+            # a dict keeps the order of the changes, the ids are written in the same order on every run
+            self.__changed.setdefault(stream, {}).update(dict.fromkeys(keys))
+
+    def encode(self, state):
+        """Returns a copy of the state with the bookmarks of each stream in the compact layout"""
+        encoded_bookmarks = {}
+        for stream, bookmarks in state.get('bookmarks', {}).items():
+            if not isinstance(bookmarks, dict):
+                encoded_bookmarks[stream] = bookmarks
+                continue
+            stream_bookmarks = self.__streams.get(stream)
+            if stream_bookmarks is None:
+                stream_bookmarks = self.__streams[stream] = StreamBookmarks(bookmarks)
+            for key in self.__changed.pop(stream, ()):
+                stream_bookmarks.set(key, bookmarks.get(key))
+            encoded_bookmarks[stream] = stream_bookmarks.encode()
+        encoded_state = dict(state)
+        if 'bookmarks' in state:
+            encoded_state['bookmarks'] = encoded_bookmarks
+        return encoded_state
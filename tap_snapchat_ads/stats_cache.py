@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from urllib.parse import parse_qsl, urlencode, urlparse
+import singer
+
+LOGGER = singer.get_logger()
+
+# Default days a cached response is kept without being read or written
+STATS_CACHE_RETENTION_DAYS = 30
+
+
+def open_stats_cache(config):
+    """Returns the StatsWindowCache in the `stats_cache_dir` of the config, None when it is not enabled"""
+    cache_dir = config.get('stats_cache_dir')
+    if not cache_dir:
+        return None
+    return StatsWindowCache(cache_dir)
+
+
+def evict_stats_cache(config):
+    """
+    Removes the responses of the `stats_cache_dir` of the config not read or written for
+    `stats_cache_retention_days`, returns the number of files removed
+    """
+    cache_dir = config.get('stats_cache_dir')
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+    retention_days = float(config.get('stats_cache_retention_days') or STATS_CACHE_RETENTION_DAYS)
+    return StatsWindowCache(cache_dir).evict(retention_days * 86400)
+
+
+def is_final_window(end_window, now_datetime, attribution_window):
+    """The stats of a date window ending before the attribution window no longer change"""
+    return end_window <= now_datetime - timedelta(days=attribution_window)
+
+
+class StatsWindowCache:
+    """
+    Local cache of the stats responses of the date windows which are final (older than the
+    attribution window), one gzipped JSON file per request. The file name is the hash of the
+    request url with its sorted query params (entity, granularity, fields, attribution windows
+    and date window), so a backfill or a state reset reads the final windows from the disk.
+    A file read is touched, the files not used for the retention are evicted at the start of a sync.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def get_key(url):
+        parsed_url = urlparse(url)
+        query = urlencode(sorted(parse_qsl(parsed_url.query)))
+        return hashlib.sha256('{}?{}'.format(parsed_url.path, query).encode()).hexdigest()
+
+    def get_path(self, url):
+        key = self.get_key(url)
+        return os.path.join(self.cache_dir, key[:2], '{}.json.gz'.format(key))
+
+    def get(self, url):
+        """Returns the cached response of the request url, None if it is not cached"""
+        path = self.get_path(url)
+        try:
+            with gzip.open(path, 'rt') as cache_file:
+                data = json.load(cache_file)
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            LOGGER.warning('Stats cache file {} is not readable, requesting it again: {}'.format(path, err))
+            return None
+
+    def put(self, url, data):
+        """Stores the response of the request url, the file is replaced atomically"""
+        path = self.get_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with gzip.open(os.fdopen(file_descriptor, 'wb'), 'wt') as cache_file:
+                json.dump(data, cache_file)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def evict(self, max_age_seconds, clock=time.time):
+        """Removes the cached responses not read or written for max_age_seconds, returns the number removed"""
+        oldest = clock() - max_age_seconds
+        removed = 0
+        for directory, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith('.json.gz'):
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    if os.path.getmtime(path) < oldest:
+                        os.remove(path)
+                        removed = removed + 1
+                except FileNotFoundError:
+                    continue
+        if removed:
+            LOGGER.info('Stats cache {}: {} responses not used for {} days removed'.format(
+                self.cache_dir, removed, max_age_seconds / 86400))
+        return removed
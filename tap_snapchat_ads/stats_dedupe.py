@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+from datetime import date, timedelta
+import singer
+from tap_snapchat_ads.bookmarks import get_epoch
+from tap_snapchat_ads.checkpoint import CHECKPOINTS
+from tap_snapchat_ads.parallel import OUTPUT_LOCK
+
+LOGGER = singer.get_logger()
+
+# Fields of the stats records which change on every run without any metric change
+DIGEST_EXCLUDED_FIELDS = ('finalized_data_end_time',)
+# Days kept before the attribution window, the older rows are only requested again by a backfill
+RETENTION_MARGIN_DAYS = 2
+# Key of the state and name of the file of the directory with the generation of the fingerprints
+GENERATION_KEY = 'stats_dedupe_generation'
+
+
+class StatsDedupeContext:
+    """Context manager saving the StatsDedupe when the sync completes"""
+
+    def __init__(self, stats_dedupe):
+        self.stats_dedupe = stats_dedupe
+
+    def __enter__(self):
+        return self.stats_dedupe
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        # the fingerprints of a failed sync are not saved, its rows are written again
+        if self.stats_dedupe is not None and exception_type is None:
+            self.stats_dedupe.save()
+
+
+def open_stats_dedupe(config, state, attribution_window):
+    """Returns the StatsDedupe of the `stats_dedupe_dir` of the config, tied to the state, in a context saving it"""
+    directory = config.get('stats_dedupe_dir')
+    if not directory:
+        return StatsDedupeContext(None)
+    os.makedirs(directory, exist_ok=True)
+    return StatsDedupeContext(StatsDedupe(directory, attribution_window + RETENTION_MARGIN_DAYS, state=state))
+
+
+def get_hash(value):
+    """Returns a 64 bits hash of a string"""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little')
+
+
+def get_row_key(record):
+    """Returns the 64 bits hash of the (id, start_time) of a stats record"""
+    return get_hash('{}|{}'.format(record.get('id'), record.get('start_time')))
+
+
+def get_digest(record):
+    """Returns the 64 bits fingerprint of the values of a stats record"""
+    return get_hash(json.dumps({key: value for key, value in record.items() if key not in DIGEST_EXCLUDED_FIELDS},
+                               sort_keys=True, default=str))
+
+
+class StreamFingerprints:
+    """
+    Fingerprints of the stats rows of a stream: 3 sorted arrays (the hash of the (id, start_time)
+    of the row, the fingerprint of its values and the day of its start_time), 20 bytes per row,
+    and a dict of the rows written in this run.
+    """
+
+    def __init__(self, keys=None, digests=None, days=None):
+        self.keys = keys or array('Q')
+        self.digests = digests or array('Q')
+        self.days = days or array('I')
+        self.updates = {}
+
+    def get(self, key):
+        if key in self.updates:
+            return self.updates[key][0]
+        idx = bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return self.digests[idx]
+        return None
+
+    def put(self, key, digest, day):
+        self.updates[key] = (digest, day)
+
+    def merge(self, min_day):
+        """Returns the fingerprints with the rows of this run, without the rows before min_day"""
+        rows = dict(zip(self.keys, zip(self.digests, self.days)))
+        rows.update(self.updates)
+        fingerprints = StreamFingerprints()
+        for key in sorted(rows):
+            digest, day = rows[key]
+            if day < min_day:
+                continue
+            fingerprints.keys.append(key)
+            fingerprints.digests.append(digest)
+            fingerprints.days.append(day)
+        return fingerprints
+
+    @classmethod
+    def read(cls, path):
+        fingerprints = cls()
+        with open(path, 'rb') as fingerprint_file:
+            count = array('Q')
+            count.fromfile(fingerprint_file, 1)
+            fingerprints.keys.fromfile(fingerprint_file, count[0])
+            fingerprints.digests.fromfile(fingerprint_file, count[0])
+            fingerprints.days.fromfile(fingerprint_file, count[0])
+        return fingerprints
+
+    def write(self, path):
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as fingerprint_file:
+                array('Q', [len(self.keys)]).tofile(fingerprint_file)
+                self.keys.tofile(fingerprint_file)
+                self.digests.tofile(fingerprint_file)
+                self.days.tofile(fingerprint_file)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+class StatsDedupe:
+    """
+    Persistent fingerprints of the stats rows written by the previous runs, one file per stream,
+    so the rows of the attribution window re-synced on every run are only written again when
+    one of their values changed. The rows older than the retention are dropped when saved.
+
+    The fingerprints are tied to the state: a new generation id is saved with them and set in the
+    state of the completed sync. Fingerprints of another generation than the state (a state reset,
+    another target, a final STATE message not kept by the target) are dropped, every row is written.
+    """
+
+    def __init__(self, directory, retention_days, today=None, state=None):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.today = today or date.today()
+        self.state = state
+        self.__streams = {}
+        self.__pending = {}
+        self.__lock = threading.Lock()
+        if state is not None:
+            self.__check_generation()
+
+    def get_path(self, stream_name):
+        return os.path.join(self.directory, '{}.fingerprints'.format(stream_name))
+
+    def __read_generation(self):
+        try:
+            with open(os.path.join(self.directory, GENERATION_KEY), 'r', encoding='utf-8') as generation_file:
+                return generation_file.read().strip()
+        except OSError:
+            return None
+
+    def __check_generation(self):
+        generation = self.state.get(GENERATION_KEY)
+        if generation and generation == self.__read_generation():
+            return
+        LOGGER.info('Stats fingerprints of generation {} do not match the state ({}), writing all the rows'.format(
+            self.__read_generation(), generation))
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith('.fingerprints'):
+                os.remove(os.path.join(self.directory, file_name))
+
+    def __write_generation(self):
+        generation = uuid.uuid4().hex
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as generation_file:
+            generation_file.write(generation)
+        os.replace(tmp_path, os.path.join(self.directory, GENERATION_KEY))
+        with OUTPUT_LOCK:
+            self.state[GENERATION_KEY] = generation
+            CHECKPOINTS.write_state(self.state)
+
+    def __get_stream(self, stream_name):
+        if stream_name not in self.__streams:
+            path = self.get_path(stream_name)
+            try:
+                self.__streams[stream_name] = StreamFingerprints.read(path)
+            except FileNotFoundError:
+                self.__streams[stream_name] = StreamFingerprints()
+            except (OSError, EOFError, ValueError) as err:
+                LOGGER.warning('Stats fingerprints {} are not readable, writing all the rows: {}'.format(path, err))
+                self.__streams[stream_name] = StreamFingerprints()
+        return self.__streams[stream_name]
+
+    def filter_changed(self, stream_name, records):
+        """
+        Returns the records which are new or whose values changed since they were written,
+        their fingerprints are recorded by record_written once process_records wrote them
+        """
+        changed_records = []
+        with self.__lock:
+            fingerprints = self.__get_stream(stream_name)
+            for record in records:
+                key = get_row_key(record)
+                digest = get_digest(record)
+                if fingerprints.get(key) != digest:
+                    changed_records.append(record)
+                    self.__pending[(stream_name, key)] = digest
+        if len(changed_records) < len(records):
+            LOGGER.info('Stream: {}, {} unchanged rows not written'.format(stream_name, len(records) - len(changed_records)))
+        return changed_records
+
+    def record_written(self, stream_name, records, bookmark_field=None, last_datetime=None):
+        """
+        Records the fingerprints of the records of filter_changed written by process_records:
+        the records without the bookmark_field or whose bookmark is not before last_datetime.
+        The records are matched by their (id, start_time), the fingerprint is the one of filter_changed.
+        """
+        last_epoch = get_epoch(last_datetime) if bookmark_field and last_datetime else None
+        with self.__lock:
+            fingerprints = self.__get_stream(stream_name)
+            for record in records:
+                key = get_row_key(record)
+                digest = self.__pending.pop((stream_name, key), None)
+                if digest is None:
+                    continue
+                bookmark = record.get(bookmark_field) if bookmark_field else None
+                if last_epoch is not None and bookmark and get_epoch(bookmark) < last_epoch:
+                    continue
+                start_time = str(record.get('start_time') or '')
+                day = date.fromisoformat(start_time[:10]).toordinal() if start_time else self.today.toordinal()
+                fingerprints.put(key, digest, day)
+
+    def save(self):
+        """Writes the fingerprints of the streams synced in this run, and their new generation"""
+        min_day = (self.today - timedelta(days=self.retention_days)).toordinal()
+        with self.__lock:
+            for stream_name, fingerprints in self.__streams.items():
+                if fingerprints.updates:
+                    self.__streams[stream_name] = fingerprints.merge(min_day)
+                    self.__streams[stream_name].write(self.get_path(stream_name))
+            if self.state is not None:
+                self.__write_generation()
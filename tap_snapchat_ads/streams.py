@@ -17,31 +17,52 @@
 #   bookmark_type: Data type for bookmark, integer or datetime
 
 # pylint: disable=line-too-long
+import itertools
 import pytz
 import math
-import humps
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from dateutil import tz
 from urllib.parse import urlencode
 import singer
-from singer import Transformer, metadata, metrics, utils
+from singer import Transformer, metrics, utils
 from singer.utils import strptime_to_utc, strftime
+from tap_snapchat_ads.bookmarks import BookmarkTracker
+from tap_snapchat_ads.checkpoint import CHECKPOINTS
+from tap_snapchat_ads.context import get_stream_context, get_timezone
+from tap_snapchat_ads.fingerprints import DELETED_AT_FIELD
+from tap_snapchat_ads.lookback import get_lookback_days
+from tap_snapchat_ads.normalize import get_key_normalizer
+from tap_snapchat_ads.parallel import OUTPUT_LOCK
+from tap_snapchat_ads.pruning import BOOKMARK_PRUNER
+from tap_snapchat_ads.scheduler import ChildParent, ParentPage, SyncScheduler, WorkItem, use_stats_breakdown
+from tap_snapchat_ads.stats_cache import is_final_window, open_stats_cache
+from tap_snapchat_ads.windows import WINDOW_TARGET_SECONDS, WindowSizer, get_date_window_size, is_window_error, \
+    use_adaptive_windows
 
 ALL_STATS_FIELDS = 'android_installs,attachment_avg_view_time_millis,attachment_impressions,attachment_quartile_1,attachment_quartile_2,attachment_quartile_3,attachment_total_view_time_millis,attachment_view_completion,avg_screen_time_millis,avg_view_time_millis,impressions,ios_installs,quartile_1,quartile_2,quartile_3,screen_time_millis,spend,swipe_up_percent,swipes,total_installs,video_views,video_views_time_based,video_views_15s,view_completion,view_time_millis,conversion_purchases,conversion_purchases_value,conversion_save,conversion_start_checkout,conversion_add_cart,conversion_view_content,conversion_add_billing,conversion_sign_ups,conversion_searches,conversion_level_completes,conversion_app_opens,conversion_page_views,conversion_subscribe,conversion_ad_click,conversion_ad_view,conversion_complete_tutorial,conversion_invite,conversion_login,conversion_share,conversion_reserve,conversion_achievement_unlocked,conversion_add_to_wishlist,conversion_spend_credits,conversion_rate,conversion_start_trial,conversion_list_view,custom_event_1,custom_event_2,custom_event_3,custom_event_4,custom_event_5,attachment_frequency,attachment_uniques,frequency,uniques'
 
 LOGGER = singer.get_logger()
 BASE_URL = 'https://adsapi.snapchat.com/v1'
+# Account-level stats, split by campaign, ad squad or ad (stats_breakdown config)
+BREAKDOWN_PATH = 'adaccounts/{parent_id}/stats'
+BREAKDOWN_PARENT = 'ad_account'
+# Maximum number of selected profiles (org_account_ids) requested one by one, concurrently;
+#  more are filtered from a listing of the organizations or ad accounts
+MAX_PROFILE_FETCHES = 10
 
 # Currently syncing sets the stream currently being delivered in the state.
 # If the integration is interrupted, this state property is used to identify
 #  the starting point to continue from.
 # Reference: https://github.com/singer-io/singer-python/blob/master/singer/bookmarks.py#L41-L46
 def update_currently_syncing(state, stream_name):
-    if (stream_name is None) and ('currently_syncing' in state):
-        del state['currently_syncing']
-    else:
-        singer.set_currently_syncing(state, stream_name)
-    singer.write_state(state)
+    with OUTPUT_LOCK:
+        if (stream_name is None) and ('currently_syncing' in state):
+            del state['currently_syncing']
+        else:
+            singer.set_currently_syncing(state, stream_name)
+        # the end of a stream is a checkpoint
+        CHECKPOINTS.write_state(state, force=stream_name is None)
 
 def get_hourly_stats_fields():
     """
@@ -75,6 +96,7 @@ class SnapchatAds:
     targeting_country_ind = False
     targeting_group = None
     targeting_type = None
+    breakdown = None
     children = []
 
     # To write schema in output
@@ -82,12 +104,12 @@ class SnapchatAds:
         """
         To write schema in output
         """
-        stream = catalog.get_stream(stream_name)
-        schema = stream.schema.to_dict()
         try:
             # Write_schema for the stream if it is selected in catalog
             if stream_name in selected_streams and stream_name in sync_streams:
-                singer.write_schema(stream_name, schema, stream.key_properties)
+                stream_context = get_stream_context(catalog, stream_name, STREAMS[stream_name])
+                with OUTPUT_LOCK:
+                    singer.write_schema(stream_name, stream_context.schema, stream_context.key_properties)
         except OSError as err:
             LOGGER.error('OS Error writing schema for: {}'.format(stream_name))
             raise err
@@ -98,7 +120,8 @@ class SnapchatAds:
         To write records in sync mode
         """
         try:
-            singer.messages.write_record(stream_name, record, time_extracted=time_extracted)
+            with OUTPUT_LOCK:
+                singer.messages.write_record(stream_name, record, time_extracted=time_extracted)
         except OSError as err:
             LOGGER.error('OS Error writing record for: {}'.format(stream_name))
             LOGGER.error('Stream: {}, record: {}'.format(stream_name, record))
@@ -121,6 +144,7 @@ class SnapchatAds:
 
         if parent and parent_id:
             key = '{}(parent_{}_id:{})'.format(bookmark_field, parent, parent_id)
+            BOOKMARK_PRUNER.mark_seen(stream, key)
         else:
             key = bookmark_field
 
@@ -138,17 +162,40 @@ class SnapchatAds:
         """
         if parent and parent_id:
             key = '{}(parent_{}_id:{})'.format(bookmark_field, parent, parent_id)
+            BOOKMARK_PRUNER.mark_seen(stream, key)
         else:
             key = bookmark_field
-        if 'bookmarks' not in state:
-            state['bookmarks'] = {}
-        if stream not in state['bookmarks']:
-            state['bookmarks'][stream] = {}
-
-        state['bookmarks'][stream][key] = value
-        LOGGER.info('Write state for Stream: {}, {} ID: {}, value: {}'.format(
-            stream, parent, parent_id, value))
-        singer.write_state(state)
+        with OUTPUT_LOCK:
+            if 'bookmarks' not in state:
+                state['bookmarks'] = {}
+            if stream not in state['bookmarks']:
+                state['bookmarks'][stream] = {}
+
+            state['bookmarks'][stream][key] = value
+            LOGGER.info('Write state for Stream: {}, {} ID: {}, value: {}'.format(
+                stream, parent, parent_id, value))
+            CHECKPOINTS.write_state(state, stream=stream, keys=[key])
+
+    # To write the bookmarks of many parents in output
+    def write_bookmarks(self, state, stream, values, bookmark_field, parent):
+        """
+        To write the bookmarks {parent_id: value} of many parents with one state message
+        """
+        with OUTPUT_LOCK:
+            if 'bookmarks' not in state:
+                state['bookmarks'] = {}
+            if stream not in state['bookmarks']:
+                state['bookmarks'][stream] = {}
+
+            keys = []
+            for parent_id, value in values.items():
+                key = '{}(parent_{}_id:{})'.format(bookmark_field, parent, parent_id)
+                state['bookmarks'][stream][key] = value
+                BOOKMARK_PRUNER.mark_seen(stream, key)
+                keys.append(key)
+            LOGGER.info('Write state for Stream: {}, {} bookmarks: {}'.format(
+                stream, parent, len(values)))
+            CHECKPOINTS.write_state(state, stream=stream, keys=keys)
 
     # To transform string to datetime 
     def transform_datetime(self, this_dttm):
@@ -171,44 +218,54 @@ class SnapchatAds:
         """
         To process record in sync mode
         """
-        stream = catalog.get_stream(stream_name)
-        schema = stream.schema.to_dict()
-        stream_metadata = metadata.to_map(stream.metadata)
+        # Transformer compiled once per stream (same output as singer's Transformer)
+        transformer = get_stream_context(catalog, stream_name, STREAMS[stream_name]).transformer
+
+        # Bookmarks compared as epochs, the max_bookmark_value is formatted once per page
+        bookmark_tracker = BookmarkTracker(last_datetime, max_bookmark_value)
 
         with metrics.record_counter(stream_name) as counter:
             for record in records:
                 # Transform record for Singer.io
-                with Transformer() as transformer:
-                    transformed_record = transformer.transform(
-                        dict(record),
-                        schema,
-                        stream_metadata)
-
-                    # Reset max_bookmark_value to new value if higher
-                    if bookmark_field and (bookmark_field in transformed_record):
-                        bookmark_date = transformed_record.get(bookmark_field)
-                        bookmark_dttm = strptime_to_utc(bookmark_date)
-                        last_dttm = strptime_to_utc(last_datetime)
-
-                        if not max_bookmark_value:
-                            max_bookmark_value = last_datetime
-
-                        max_bookmark_dttm = strptime_to_utc(max_bookmark_value)
-
-                        if bookmark_dttm > max_bookmark_dttm:
-                            max_bookmark_value = strftime(bookmark_dttm)
-
-                        # Keep only records whose bookmark is after the last_datetime
-                        if bookmark_dttm >= last_dttm:
-                            self.write_record(stream_name, transformed_record, \
-                                time_extracted=time_extracted)
-                            counter.increment()
-                    else:
-                        self.write_record(stream_name, transformed_record, time_extracted=time_extracted)
+                transformed_record = transformer.transform(record)
+
+                # Reset max_bookmark_value to new value if higher
+                if bookmark_field and (bookmark_field in transformed_record):
+                    # Keep only records whose bookmark is after the last_datetime
+                    if bookmark_tracker.is_new(transformed_record.get(bookmark_field)):
+                        self.write_record(stream_name, transformed_record, \
+                            time_extracted=time_extracted)
                         counter.increment()
+                else:
+                    self.write_record(stream_name, transformed_record, time_extracted=time_extracted)
+                    counter.increment()
 
             LOGGER.info('Stream: {}, Processed {} records'.format(stream_name, counter.value))
-            return max_bookmark_value, counter.value
+            CHECKPOINTS.add_records(counter.value)
+            return bookmark_tracker.get_max_bookmark_value(), counter.value
+
+    def write_deleted_records(self, catalog, stream_name, stream_class, deleted_records, country_code, parent_id): # pylint: disable=too-many-arguments
+        """
+        Writes the records deleted since the previous listing with their key properties and
+        the _sdc_deleted_at property, if the schema of the stream has it (added by the discovery with
+        `fingerprint_cache_dir`). Returns the number of records.
+        """
+        if not deleted_records or \
+                DELETED_AT_FIELD not in get_stream_context(catalog, stream_name, stream_class).schema.get('properties', {}):
+            return 0
+        deleted_at = strftime(utils.now())
+        for record in deleted_records:
+            record[DELETED_AT_FIELD] = deleted_at
+            if country_code != 'none':
+                record['country_code'] = country_code
+            if stream_class.parent and parent_id:
+                record['{}_id'.format(stream_class.parent)] = parent_id
+        _, record_count = self.process_records(
+            catalog=catalog,
+            stream_name=stream_name,
+            records=deleted_records,
+            time_extracted=utils.now())
+        return record_count
 
     # To reset minutes in local
     def remove_minutes_local(self, dttm, timezone):
@@ -237,12 +294,14 @@ class SnapchatAds:
         param parent_id: parent_id for child stream
 
         Extracts data for selected profiles(organizations and ad_accounts)
-        reads respective IDs from config json and iterates over each id and extracts data
+        reads respective IDs from config json. Up to `max_profile_fetches` profiles are requested
+        by ID, on as many threads, more are filtered from one listing of the organizations or of
+        the ad accounts of the organization. The choice is a fixed count threshold, not a cost
+        comparison: the size of the listing is not known before it is paged through.
         """
         selected_profiles = config.get('org_account_ids', [])
 
         ids = []
-        url = BASE_URL + '/{stream_name}/{id}'
         for profile in selected_profiles:
             if stream_name == 'organizations':
                 ids.append(profile.get('organisation_id'))
@@ -253,8 +312,23 @@ class SnapchatAds:
         # WARN Logger to confirm if User has selected Ad accounts or if Ad accounts doesn't exist for org_id
         if not ids and stream_name == 'adaccounts':
             LOGGER.warn("No AD Accounts selected or exist for organisation id {}".format(parent_id))
-        response_data = {stream_name: []}
-        for profile_id in ids:
+        if not ids:
+            return {stream_name: []}
+
+        max_profile_fetches = int(config.get('max_profile_fetches') or MAX_PROFILE_FETCHES)
+        if len(ids) > max_profile_fetches:
+            if stream_name == 'organizations':
+                list_url = BASE_URL + '/me/organizations'
+            else:
+                list_url = BASE_URL + '/organizations/{}/adaccounts'.format(parent_id)
+            profiles = SnapchatAds.list_profiles(client, stream_name, list_url, set(ids))
+            missing_ids = [profile_id for profile_id in ids if profile_id not in profiles]
+            if missing_ids:
+                LOGGER.warning('Stream: {}, selected profiles not found: {}'.format(stream_name, missing_ids))
+            return {stream_name: [profiles[profile_id] for profile_id in ids if profile_id in profiles]}
+
+        url = BASE_URL + '/{stream_name}/{id}'
+        def get_profile(profile_id):
             formatted_url = url.format(id=profile_id, stream_name=stream_name)
             try:
                 data = client.get(url=formatted_url, endpoint=stream_name)
@@ -262,12 +336,570 @@ class SnapchatAds:
                 LOGGER.error('{}'.format(err))
                 LOGGER.error('URL for Stream {}: {}'.format(stream_name, formatted_url))
                 raise
-            response_data[stream_name].append(data[stream_name][0])
+            return data[stream_name][0]
+
+        with ThreadPoolExecutor(max_workers=min(len(ids), max_profile_fetches)) as executor:
+            return {stream_name: list(executor.map(get_profile, ids))}
+
+    @staticmethod
+    def list_profiles(client, stream_name, list_url, ids):
+        """Pages through a listing of profiles, returns {id: profile response} of the selected ids"""
+        profiles = {}
+        next_url = list_url
+        while next_url:
+            try:
+                data = client.get(url=next_url, endpoint=stream_name)
+            except Exception as err:
+                LOGGER.error('{}'.format(err))
+                LOGGER.error('URL for Stream {}: {}'.format(stream_name, next_url))
+                raise
+            if data.get('request_status') != 'SUCCESS':
+                raise RuntimeError(data)
+            for data_record in data.get(stream_name, []):
+                record = data_record.get(stream_name[:-1], {})
+                if record.get('id') in ids:
+                    profiles[record['id']] = data_record
+            next_url = data.get('paging', {}).get('next_link')
+        return profiles
 
-        return response_data
+    @staticmethod
+    def get_child_parent(stream_name, id_fields, record, timezone_desc=None):
+        """
+        Returns the ChildParent (parent_id, timezone_desc, lifetime) a child stream is synced with
+        for a parent record. Ad accounts set the timezone used for the date windows of all their
+        descendants, the lifetime (start_time or created_at, end_time) bounds the stats date windows.
+        """
+        i = 0
+        # Set parent_id
+        for id_field in id_fields:
+            if i == 0:
+                parent_id_field = id_field
+            if id_field == 'id':
+                parent_id_field = id_field
+            i = i + 1
+        parent_id = record.get(parent_id_field)
+
+        if stream_name == 'ad_accounts':
+            timezone_desc = record.get('timezone', timezone_desc)
+
+        lifetime = (record.get('start_time') or record.get('created_at'), record.get('end_time'))
+        return ChildParent(parent_id, timezone_desc, lifetime if any(lifetime) else None)
 
-    # Sync a specific parent or child endpoint.
+    @staticmethod
+    def get_attribution_windows(config):
+        """
+        Returns the swipe up and view attribution windows from the config and
+        the attribution window (days) the stats are re-synced for on every run
+        """
+        swipe_up_attribution_window = config.get('swipe_up_attribution_window') or '28_DAY'
+        view_attribution_window = config.get('view_attribution_window') or '7_DAY'
+
+        swipe_up_attr = int(swipe_up_attribution_window.replace('_DAY', ''))
+
+        if view_attribution_window in ('1_HOUR', '3_HOUR', '6_HOUR',):
+            view_attr = 1
+        else:
+            view_attr = int(view_attribution_window.replace('_DAY', ''))
+
+        attribution_window = max(1, swipe_up_attr, view_attr)
+        return swipe_up_attribution_window, view_attribution_window, attribution_window
+
+    def get_stream_params(self, stream_name, stream_class, config, catalog=None):
+        """
+        Returns a copy of the stream query params, the copy is updated per date window
+        and the class level params are shared by every parent_id (and thread) syncing the stream.
+        The stats fields are restricted to the properties selected in the catalog.
+        """
+        params = dict(stream_class.params)
+        omit_empty = config.get('omit_empty') or 'true'
+        if '_stats_' in stream_name:
+            params['omit_empty'] = omit_empty
+            if hasattr(catalog, 'get_stream'):
+                params.update(get_stream_context(catalog, stream_name, stream_class).stats_projection)
+        return params
+
+    @staticmethod
+    def get_lifetime_bounds(config, lifetime, attribution_window):
+        """
+        Returns the (first, final) datetimes a parent entity may have stats for: its start and its
+        end plus the attribution window (None while it runs), None when `clip_stats_windows` is disabled
+        """
+        if not lifetime or str(config.get('clip_stats_windows', 'true')).lower() != 'true':
+            return None
+        start_time, end_time = lifetime
+        first_dttm = strptime_to_utc(start_time) if start_time else None
+        final_dttm = strptime_to_utc(end_time) + timedelta(days=attribution_window) if end_time else None
+        return first_dttm, final_dttm
+
+    @staticmethod
+    def get_final_bookmark(max_bookmark_value, lifetime_bounds, now_datetime):
+        """
+        Returns the bookmark of a parent entity whose stats can no longer change (it ended more than
+        the attribution window ago): the end of its stats, so its windows are not requested again.
+        None if the bookmark does not change.
+        """
+        final_dttm = (lifetime_bounds or (None, None))[1]
+        if final_dttm and final_dttm <= now_datetime and \
+                (not max_bookmark_value or strptime_to_utc(max_bookmark_value) < final_dttm):
+            return strftime(final_dttm)
+        return None
+
+    @staticmethod
+    def get_window_bounds(stream_class, last_dttm, now_datetime, attribution_window, lifetime_bounds=None):
+        """
+        Returns the (start, end) datetimes of the date windows to sync, an empty range once the
+        bookmark is at the final bookmark of the parent entity,
+        lifetime_bounds: the (first, final) datetimes the parent entity may have stats for
+        """
+        first_dttm, final_dttm = lifetime_bounds or (None, None)
+        # The stats of the parent entity can no longer change and were synced
+        if final_dttm and last_dttm >= final_dttm:
+            return final_dttm, final_dttm
+        start_window = last_dttm
+        if stream_class.bookmark_query_field_from and stream_class.bookmark_query_field_to:
+            # Re-sync the stats of the attribution window
+            start_window = min(last_dttm, now_datetime - timedelta(days=attribution_window))
+            # Skip the windows before the parent entity started
+            if first_dttm and start_window < first_dttm:
+                start_window = first_dttm
+
+        # Skip the windows after the parent entity ended (plus the attribution window)
+        if final_dttm and final_dttm < now_datetime:
+            now_datetime = final_dttm
+        return start_window, now_datetime
+
+    @staticmethod
+    def get_date_windows(stream_class, last_dttm, now_datetime, attribution_window, lifetime_bounds=None, # pylint: disable=too-many-arguments
+                         date_window_size=None):
+        """
+        Returns the list of (start_window, end_window) date windows to sync,
+        lifetime_bounds: the (first, final) datetimes the parent entity may have stats for
+        date_window_size: days of each date window, default is the size of the stream class
+        """
+        start_window, end_datetime = SnapchatAds.get_window_bounds(
+            stream_class, last_dttm, now_datetime, attribution_window, lifetime_bounds)
+        date_window_size = int(date_window_size or stream_class.date_window_size)
+        if stream_class.bookmark_query_field_from and stream_class.bookmark_query_field_to:
+            # date_window_size: Number of days in each date window
+            end_window = min(start_window + timedelta(days=date_window_size), end_datetime)
+        else:
+            end_window = now_datetime
+            diff_sec = (end_window - start_window).total_seconds()
+            date_window_size = max(1, math.ceil(diff_sec / (3600 * 24))) # round-up difference to days
+
+        date_windows = []
+        while start_window < end_datetime:
+            date_windows.append((start_window, end_window))
+            # Increment date window
+            start_window = end_window
+            next_end_window = end_window + timedelta(days=date_window_size)
+            if next_end_window > end_datetime:
+                end_window = end_datetime
+            else:
+                end_window = next_end_window
+        return date_windows
+
+    @staticmethod
+    def iter_adaptive_windows(stream_name, window_sizer, get_window_pages, start_window, end_datetime): # pylint: disable=too-many-arguments
+        """
+        Yields ((start_window, end_window), pages) for the date windows from start_window to end_datetime,
+        each window sized by window_sizer from the previous ones. A window which fails with a timeout,
+        a 5xx or an E1008 error is requested again with half its size.
+        """
+        while start_window < end_datetime:
+            end_window = min(end_datetime, start_window + timedelta(days=window_sizer.days))
+            started = time.monotonic()
+            try:
+                pages = list(get_window_pages((start_window, end_window)))
+            except Exception as err:
+                if not (is_window_error(err) and window_sizer.fail()):
+                    raise
+                LOGGER.warning('Stream: {}, date window from {} to {} failed ({}), retrying with {} days windows'.format(
+                    stream_name, start_window, end_window, err, window_sizer.days))
+                continue
+            window_sizer.observe(sum(len(transformed_data) for _, transformed_data, _ in pages), time.monotonic() - started)
+            yield (start_window, end_window), pages
+            start_window = end_window
+
+    @staticmethod
+    def write_window_size(state, stream_name, days):
+        """
+        Records the date window size (days) of a stream in the state, for the next runs. The size
+        is shared by the parents of the stream, not kept per parent: the last parent synced (of
+        the parallel parents, the last to complete) sets the size every parent starts from in the
+        next run, each parent then adapts it from its own responses.
+        """
+        with OUTPUT_LOCK:
+            state.setdefault('date_window_sizes', {})[stream_name] = days
+
+    def get_window_query_dates(self, start_window, end_window, timezone, report_granularity):
+        """
+        Returns the start and end query parameters of a stats date window,
+        truncated to the day or hour in the ad account timezone
+        """
+        # Query parameter startDate and endDate must be in Eastern time zone
+        # API will error if future dates are requested
+        if report_granularity == 'DAY':
+            window_start_dt_str = self.remove_hours_local(start_window, timezone)
+            window_end_dt_str = self.remove_hours_local(end_window, timezone)
+            if window_start_dt_str == window_end_dt_str:
+                window_end_dt_str = self.remove_hours_local(end_window + timedelta(
+                    days=1), timezone)
+        else:
+            window_start_dt_str = self.remove_minutes_local(start_window, timezone)
+            window_end_dt_str = self.remove_minutes_local(end_window, timezone)
+            if window_start_dt_str == window_end_dt_str:
+                # E1008: Unsupported Stats Query: End time should be after start time.
+                # Snapchat ADs throws above error if both start and end_time are equal.
+                # add delta of one hour to end_window and remove minutes from it.
+                window_end_dt_str = self.remove_minutes_local(end_window + timedelta(
+                    hours=1), timezone)
+        return window_start_dt_str, window_end_dt_str
+
+    @staticmethod
+    def get_endpoint_url(base_url, stream_name, stream_class, params, config, country_code='none', parent_id=None, path=None): # pylint: disable=too-many-arguments
+        """
+        Returns the url of the first page of an endpoint, params are formatted in place
+        """
+        # Path
+        base_path = path or stream_class.path or stream_name
+        if stream_name.startswith('targeting_'):
+            path = base_path.format(
+                targeting_group=stream_class.targeting_group,
+                targeting_type=stream_class.targeting_type,
+                country_code=country_code,
+                parent_id=parent_id)
+        else:
+            path = base_path.format(
+                country_code=country_code,
+                parent_id=parent_id)
+
+        if stream_class.paging:
+            # Allowed values: 50 - 1000, initially the 'limit' was 500
+            params['limit'] = int(config.get('page_size', 500))
+
+        swipe_up_attribution_window, view_attribution_window, _ = SnapchatAds.get_attribution_windows(config)
+        for key, val in params.items():
+            # Replace variables in params
+            new_val = str(val).format(
+                swipe_up_attribution_window=swipe_up_attribution_window,
+                view_attribution_window=view_attribution_window)
+            params[key] = new_val
+        # Create QueryString from params dict using urlencode
+        querystring = urlencode(params)
+        return '{}/{}?{}'.format(
+            base_url,
+            path,
+            querystring)
+
+    @staticmethod
+    def transform_data(data, stream_name, stream_class, country_code='none', parent_id=None):
+        """
+        De-nests the records of an API response and returns the list of transformed records
+        """
+        targeting_group = stream_class.targeting_group
+        targeting_type = stream_class.targeting_type
+        data_key_array = stream_class.data_key_array
+        data_key_record = stream_class.data_key_record.format(targeting_type=targeting_type)
+        id_fields = stream_class.key_properties
+        parent = stream_class.parent
+        # camelCase to snake_case translations of the keys of the stream
+        key_normalizer = get_key_normalizer(stream_name)
+
+        # Transform data with transform_json from transform.py
+        # The data_key_array identifies the array/list of records below the <root> element
+        transformed_data = [] # initialize the record list
+
+        # Reports stats streams de-nesting
+        if '_stats_' in stream_name:
+            base_records = []
+            for data_record in data.get(data_key_array, []):
+                base_record = data_record.get(data_key_record, {})
+                # Ad account stats with a breakdown: one base record per campaign, ad squad or ad
+                if 'breakdown_stats' in base_record:
+                    base_records.extend(base_record['breakdown_stats'].get(stream_class.breakdown, []))
+                else:
+                    base_records.append(base_record)
+
+            for base_record in base_records:
+                records = base_record.get('timeseries', [])
+                for record in records:
+                    # Add parent base_record fields and de-nest stats, with decamelized keys
+                    try:
+                        transformed_record = key_normalizer.denest_stats(record, base_record)
+                    except Exception as err:
+                        LOGGER.error('{}'.format(err))
+                        raise
+
+                    # verify primary_keys are in tansformed_record
+                    if 'id' not in transformed_record or 'start_time' not in transformed_record:
+                        LOGGER.error('Stream: {}, Missing key (id or start_time)'.format(
+                            stream_name))
+                        LOGGER.error('transformed_record: {}'.format(transformed_record))
+                        raise RuntimeError
+
+                    transformed_data.append(transformed_record)
+                    # End for record in records
+                # End for base_record in array
+            # End stats stream
+
+        # Other streams de-nesting
+        else: # Not stats stream
+            for data_record in data.get(data_key_array, []):
+                sub_request_status = data_record.get('sub_request_status')
+                if sub_request_status != 'SUCCESS':
+                    raise RuntimeError(data_record)
+
+                record = data_record.get(data_key_record, {})
+                # Transforms to align schemas for targeting streams
+                if stream_name.startswith('targeting_'):
+                    record['targeting_group'] = targeting_group
+                    record['targeting_type'] = targeting_type
+                    if country_code != 'none':
+                        record['country_code'] = country_code
+                    if targeting_group == 'geo':
+                        record_id = record.get(targeting_type, {}).get('id')
+                        record_name = record.get(targeting_type, {}).get('name')
+                        record['id'] = record_id
+                        record['name'] = record_name
+                    if targeting_type == 'postal_code':
+                        record_id = record.get('postalCode')
+                        record['id'] = record_id
+                        record['name'] = record_id
+                        record.pop('postalCode')
+
+                # Add parent id field/value
+                if parent and parent_id:
+                    parent_key = '{}_id'.format(parent)
+                    record[parent_key] = parent_id
+
+                # transform record (remove inconsistent use of CamelCase)
+                try:
+                    transformed_record = key_normalizer.normalize(record)
+                except Exception as err:
+                    LOGGER.error('{}'.format(err))
+                    LOGGER.error('error record: {}'.format(record))
+                    raise
+
+                # verify primary_keys are in tansformed_record
+                for key in id_fields:
+                    if not transformed_record.get(key):
+                        LOGGER.error('Stream: {}, Missing key {}'.format(
+                            stream_name, key))
+                        LOGGER.info('transformed_record: {}'.format(transformed_record))
+                        raise RuntimeError
+
+                transformed_data.append(transformed_record)
+                # End for data_record in array
+            # End non-stats stream
+
+        return transformed_data
+
+    def get_pages(self, client, config, stream_name, stream_class, params, country_code_list, parent_id=None, path=None, # pylint: disable=too-many-arguments
+                  window_cache=None):
+        """
+        Yields (country_code, transformed_data, time_extracted) for every page of a date window,
+        window_cache: the StatsWindowCache of a final date window
+        """
+        # This loop will run once for non-country_code endpoints
+        #   and one or more times (for each country) for country_code endpoints
+        for country_code in country_code_list:
+            # pagination: loop thru all pages of data using next (if not None)
+            #   Reference: https://developers.snapchat.com/api/docs/#pagination
+            # initialize next_url
+            next_url = self.get_endpoint_url(
+                client.base_url, stream_name, stream_class, params, config, country_code, parent_id, path)
+
+            # pagination loop
+            while next_url is not None:
+
+                # API request data
+                data = {}
+                try:
+                    # checks if profiles are selected, if not extracts data for all orgs and ad_accounts
+                    if config.get('org_account_ids', []) and stream_name in ['organizations', 'ad_accounts']:
+                        data = self.extract_selected_profile_data(config, client, stream_class.data_key_array, parent_id)
+                        data['request_status'] = 'SUCCESS'
+                    elif window_cache is not None:
+                        data = window_cache.get(next_url)
+                        if data is None:
+                            data = client.get(url=next_url, endpoint=stream_name)
+                            if data and data.get('request_status') == 'SUCCESS':
+                                window_cache.put(next_url, data)
+                    else:
+                        data = client.get(url=next_url, endpoint=stream_name)
+                except Exception as err:
+                    LOGGER.error('{}'.format(err))
+                    LOGGER.error('URL for Stream {}: {}'.format(stream_name, next_url))
+                    raise
+
+                # time_extracted: datetime when the data was extracted from the API
+                time_extracted = utils.now()
+                if not data or data is None or data == {}:
+                    LOGGER.info('No data results returned')
+                    break # No data results
+
+                request_status = data.get('request_status')
+                if request_status != 'SUCCESS':
+                    raise RuntimeError(data)
+
+                # Get pagination next_url
+                next_url = data.get('paging', {}).get('next_link', None)
+
+                transformed_data = self.transform_data(data, stream_name, stream_class, country_code, parent_id)
+
+                if not transformed_data or transformed_data is None:
+                    LOGGER.info('No transformed data for data = {}'.format(data))
+                    break # No transformed_data results
+
+                yield country_code, transformed_data, time_extracted
+                # End page/batch - while next URL loop
+            # End country_code loop
+
+    # Sync a specific parent or child endpoint and all its descendants.
     def sync_endpoint(
+            self,
+            client,
+            config,
+            catalog,
+            state,
+            stream_name,
+            sync_streams,
+            selected_streams,
+            timezone_desc=None,
+            parent_id=None,
+            pool=None,
+            hierarchy_index=None,
+            fingerprint_store=None,
+            lookback_policy=None,
+            stats_dedupe=None):
+
+        """
+        To sync all streams (i.e. parent and child stream)
+        """
+        with SyncScheduler(self, STREAMS, client, config, catalog, state, sync_streams,
+                           selected_streams, pool, update_currently_syncing, hierarchy_index,
+                           fingerprint_store, lookback_policy, stats_dedupe) as scheduler:
+            return scheduler.run(WorkItem(stream_name, parent_id, timezone_desc, None))
+
+    def get_breakdown_bookmark(self, state, stream_name, start_date, bookmark_field, entity_parent, parent_id):
+        """
+        Returns the bookmark of an ad account for a stats stream synced with a breakdown.
+        Before the first breakdown sync of the ad account, the earliest bookmark of the
+        campaigns, ad squads or ads synced one by one is used.
+        """
+        last_datetime = self.get_bookmark(state, stream_name, None, bookmark_field, BREAKDOWN_PARENT, parent_id)
+        if last_datetime:
+            return last_datetime
+
+        entity_key_prefix = '{}(parent_{}_id:'.format(bookmark_field, entity_parent)
+        entity_bookmarks = [
+            value for key, value in (state or {}).get('bookmarks', {}).get(stream_name, {}).items()
+            if key.startswith(entity_key_prefix)]
+        if entity_bookmarks:
+            return min(entity_bookmarks, key=strptime_to_utc)
+        return start_date
+
+    # Sync the stats of all the campaigns, ad squads or ads of an ad account.
+    def sync_breakdown_endpoint( # pylint: disable=too-many-locals
+            self,
+            client,
+            config,
+            catalog,
+            state,
+            stream_name,
+            stream_class,
+            sync_streams,
+            selected_streams,
+            timezone_desc=None,
+            parent_id=None,
+            lookback_policy=None,
+            stats_dedupe=None):
+
+        """
+        Syncs a campaign, ad squad or ad stats stream for the ad account parent_id with one
+        adaccounts/{parent_id}/stats?breakdown= request per date window (stats_breakdown config).
+        The rows are split per entity and processed with the entity bookmark, same as the
+        stats requested per entity; the ad account bookmark is the start of the next request.
+        """
+        bookmark_field = next(iter(stream_class.replication_keys), None)
+        entity_parent = stream_class.parent
+        # the entities without rows are not seen, their bookmarks are not pruned
+        BOOKMARK_PRUNER.keep_group(stream_name, '{}(parent_{}_id)'.format(bookmark_field, entity_parent))
+        params = self.get_stream_params(stream_name, stream_class, config, catalog)
+        params['breakdown'] = stream_class.breakdown
+        _, _, attribution_window = self.get_attribution_windows(config)
+        timezone = get_timezone(timezone_desc)
+        report_granularity = params.get('granularity', 'HOUR')
+
+        last_datetime = self.get_breakdown_bookmark(
+            state, stream_name, config.get('start_date'), bookmark_field, entity_parent, parent_id)
+        max_bookmark_value = last_datetime
+        # entity id: [last_datetime, max_bookmark_value]
+        entity_bookmarks = {}
+        endpoint_total = 0
+
+        now_datetime = utils.now()
+        stats_cache = open_stats_cache(config)
+        # one request per window for all the entities of the ad account: not adaptive, the configured size
+        date_windows = self.get_date_windows(stream_class, strptime_to_utc(last_datetime), now_datetime,
+                                             get_lookback_days(lookback_policy, stream_name, attribution_window,
+                                                               strptime_to_utc(last_datetime), now_datetime),
+                                             date_window_size=get_date_window_size(
+                                                 config, state, stream_name, stream_class, adaptive=False)[0])
+        for start_window, end_window in date_windows:
+            LOGGER.info('START Sync for Stream: {}, {} breakdown of ad account: {}, Date window from: {} to {}'.format(
+                stream_name, stream_class.breakdown, parent_id, start_window.date(), end_window.date()))
+            window_params = dict(params)
+            window_params[stream_class.bookmark_query_field_from], window_params[stream_class.bookmark_query_field_to] = \
+                self.get_window_query_dates(start_window, end_window, timezone, report_granularity)
+
+            window_cache = stats_cache if stats_cache and is_final_window(end_window, now_datetime, attribution_window) else None
+            for _, transformed_data, time_extracted in self.get_pages(
+                    client, config, stream_name, stream_class, window_params, ['none'], parent_id, BREAKDOWN_PATH, window_cache):
+                # Split the breakdown rows per campaign, ad squad or ad
+                records_by_entity = {}
+                for record in transformed_data:
+                    records_by_entity.setdefault(record['id'], []).append(record)
+
+                for entity_id, records in records_by_entity.items():
+                    if entity_id not in entity_bookmarks:
+                        entity_last_datetime = self.get_bookmark(
+                            state, stream_name, last_datetime, bookmark_field, entity_parent, entity_id)
+                        entity_bookmarks[entity_id] = [entity_last_datetime, entity_last_datetime]
+
+                    if stream_name in selected_streams and stream_name in sync_streams:
+                        entity_last_datetime, entity_max_bookmark_value = entity_bookmarks[entity_id]
+                        if stats_dedupe is not None:
+                            records = stats_dedupe.filter_changed(stream_name, records)
+                        entity_max_bookmark_value, record_count = self.process_records(
+                            catalog=catalog,
+                            stream_name=stream_name,
+                            records=records,
+                            time_extracted=time_extracted,
+                            bookmark_field=bookmark_field,
+                            max_bookmark_value=entity_max_bookmark_value,
+                            last_datetime=entity_last_datetime)
+                        if stats_dedupe is not None:
+                            stats_dedupe.record_written(stream_name, records, bookmark_field, entity_last_datetime)
+                        entity_bookmarks[entity_id][1] = entity_max_bookmark_value
+                        endpoint_total = endpoint_total + record_count
+                        if entity_max_bookmark_value and \
+                                strptime_to_utc(entity_max_bookmark_value) > strptime_to_utc(max_bookmark_value):
+                            max_bookmark_value = entity_max_bookmark_value
+
+            # Per-entity bookmarks stay compatible with the stats requested per entity
+            if bookmark_field and stream_name in selected_streams:
+                self.write_bookmarks(state, stream_name, {
+                    entity_id: bookmarks[1] for entity_id, bookmarks in entity_bookmarks.items()},
+                                     bookmark_field, entity_parent)
+                self.write_bookmark(state, stream_name, max_bookmark_value, bookmark_field, BREAKDOWN_PARENT, parent_id)
+            # End date window
+
+        return endpoint_total
+
+    # Sync a specific parent or child endpoint (one work item of the SyncScheduler).
+    def iter_endpoint(
             self,
             client,
             config,
@@ -278,48 +910,49 @@ class SnapchatAds:
             sync_streams,
             selected_streams,
             timezone_desc=None,
-            parent_id=None):
+            parent_id=None,
+            lifetime=None,
+            pool=None,
+            child_streams=None,
+            fingerprint_store=None,
+            lookback_policy=None,
+            stats_dedupe=None):
         
         """
-        To sync all streams (i.e. parent and child stream)
+        Syncs one stream for one parent_id, yields a ParentPage after each page of records
+        whose children must be synced and returns the total number of records.
+        child_streams: the child streams to sync (in the stream DAG), default is stream_class.children
+        lifetime: the (start, end) of the parent entity, bounds the stats date windows
+        fingerprint_store: only the new or changed records of a FULL_TABLE stream are written
+        lookback_policy: how far back the stats are re-synced before the bookmark
+        stats_dedupe: only the new or changed rows of a stats stream are written
         """
+        if child_streams is None:
+            child_streams = stream_class.children
+        if use_stats_breakdown(config, stream_class):
+            return self.sync_breakdown_endpoint(
+                client, config, catalog, state, stream_name, stream_class, sync_streams,
+                selected_streams, timezone_desc, parent_id, lookback_policy, stats_dedupe)
 
         # endpoint_config variables
-        base_path = stream_class.path or stream_name
         bookmark_field = next(iter(stream_class.replication_keys ), None)
-        params = stream_class.params
-        paging = stream_class.paging
+        params = self.get_stream_params(stream_name, stream_class, config, catalog)
         bookmark_query_field_from = stream_class.bookmark_query_field_from
         bookmark_query_field_to = stream_class.bookmark_query_field_to
-        targeting_group = stream_class.targeting_group
-        targeting_type = stream_class.targeting_type
         targeting_country_ind = stream_class.targeting_country_ind
-        data_key_array = stream_class.data_key_array
-        data_key_record = stream_class.data_key_record.format(targeting_type=targeting_type)
         id_fields = stream_class.key_properties
         parent = stream_class.parent
-        date_window_size = int(stream_class.date_window_size)
         # Store parent_id into base_parent for bookmark writing
         base_parent = parent_id
+        # country_code: FingerprintListing of the records listed, in change-only mode
+        listings = None
+        if fingerprint_store is not None and stream_class.replication_method == 'FULL_TABLE':
+            listings = {}
         api_limit = int(config.get('page_size', 500)) # initially the 'limit' was 500
 
         # tap config variabless
         start_date = config.get('start_date')
-        swipe_up_attribution_window = config.get('swipe_up_attribution_window') or '28_DAY'
-        view_attribution_window = config.get('view_attribution_window') or '7_DAY'
-
-        swipe_up_attr = int(swipe_up_attribution_window.replace('_DAY', ''))
-
-        if view_attribution_window in ('1_HOUR', '3_HOUR', '6_HOUR',):
-            view_attr = 1
-        else:
-            view_attr = int(view_attribution_window.replace('_DAY', ''))
-
-        attribution_window = max(1, swipe_up_attr, view_attr)
-
-        omit_empty = config.get('omit_empty') or 'true'
-        if '_stats_' in stream_name:
-            params['omit_empty'] = omit_empty
+        _, _, attribution_window = self.get_attribution_windows(config)
 
         country_codes = config.get('targeting_country_codes') or 'us'
         country_codes = country_codes.replace(' ', '').lower()
@@ -329,10 +962,7 @@ class SnapchatAds:
             country_code_list = ['none']
 
         # Get the timezone and latest bookmark for the stream
-        if not timezone_desc:
-            timezone = tz.gettz("UTC")
-        else:
-            timezone = tz.gettz(timezone_desc)
+        timezone = get_timezone(timezone_desc)
         LOGGER.info('timezone = {}'.format(timezone))
 
         last_datetime = self.get_bookmark(state, stream_name, start_date, bookmark_field, parent, parent_id)
@@ -346,311 +976,147 @@ class SnapchatAds:
         if '_stats_' in stream_name:
             LOGGER.info('report_granularity: {}'.format(report_granularity))
 
+        endpoint_total = 0
+        total_records = 0
+
+        lifetime_bounds = None
         if bookmark_query_field_from and bookmark_query_field_to:
-            # date_window_size: Number of days in each date window
-            # Set start window
-            start_window = now_datetime - timedelta(days=attribution_window)
-            if last_dttm < start_window:
-                start_window = last_dttm
-            # Set end window
-            end_window = start_window + timedelta(days=date_window_size)
+            lifetime_bounds = self.get_lifetime_bounds(config, lifetime, attribution_window)
+        date_window_size, max_window_size = get_date_window_size(config, state, stream_name, stream_class)
+        stats_cache = open_stats_cache(config)
+        lookback_days = attribution_window
+        if bookmark_query_field_from and bookmark_query_field_to:
+            lookback_days = get_lookback_days(lookback_policy, stream_name, attribution_window, last_dttm, now_datetime)
 
+        def get_window_pages(date_window):
+            # copy params, the date windows may be requested at the same time
+            window_params = dict(params)
+            window_cache = None
+            if bookmark_query_field_from and bookmark_query_field_to:
+                window_params[bookmark_query_field_from], window_params[bookmark_query_field_to] = \
+                    self.get_window_query_dates(*date_window, timezone, report_granularity)
+                # the stats of the windows before the attribution window are read from the cache
+                if stats_cache and is_final_window(date_window[1], now_datetime, attribution_window):
+                    window_cache = stats_cache
+            return self.get_pages(client, config, stream_name, stream_class, window_params, country_code_list, parent_id,
+                                  window_cache=window_cache)
+
+        window_sizer = None
+        max_parallel_windows = int(config.get('max_parallel_windows') or 1)
+        if use_adaptive_windows(config, stream_class):
+            # Size each date window from the records and the latency of the previous one
+            window_sizer = WindowSizer(date_window_size, max_window_size,
+                                       float(config.get('date_window_target_seconds') or WINDOW_TARGET_SECONDS))
+            start_window, end_datetime = self.get_window_bounds(stream_class, last_dttm, now_datetime, lookback_days, lifetime_bounds)
+            cached_windows = []
+            if stats_cache:
+                # the final windows keep the configured size, their cache keys do not move with the adaptive size
+                cached_windows = [date_window for date_window in self.get_date_windows(
+                    stream_class, last_dttm, now_datetime, lookback_days, lifetime_bounds, max_window_size)
+                                  if is_final_window(date_window[1], now_datetime, attribution_window)]
+            if cached_windows:
+                start_window = cached_windows[-1][1]
+            window_pages = itertools.chain(
+                ((date_window, get_window_pages(date_window)) for date_window in cached_windows),
+                self.iter_adaptive_windows(stream_name, window_sizer, get_window_pages, start_window, end_datetime))
         else:
-            start_window = last_dttm
-            end_window = now_datetime
-            diff_sec = (end_window - start_window).seconds
-            date_window_size = math.ceil(diff_sec / (3600 * 24)) # round-up difference to days
-
-        endpoint_total = 0
-        total_records = 0
+            date_windows = self.get_date_windows(
+                stream_class, last_dttm, now_datetime, lookback_days, lifetime_bounds, date_window_size)
+            if pool and pool.parallel and max_parallel_windows > 1 and bookmark_query_field_from and not child_streams:
+                # Request the next date windows while the current one is processed, records and
+                #   bookmarks are still written in date window order so a bookmark never moves past a gap
+                window_pages = zip(date_windows, pool.map_ordered(lambda date_window: list(get_window_pages(date_window)),
+                                                                  date_windows, max_parallel_windows))
+            else:
+                window_pages = ((date_window, get_window_pages(date_window)) for date_window in date_windows)
 
-        while start_window < now_datetime:
+        for (start_window, end_window), pages in window_pages:
             LOGGER.info('START Sync for Stream: {}{}'.format(
                 stream_name,
                 ', Date window from: {} to {}'.format(start_window.date(), end_window.date()) \
                     if bookmark_query_field_from else ''))
 
-            if bookmark_query_field_from and bookmark_query_field_to:
-                # Query parameter startDate and endDate must be in Eastern time zone
-                # API will error if future dates are requested
-                if report_granularity == 'DAY':
-                    window_start_dt_str = self.remove_hours_local(start_window, timezone)
-                    window_end_dt_str = self.remove_hours_local(end_window, timezone)
-                    if window_start_dt_str == window_end_dt_str:
-                        window_end_dt_str = self.remove_hours_local(end_window + timedelta(
-                            days=1), timezone)
-                else:
-                    window_start_dt_str = self.remove_minutes_local(start_window, timezone)
-                    window_end_dt_str = self.remove_minutes_local(end_window, timezone)
-                    if window_start_dt_str == window_end_dt_str:
-                        # E1008: Unsupported Stats Query: End time should be after start time.
-                        # Snapchat ADs throws above error if both start and end_time are equal.
-                        # add delta of one hour to end_window and remove minutes from it.
-                        window_end_dt_str = self.remove_minutes_local(end_window + timedelta(
-                            hours=1), timezone)
-
-                params[bookmark_query_field_from] = window_start_dt_str
-                params[bookmark_query_field_to] = window_end_dt_str
-
-            # This loop will run once for non-country_code endpoints
-            #   and one or more times (for each country) for country_code endpoints
-            for country_code in country_code_list:
-                # Path
-                if stream_name.startswith('targeting_'):
-                    path = base_path.format(
-                        targeting_group=targeting_group,
-                        targeting_type=targeting_type,
-                        country_code=country_code,
-                        parent_id=parent_id)
-                else:
-                    path = base_path.format(
-                        country_code=country_code,
-                        parent_id=parent_id)
-
-                # pagination: loop thru all pages of data using next (if not None)
-                #   Reference: https://developers.snapchat.com/api/docs/#pagination
-                total_records = 0
-                offset = 1
-                page = 1
-                if paging:
-                    limit = api_limit # Allowed values: 50 - 1000
-                    params['limit'] = limit
-                else:
-                    limit = None
-
-                for key, val in params.items():
-                    # Replace variables in params
-                    new_val = str(val).format(
-                        swipe_up_attribution_window=swipe_up_attribution_window,
-                        view_attribution_window=view_attribution_window)
-                    params[key] = new_val
-                # Create QueryString from params dict using urlencode
-                querystring = urlencode(params)
-                # initialize next_url
-                next_url = '{}/{}?{}'.format(
-                    client.base_url,
-                    path,
-                    querystring)
-
-                # pagination loop
-                while next_url is not None:
-
-                    # API request data
-                    data = {}
-                    try:
-                        # checks if profiles are selected, if not extracts data for all orgs and ad_accounts
-                        if config.get('org_account_ids', []) and stream_name in ['organizations', 'ad_accounts']:
-                            data = self.extract_selected_profile_data(config, client, data_key_array, parent_id)
-                            data['request_status'] = 'SUCCESS'
-                        else:
-                            data = client.get(url=next_url, endpoint=stream_name)
-                    except Exception as err:
-                        LOGGER.error('{}'.format(err))
-                        LOGGER.error('URL for Stream {}: {}'.format(stream_name, next_url))
-                        raise
-
-                    # time_extracted: datetime when the data was extracted from the API
-                    time_extracted = utils.now()
-                    if not data or data is None or data == {}:
-                        LOGGER.info('No data results returned')
-                        total_records = 0
-                        break # No data results
-
-                    request_status = data.get('request_status')
-                    if request_status != 'SUCCESS':
-                        raise RuntimeError(data)
-
-                    # Get pagination next_url
-                    next_url = data.get('paging', {}).get('next_link', None)
-
-                    # Transform data with transform_json from transform.py
-                    # The data_key_array identifies the array/list of records below the <root> element
-                    transformed_data = [] # initialize the record list
-
-                    # Reports stats streams de-nesting
-                    if '_stats_' in stream_name:
-                        for data_record in data.get(data_key_array, []):
-                            base_record = data_record.get(data_key_record, {})
-                            records = base_record.get('timeseries', [])
-                            for record in records:
-                                # Add parent base_record fields to record
-                                for key, val in base_record.items():
-                                    if key not in ('start_time', 'end_time', 'timeseries'):
-                                        record[key] = val
-
-                                # De-nest stats
-                                stats = record.get('stats', {})
-                                for key, val in stats.items():
-                                    record[key] = val
-                                record.pop('stats', None)
-
-                                # transform record
-                                try:
-                                    transformed_record = humps.decamelize(record)
-                                except Exception as err:
-                                    LOGGER.error('{}'.format(err))
-                                    raise
-
-                                # verify primary_keys are in tansformed_record
-                                if 'id' not in transformed_record or 'start_time' not in transformed_record:
-                                    LOGGER.error('Stream: {}, Missing key (id or start_time)'.format(
-                                        stream_name))
-                                    LOGGER.error('transformed_record: {}'.format(transformed_record))
-                                    raise RuntimeError
-
-                                transformed_data.append(transformed_record)
-                                # End for record in records
-                            # End for data_record in array
-                        # End stats stream
-
-                    # Other streams de-nesting
-                    else: # Not stats stream
-                        for data_record in data.get(data_key_array, []):
-                            sub_request_status = data_record.get('sub_request_status')
-                            if sub_request_status != 'SUCCESS':
-                                raise RuntimeError(data_record)
-
-                            record = data_record.get(data_key_record, {})
-                            # Transforms to align schemas for targeting streams
-                            if stream_name.startswith('targeting_'):
-                                record['targeting_group'] = targeting_group
-                                record['targeting_type'] = targeting_type
-                                if country_code != 'none':
-                                    record['country_code'] = country_code
-                                if targeting_group == 'geo':
-                                    record_id = record.get(targeting_type, {}).get('id')
-                                    record_name = record.get(targeting_type, {}).get('name')
-                                    record['id'] = record_id
-                                    record['name'] = record_name
-                                if targeting_type == 'postal_code':
-                                    record_id = record.get('postalCode')
-                                    record['id'] = record_id
-                                    record['name'] = record_id
-                                    record.pop('postalCode')
-
-                            # Add parent id field/value
-                            if parent and parent_id:
-                                parent_key = '{}_id'.format(parent)
-                                record[parent_key] = parent_id
-
-                            # transform record (remove inconsistent use of CamelCase)
-                            try:
-                                transformed_record = humps.decamelize(record)
-                            except Exception as err:
-                                LOGGER.error('{}'.format(err))
-                                LOGGER.error('error record: {}'.format(record))
-                                raise
-
-                            # verify primary_keys are in tansformed_record
-                            for key in id_fields:
-                                if not transformed_record.get(key):
-                                    LOGGER.error('Stream: {}, Missing key {}'.format(
-                                        stream_name, key))
-                                    LOGGER.info('transformed_record: {}'.format(transformed_record))
-                                    raise RuntimeError
-
-                            transformed_data.append(transformed_record)
-                            # End for data_record in array
-                        # End non-stats stream
-
-                    if not transformed_data or transformed_data is None:
-                        LOGGER.info('No transformed data for data = {}'.format(data))
-                        total_records = 0
-                        break # No transformed_data results
-
-                    # Process records and get the max_bookmark_value and record_count if stream is selected in catalog
-                    record_count = 0
-                    if stream_name in selected_streams and stream_name in sync_streams:
-                        max_bookmark_value, record_count = self.process_records(
-                            catalog=catalog,
-                            stream_name=stream_name,
-                            records=transformed_data,
-                            time_extracted=time_extracted,
-                            bookmark_field=bookmark_field,
-                            max_bookmark_value=max_bookmark_value,
-                            last_datetime=last_datetime)
-                        LOGGER.info('Stream {}, batch processed {} records'.format(
-                            stream_name, record_count))
-                    # Loop thru parent batch records for each children objects (if should stream)
-                    children = stream_class.children
-                    if children:
-                        for child_stream_name in children:
-                            if child_stream_name in sync_streams:
-                                LOGGER.info('START Syncing: {}'.format(child_stream_name))
-                                self.write_schema(catalog, child_stream_name, sync_streams, selected_streams)
-                                # For each parent record
-                                for record in transformed_data:
-                                    i = 0
-                                    # Set parent_id
-                                    for id_field in id_fields:
-                                        if i == 0:
-                                            parent_id_field = id_field
-                                        if id_field == 'id':
-                                            parent_id_field = id_field
-                                        i = i + 1
-                                    parent_id = record.get(parent_id_field)
-
-                                    if stream_name == 'ad_accounts':
-                                        timezone_desc = record.get('timezone', timezone_desc)
-
-                                    # set currently syncing as child stream
-                                    update_currently_syncing(state, child_stream_name)
-                                    # sync_endpoint for child
-                                    LOGGER.info(
-                                        'START Sync for Stream: {}, parent_stream: {}, parent_id: {}'\
-                                            .format(child_stream_name, stream_name, parent_id))
-
-                                    child_total_records = self.sync_endpoint(
-                                        client=client,
-                                        config=config,
-                                        catalog=catalog,
-                                        state=state,
-                                        stream_name=child_stream_name,
-                                        stream_class=STREAMS[child_stream_name],
-                                        sync_streams=sync_streams,
-                                        selected_streams=selected_streams,
-                                        timezone_desc=timezone_desc,
-                                        parent_id=parent_id)
-
-                                    LOGGER.info(
-                                        'FINISHED Sync for Stream: {}, parent_id: {}, total_records: {}'\
-                                            .format(child_stream_name, parent_id, child_total_records))
-                                    # End transformed data record loop
-                                # End if child in sync_streams
-                            # End child streams for parent
-                        # End if children
-
-                    # Parent record batch
-                    total_records = total_records + record_count
-                    endpoint_total = endpoint_total + record_count
-
-                    LOGGER.info('Synced Stream: {}, page: {}, records: {} to {}'.format(
-                        stream_name,
-                        page,
-                        offset,
-                        total_records))
-                    # Pagination: increment the offset by the limit (batch-size) and page
-                    if limit:
-                        offset = offset + limit
-                    page = page + 1
-                    # End page/batch - while next URL loop
-                # End country_code loop
+            # pagination: loop thru all pages of data of each country
+            last_country_code = None
+            total_records, offset, page = 0, 1, 1
+            for country_code, transformed_data, time_extracted in pages:
+                # each country starts from the first page
+                if country_code != last_country_code:
+                    last_country_code = country_code
+                    total_records, offset, page = 0, 1, 1
+                limit = api_limit if stream_class.paging else None
+
+                # Process records and get the max_bookmark_value and record_count if stream is selected in catalog
+                record_count = 0
+                if stream_name in selected_streams and stream_name in sync_streams:
+                    records = transformed_data
+                    if listings is not None:
+                        if country_code not in listings:
+                            listings[country_code] = fingerprint_store.start(
+                                stream_name, '{}:{}'.format(parent_id or '', country_code), id_fields)
+                        records = listings[country_code].changed(transformed_data)
+                    elif stats_dedupe is not None and bookmark_query_field_from:
+                        records = stats_dedupe.filter_changed(stream_name, transformed_data)
+                    max_bookmark_value, record_count = self.process_records(
+                        catalog=catalog,
+                        stream_name=stream_name,
+                        records=records,
+                        time_extracted=time_extracted,
+                        bookmark_field=bookmark_field,
+                        max_bookmark_value=max_bookmark_value,
+                        last_datetime=last_datetime)
+                    if stats_dedupe is not None and listings is None and bookmark_query_field_from:
+                        stats_dedupe.record_written(stream_name, records, bookmark_field, last_datetime)
+                    LOGGER.info('Stream {}, batch processed {} records'.format(
+                        stream_name, record_count))
+                # Hand the parent records of the page to the scheduler for its child streams
+                if any(child_stream_name in sync_streams for child_stream_name in child_streams):
+                    # (parent_id, timezone_desc) for each parent record
+                    child_parents = [
+                        self.get_child_parent(stream_name, id_fields, record, timezone_desc)
+                        for record in transformed_data]
+                    updated_at = [record.get('updated_at') for record in transformed_data]
+                    # release the page while the children sync
+                    transformed_data = None
+                    yield ParentPage(stream_name, child_parents, updated_at)
+
+                # Parent record batch
+                total_records = total_records + record_count
+                endpoint_total = endpoint_total + record_count
+
+                LOGGER.info('Synced Stream: {}, page: {}, records: {} to {}'.format(
+                    stream_name,
+                    page,
+                    offset,
+                    total_records))
+                # Pagination: increment the offset by the limit (batch-size) and page
+                if limit:
+                    offset = offset + limit
+                page = page + 1
+                # End page/batch loop
 
             # Update the state with the max_bookmark_value for the stream date window
             # Snapchat Ads API does not allow page/batch sorting; bookmark written for date window
             # If current stream has children then parent_id value will be changed, so we are using base_parent for current stream's bookmark writing
             if bookmark_field and stream_name in selected_streams:
                 self.write_bookmark(state, stream_name, max_bookmark_value, bookmark_field, parent, base_parent)
-
-            # Increment date window and sum endpoint_total
-            start_window = end_window
-            next_end_window = end_window + timedelta(days=date_window_size)
-            if next_end_window > now_datetime:
-                end_window = now_datetime
-            else:
-                end_window = next_end_window
             # End date window
 
+        # The stats of an entity which ended are final, do not request them again
+        final_bookmark = self.get_final_bookmark(max_bookmark_value, lifetime_bounds, now_datetime)
+        if final_bookmark and bookmark_field and stream_name in selected_streams:
+            self.write_bookmark(state, stream_name, final_bookmark, bookmark_field, parent, base_parent)
+
+        # The next runs start from the window size in use
+        if window_sizer:
+            self.write_window_size(state, stream_name, window_sizer.days)
+
+        # The listing is complete, store its fingerprints and signal the deleted records
+        for country_code, listing in (listings or {}).items():
+            deleted_records = listing.finish()
+            endpoint_total = endpoint_total + self.write_deleted_records(
+                catalog, stream_name, stream_class, deleted_records, country_code, parent_id)
+
         # Return total_records (for all pages and date windows)
         return endpoint_total
 
@@ -914,6 +1380,7 @@ class CampaignStatsDaily(SnapchatAds):
     date_window_size = 30
     paging = False
     parent = 'campaign'
+    breakdown = 'campaign'
     params = {
         'fields': ALL_STATS_FIELDS,
         'granularity': 'DAY',
@@ -941,6 +1408,7 @@ class CampaignStatsHourly(SnapchatAds):
     date_window_size = 7
     paging = False
     parent = 'campaign'
+    breakdown = 'campaign'
     params = {
         'fields': get_hourly_stats_fields(),
         'granularity': 'HOUR',
@@ -984,6 +1452,7 @@ class AdSquadStatsDaily(SnapchatAds):
     date_window_size = 30
     paging = False
     parent = 'ad_squad'
+    breakdown = 'adsquad'
     params = {
         'fields': ALL_STATS_FIELDS,
         'granularity': 'DAY',
@@ -1011,6 +1480,7 @@ class AdSquadStatsHourly(SnapchatAds):
     date_window_size = 7
     paging = False
     parent = 'ad_squad'
+    breakdown = 'adsquad'
     params = {
         'fields': get_hourly_stats_fields(),
         'granularity': 'HOUR',
@@ -1054,6 +1524,7 @@ class AdStatsDaily(SnapchatAds):
     date_window_size = 30
     paging = False
     parent = 'ad'
+    breakdown = 'ad'
     params = {
         'fields': ALL_STATS_FIELDS,
         'granularity': 'DAY',
@@ -1081,6 +1552,7 @@ class AdStatsHourly(SnapchatAds):
     date_window_size = 7
     paging = False
     parent = 'ad'
+    breakdown = 'ad'
     params = {
         'fields': get_hourly_stats_fields(),
         'granularity': 'HOUR',
@@ -1,10 +1,23 @@
 import singer
-from tap_snapchat_ads.streams import STREAMS, ROOT_STREAMS, update_currently_syncing
+from tap_snapchat_ads.checkpoint import open_checkpoints
+from tap_snapchat_ads.fingerprints import open_fingerprint_store
+from tap_snapchat_ads.hierarchy import open_hierarchy_index
+from tap_snapchat_ads.lookback import LookbackPolicy
+from tap_snapchat_ads.parallel import SyncPool
+from tap_snapchat_ads.pruning import BOOKMARK_PRUNER
+from tap_snapchat_ads.scheduler import BREAKDOWN_PARENT_STREAM, use_stats_breakdown
+from tap_snapchat_ads.state_layout import expand_state
+from tap_snapchat_ads.stats_cache import evict_stats_cache
+from tap_snapchat_ads.stats_dedupe import open_stats_dedupe
+from tap_snapchat_ads.streams import STREAMS, ROOT_STREAMS, SnapchatAds, update_currently_syncing
 
 LOGGER = singer.get_logger()
 
 # Function for sync mode
 def sync(client, config, catalog, state):
+    # the per-parent bookmarks of a compact state (compact_state) are read with the legacy keys
+    expand_state(state)
+
     # Get selected_streams from catalog, based on state last_stream
     #   last_stream = Previous currently synced stream, if the load was interrupted
     last_stream = singer.get_currently_syncing(state)
@@ -28,6 +41,11 @@ def sync(client, config, catalog, state):
         parent_stream = stream_class.parent_stream
         grandparent_stream = stream_class.grandparent_stream
         great_grandparent_stream = stream_class.great_grandparent_stream
+        if use_stats_breakdown(config, stream_class):
+            # account-level stats with a breakdown, synced for each ad account
+            parent_stream = BREAKDOWN_PARENT_STREAM
+            grandparent_stream = STREAMS[parent_stream].parent_stream
+            great_grandparent_stream = None
 
         if stream_name in selected_streams:
             LOGGER.info('stream: {}, parent: {}, grandparent: {}, great_grandparent: {}'.format(
@@ -41,15 +59,41 @@ def sync(client, config, catalog, state):
             if great_grandparent_stream and great_grandparent_stream not in sync_streams:
                 sync_streams.append(great_grandparent_stream)
     LOGGER.info('Sync Streams: {}'.format(sync_streams))
+    # sets for the membership checks made for every page
+    selected_streams = frozenset(selected_streams)
+    sync_streams = frozenset(sync_streams)
+
+    # max_parallel_parents: number of worker threads shared by the root streams
+    #   and by the child streams of different parent records
+    max_parallel_parents = int(config.get('max_parallel_parents') or 1)
+    LOGGER.info('max_parallel_parents: {}'.format(max_parallel_parents))
+
+    # lookback_policy: how far back the stats are re-synced before their bookmarks in this run
+    lookback_policy = LookbackPolicy(config, state)
+    # the bookmarks read and written are tracked for the pruning at the end of the sync
+    BOOKMARK_PRUNER.configure(config)
+    # the cached stats responses not used for stats_cache_retention_days are removed
+    evict_stats_cache(config)
 
-    # Loop through selected_streams
-    # Loop through endpoints in selected_streams
-    for stream_name, stream_class in ROOT_STREAMS.items():
-        if stream_name in sync_streams:
+    # hierarchy_index: the parent records cached from the previous runs (hierarchy_cache_dir)
+    # fingerprint_store: the FULL_TABLE records written by the previous runs (fingerprint_cache_dir)
+    # stats_dedupe: the stats rows written by the previous runs (stats_dedupe_dir)
+    # the state changes are written at most every state_interval_seconds/records, and when the sync ends or fails
+    with open_checkpoints(config, state), \
+            SyncPool(state, max_parallel_parents, list(STREAMS), update_currently_syncing) as pool, \
+            open_hierarchy_index(config) as hierarchy_index, \
+            open_fingerprint_store(config, state) as fingerprint_store, \
+            open_stats_dedupe(config, state, SnapchatAds.get_attribution_windows(config)[2]) as stats_dedupe:
+
+        def sync_root_stream(stream_name):
+            stream_class = ROOT_STREAMS[stream_name]
             stream_obj = stream_class()
             LOGGER.info('START Syncing: {}'.format(stream_name))
             stream_obj.write_schema(catalog, stream_name, sync_streams, selected_streams)
-            update_currently_syncing(state, stream_name)
+            if pool.parallel:
+                pool.start_stream(stream_name)
+            else:
+                update_currently_syncing(state, stream_name)
 
             total_records = stream_obj.sync_endpoint(
                 client=client,
@@ -57,15 +101,40 @@ def sync(client, config, catalog, state):
                 catalog=catalog,
                 state=state,
                 stream_name=stream_name,
-                stream_class=stream_class,
                 sync_streams=sync_streams,
-                selected_streams=selected_streams)
+                selected_streams=selected_streams,
+                pool=pool,
+                hierarchy_index=hierarchy_index,
+                fingerprint_store=fingerprint_store,
+                lookback_policy=lookback_policy,
+                stats_dedupe=stats_dedupe)
 
-            update_currently_syncing(state, None)
+            # a failed stream stays in flight so currently_syncing never moves past it
+            if pool.parallel:
+                pool.finish_stream(stream_name)
+            else:
+                update_currently_syncing(state, None)
             LOGGER.info('FINISHED Syncing: {}, total_records: {}'.format(
                 stream_name,
                 total_records))
 
+        # Loop through selected_streams
+        # Loop through endpoints in selected_streams
+        root_streams = [stream_name for stream_name in ROOT_STREAMS if stream_name in sync_streams]
+        if pool.parallel:
+            # The root streams (organizations and each targeting stream) share no data,
+            #   sync them at the same time with the same workers as the child streams
+            pool.run_all(sync_root_stream, root_streams)
+            update_currently_syncing(state, None)
+        else:
+            for stream_name in root_streams:
+                sync_root_stream(stream_name)
+
+    lookback_policy.finish()
+
+    # prune_bookmarks: the bookmarks of the parents not seen in this (completed) sync are removed
+    BOOKMARK_PRUNER.prune(state, selected_streams & sync_streams)
+
     # remove currently_syncing at the end of the sync this will help in
     # edge case scenario by handling infinite loop of empty state file
     update_currently_syncing(state, None)
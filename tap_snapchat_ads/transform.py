@@ -0,0 +1,257 @@
+import decimal
+import functools
+import re
+from singer import Transformer
+from singer.transform import string_to_datetime
+
+# Value returned by a compiled node when the data does not match its schema
+FAILED = object()
+# Distinct date-time strings kept parsed, the stats rows of a window share a few hundred
+DATETIME_CACHE_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def parse_datetime(value):
+    return string_to_datetime(value)
+
+
+def is_filtered(stream_metadata, breadcrumb):
+    """Same rule as singer's Transformer.filter_data_by_metadata"""
+    if not stream_metadata:
+        return False
+    field_metadata = stream_metadata.get(breadcrumb, {})
+    if field_metadata.get('inclusion') == 'automatic':
+        return False
+    return field_metadata.get('selected') is False or field_metadata.get('inclusion') == 'unsupported'
+
+
+def identity(data):
+    return data
+
+
+def transform_null(data):
+    return None if data is None or data == '' else FAILED
+
+
+def transform_datetime(data):
+    if data is None or data == '':
+        return FAILED
+    value = parse_datetime(data) if isinstance(data, str) else string_to_datetime(data)
+    return FAILED if value is None else value
+
+
+def transform_decimal(data):
+    if isinstance(data, (str, float, int)):
+        try:
+            return str(decimal.Decimal(str(data)))
+        except Exception: # pylint: disable=broad-except
+            return FAILED
+    if isinstance(data, decimal.Decimal):
+        try:
+            return 'NaN' if data.is_snan() else str(data)
+        except Exception: # pylint: disable=broad-except
+            return FAILED
+    return FAILED
+
+
+def transform_string(data):
+    if data is None:
+        return FAILED
+    if type(data) is str: # pylint: disable=unidiomatic-typecheck
+        return data
+    try:
+        return str(data)
+    except Exception: # pylint: disable=broad-except
+        return FAILED
+
+
+def transform_integer(data):
+    if type(data) is int: # pylint: disable=unidiomatic-typecheck
+        return data
+    if isinstance(data, str):
+        data = data.replace(',', '')
+    try:
+        return int(data)
+    except Exception: # pylint: disable=broad-except
+        return FAILED
+
+
+def transform_number(data):
+    if type(data) is float: # pylint: disable=unidiomatic-typecheck
+        return data
+    if isinstance(data, str):
+        data = data.replace(',', '')
+    try:
+        return float(data)
+    except Exception: # pylint: disable=broad-except
+        return FAILED
+
+
+def transform_boolean(data):
+    if isinstance(data, str) and data.lower() == 'false':
+        return False
+    try:
+        return bool(data)
+    except Exception: # pylint: disable=broad-except
+        return FAILED
+
+
+def transform_unknown(data): # pylint: disable=unused-argument
+    return FAILED
+
+
+def nullable(node):
+    """Returns the node of a ['null', type] schema, most properties of the schemas"""
+    def transform(data):
+        value = node(data)
+        if value is FAILED and (data is None or data == ''):
+            return None
+        return value
+    return transform
+
+
+def first_of(nodes):
+    """Returns the node trying the nodes in order, the first matching one gives the value"""
+    if len(nodes) == 1:
+        return nodes[0]
+    if len(nodes) == 2 and nodes[1] is transform_null:
+        return nullable(nodes[0])
+
+    def transform(data):
+        for node in nodes:
+            value = node(data)
+            if value is not FAILED:
+                return value
+        return FAILED
+    return transform
+
+
+def compile_object(schema, stream_metadata, breadcrumb):
+    properties = schema.get('properties', {})
+    pattern_properties = schema.get('patternProperties')
+    if properties == {} and not pattern_properties:
+        return lambda data: data if isinstance(data, dict) else FAILED
+
+    # the fields filtered by the metadata are left out of the plan
+    fields = {
+        key: compile_schema(sub_schema, stream_metadata, breadcrumb + ('properties', key))
+        for key, sub_schema in properties.items()
+        if not is_filtered(stream_metadata, breadcrumb + ('properties', key))}
+    if pattern_properties:
+        return compile_pattern_object(fields, pattern_properties, stream_metadata, breadcrumb)
+
+    def transform(data):
+        if not isinstance(data, dict):
+            return FAILED
+        result = {}
+        failed = False
+        for key, value in data.items():
+            node = fields.get(key)
+            # the fields missing from the schema are removed
+            if node is not None:
+                value = node(value)
+                if value is FAILED:
+                    failed = True
+                    value = None
+                result[key] = value
+        return FAILED if failed else result
+    return transform
+
+
+def compile_pattern_object(fields, pattern_properties, stream_metadata, breadcrumb):
+    patterns = [(re.compile(pattern), pattern_schema) for pattern, pattern_schema in pattern_properties.items()]
+    pattern_nodes = {}
+
+    def get_node(key):
+        if key in fields:
+            return fields[key]
+        if key not in pattern_nodes:
+            key_breadcrumb = breadcrumb + ('properties', key)
+            pattern_schemas = [pattern_schema for pattern, pattern_schema in patterns if pattern.match(key)]
+            pattern_nodes[key] = None if not pattern_schemas or is_filtered(stream_metadata, key_breadcrumb) \
+                else compile_schema({'anyOf': pattern_schemas}, stream_metadata, key_breadcrumb)
+        return pattern_nodes[key]
+
+    def transform(data):
+        if not isinstance(data, dict):
+            return FAILED
+        result = {}
+        failed = False
+        for key, value in data.items():
+            node = get_node(key)
+            if node is not None:
+                value = node(value)
+                if value is FAILED:
+                    failed = True
+                    value = None
+                result[key] = value
+        return FAILED if failed else result
+    return transform
+
+
+def compile_array(schema, stream_metadata, breadcrumb):
+    item_node = compile_schema(schema.get('items', {}), stream_metadata, breadcrumb + ('items',))
+
+    def transform(data):
+        if not isinstance(data, list):
+            return FAILED
+        result = [item_node(item) for item in data]
+        return FAILED if any(value is FAILED for value in result) else result
+    return transform
+
+
+def compile_type(typ, schema, stream_metadata, breadcrumb):
+    """Returns the node of one type of a schema, same order of checks as singer's Transformer._transform"""
+    if typ == 'null':
+        return transform_null
+    if schema.get('format') == 'date-time':
+        return transform_datetime
+    if schema.get('format') == 'singer.decimal':
+        return transform_decimal
+    if typ == 'object':
+        return compile_object(schema, stream_metadata, breadcrumb)
+    if typ == 'array':
+        return compile_array(schema, stream_metadata, breadcrumb)
+    return {
+        'string': transform_string,
+        'integer': transform_integer,
+        'number': transform_number,
+        'boolean': transform_boolean
+    }.get(typ, transform_unknown)
+
+
+def compile_schema(schema, stream_metadata, breadcrumb=()):
+    """
+    Returns a function transforming data for the schema: the value, or FAILED if the data
+    does not match the schema. The types are tried in order, 'null' last, same as singer.
+    """
+    if 'anyOf' in schema:
+        return first_of([compile_schema(sub_schema, stream_metadata, breadcrumb) for sub_schema in schema['anyOf']])
+    if 'type' not in schema:
+        return identity
+
+    types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+    types = [typ for typ in types if typ != 'null'] + (['null'] if 'null' in types else [])
+    return first_of([compile_type(typ, schema, stream_metadata, breadcrumb) for typ in types])
+
+
+class RecordTransformer:
+    """
+    Transformer of the records of a stream compiled once from its schema and metadata:
+    the fields not selected are left out and each field has its cast (date-time parse,
+    integer, number, ...) resolved ahead, instead of singer's Transformer walking the
+    schema for every record. The output is the same as Transformer.transform; a record
+    not matching the schema is transformed again with it to raise the same SchemaMismatch.
+    """
+
+    def __init__(self, schema, stream_metadata=None):
+        self.schema = schema
+        self.stream_metadata = stream_metadata or {}
+        self.__transform = compile_schema(schema, self.stream_metadata)
+
+    def transform(self, record):
+        transformed_record = self.__transform(record)
+        if transformed_record is FAILED:
+            with Transformer() as transformer:
+                return transformer.transform(dict(record), self.schema, self.stream_metadata)
+        return transformed_record
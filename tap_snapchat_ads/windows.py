@@ -0,0 +1,75 @@
+import json
+from requests.exceptions import ConnectionError, Timeout # pylint: disable=redefined-builtin
+from tap_snapchat_ads.client import Server5xxError, SnapchatError
+
+# Seconds a stats date window should take: faster windows grow, slower windows shrink
+WINDOW_TARGET_SECONDS = 20
+# Snapchat error code of a request which takes too long to process
+TOO_LONG_ERROR_CODE = 'E1008'
+
+
+def get_configured_window_sizes(config):
+    """Returns the {stream_name: days} date_window_sizes of the config, a dict or a JSON-encoded string"""
+    window_sizes = config.get('date_window_sizes') or {}
+    if isinstance(window_sizes, str):
+        window_sizes = json.loads(window_sizes)
+    return window_sizes
+
+
+def use_adaptive_windows(config, stream_class):
+    """The stats date windows adapt to the responses when `adaptive_date_windows` is enabled"""
+    return str(config.get('adaptive_date_windows', 'false')).lower() == 'true' and \
+        bool(stream_class.bookmark_query_field_from and stream_class.bookmark_query_field_to)
+
+
+def get_date_window_size(config, state, stream_name, stream_class, adaptive=True):
+    """
+    Returns the (initial, maximum) days of the date windows of a stream: the size of the config
+    (date_window_sizes) or of the stream class, and in adaptive mode the size recorded by the last run.
+    The syncs which do not size their windows with a WindowSizer (adaptive False) use the configured size.
+    """
+    max_days = int(get_configured_window_sizes(config).get(stream_name) or stream_class.date_window_size)
+    days = max_days
+    if adaptive and use_adaptive_windows(config, stream_class):
+        days = (state or {}).get('date_window_sizes', {}).get(stream_name) or max_days
+    return max(1, min(int(days), max_days)), max(1, max_days)
+
+
+def is_window_error(error):
+    """Timeouts, 5xx and E1008 (request takes too long) errors may succeed with a smaller window"""
+    if isinstance(error, (Timeout, ConnectionError, Server5xxError)):
+        return True
+    return isinstance(error, SnapchatError) and TOO_LONG_ERROR_CODE in str(error)
+
+
+class WindowSizer:
+    """
+    Days of the next date window of a stats stream: doubled after a window with no records or
+    answered in less than a quarter of the target seconds, halved after a window slower than
+    the target seconds or which failed with a timeout, a 5xx or an E1008 error. The windows
+    do not grow back to the size of a failed window.
+    """
+
+    def __init__(self, days, max_days, target_seconds=WINDOW_TARGET_SECONDS):
+        self.max_days = max(1, int(max_days))
+        self.days = max(1, min(int(days), self.max_days))
+        self.target_seconds = target_seconds
+
+    def observe(self, record_count, latency):
+        """Adapts the size to the number of records and the latency of the last window"""
+        if latency > self.target_seconds:
+            self.shrink()
+        elif record_count == 0 or latency < self.target_seconds / 4:
+            self.days = min(self.max_days, self.days * 2)
+
+    def fail(self):
+        """Halves the size after a failed window, returns False if the window is already 1 day"""
+        self.max_days = max(1, self.days - 1)
+        return self.shrink()
+
+    def shrink(self):
+        """Halves the size, returns False if the window is already 1 day"""
+        if self.days <= 1:
+            return False
+        self.days = max(1, self.days // 2)
+        return True
@@ -0,0 +1,64 @@
+"""
+Compares the bookmark tracking of process_records on a page of hourly stats rows: three
+date-time parses per row (as process_records did) or the BookmarkTracker epochs.
+
+    python tests/benchmarks/bookmark_benchmark.py [rows]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+import pytz
+from singer.utils import strptime_to_utc, strftime
+from tap_snapchat_ads.bookmarks import BookmarkTracker
+
+LAST_DATETIME = '2021-03-04T00:00:00.000000Z'
+
+
+def get_bookmarks(count):
+    """end_time of the rows of a 7 days hourly page, 168 rows per ad"""
+    start = datetime(2021, 3, 1, tzinfo=pytz.utc)
+    return [strftime(start + timedelta(hours=idx % 168 + 1)) for idx in range(count)]
+
+
+def track_parsed(bookmarks):
+    max_bookmark_value = None
+    written = 0
+    for bookmark_date in bookmarks:
+        bookmark_dttm = strptime_to_utc(bookmark_date)
+        last_dttm = strptime_to_utc(LAST_DATETIME)
+        if not max_bookmark_value:
+            max_bookmark_value = LAST_DATETIME
+        max_bookmark_dttm = strptime_to_utc(max_bookmark_value)
+        if bookmark_dttm > max_bookmark_dttm:
+            max_bookmark_value = strftime(bookmark_dttm)
+        if bookmark_dttm >= last_dttm:
+            written += 1
+    return max_bookmark_value, written
+
+
+def track_epochs(bookmarks):
+    bookmark_tracker = BookmarkTracker(LAST_DATETIME, None)
+    written = sum(1 for bookmark_date in bookmarks if bookmark_tracker.is_new(bookmark_date))
+    return bookmark_tracker.get_max_bookmark_value(), written
+
+
+def run(name, track, bookmarks):
+    started = time.perf_counter()
+    result = track(bookmarks)
+    elapsed = time.perf_counter() - started
+    print('{:<20} {:>8.3f} s {:>12.0f} rows/s'.format(name, elapsed, len(bookmarks) / elapsed))
+    return result, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    bookmarks = get_bookmarks(count)
+    expected, parsed_elapsed = run('parsed datetimes', track_parsed, bookmarks)
+    result, epochs_elapsed = run('BookmarkTracker', track_epochs, bookmarks)
+    if result != expected:
+        raise AssertionError('The max bookmarks differ: {} != {}'.format(result, expected))
+    print('speedup: {:.1f}x'.format(parsed_elapsed / epochs_elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares the size, serialize and parse time of a state with many ads, ad squads and
+campaigns: the legacy per-parent keys or the compact layout (CompactStateLayout).
+
+    python tests/benchmarks/state_layout_benchmark.py [parents]
+"""
+import json
+import sys
+import time
+import uuid
+from tap_snapchat_ads.state_layout import CompactStateLayout, expand_state
+
+WATERMARK = '2021-03-04T00:00:00.000000Z'
+BEHIND = '2021-03-03T00:00:00.000000Z'
+NEXT = '2021-03-05T00:00:00.000000Z'
+
+
+def get_state(count):
+    """Daily and hourly stats bookmarks of `count` ads, one ad squad per 10 ads, one campaign
+    per 10 ad squads, one in a hundred parents behind the watermark"""
+    bookmarks = {}
+    for parent, parent_count in (('campaign', count // 100), ('ad_squad', count // 10), ('ad', count)):
+        for stream_name in ('{}_stats_daily'.format(parent), '{}_stats_hourly'.format(parent)):
+            bookmarks[stream_name] = {
+                'end_time(parent_{}_id:{})'.format(parent, uuid.UUID(int=idx)): BEHIND if idx % 100 == 0 else WATERMARK
+                for idx in range(parent_count)}
+    return {'currently_syncing': 'ad_stats_hourly', 'bookmarks': bookmarks}
+
+
+def run(name, state, encode, decode, repeat=20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        message = json.dumps(encode(state))
+    serialize_elapsed = (time.perf_counter() - started) / repeat
+
+    started = time.perf_counter()
+    parsed = decode(json.loads(message))
+    parse_elapsed = time.perf_counter() - started
+    print('{:<20} {:>10} bytes {:>8.1f} ms serialize {:>8.1f} ms parse'.format(
+        name, len(message), serialize_elapsed * 1000, parse_elapsed * 1000))
+    return parsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    state = get_state(count)
+    layout = CompactStateLayout()
+
+    changed_keys = iter(list(state['bookmarks']['ad_stats_hourly']))
+
+    def encode_compact(state):
+        # a STATE message after the bookmark of an ad moved to the next window
+        key = next(changed_keys)
+        state['bookmarks']['ad_stats_hourly'][key] = NEXT
+        layout.mark_changed('ad_stats_hourly', [key])
+        return layout.encode(state)
+
+    # the layout is built from the state on the first message
+    layout.encode(state)
+    compact = run('compact layout', state, encode_compact, expand_state)
+    legacy = run('legacy keys', state, lambda state: state, lambda state: state)
+    if compact != legacy:
+        raise AssertionError('The parsed states differ')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares singer's Transformer (one per record, as process_records did) with the compiled
+RecordTransformer on hourly ad stats rows with all their fields selected.
+
+    python tests/benchmarks/transform_benchmark.py [rows]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from singer import Transformer, metadata
+from tap_snapchat_ads.schema import get_schemas
+from tap_snapchat_ads.transform import RecordTransformer
+
+STREAM_NAME = 'ad_stats_hourly'
+
+
+def get_rows(schema, count):
+    """Stats rows as transform_data returns them: 7 days of hours for count / 168 ads"""
+    start = datetime(2021, 3, 1)
+    rows = []
+    for idx in range(count):
+        start_time = start + timedelta(hours=idx % 168)
+        row = {
+            'id': 'ad-{}'.format(idx // 168),
+            'type': 'AD',
+            'granularity': 'HOUR',
+            'start_time': start_time.strftime('%Y-%m-%dT%H:00:00.000-08:00'),
+            'end_time': (start_time + timedelta(hours=1)).strftime('%Y-%m-%dT%H:00:00.000-08:00'),
+            'finalized_data_end_time': '2021-03-08T00:00:00.000-08:00'}
+        for field, field_schema in schema['properties'].items():
+            if field not in row:
+                types = field_schema.get('type', [])
+                row[field] = idx % 1000 if 'integer' in types else (idx % 1000) / 7 if 'number' in types else None
+        rows.append(row)
+    return rows
+
+
+def run(name, transform, rows):
+    started = time.perf_counter()
+    output = [transform(row) for row in rows]
+    elapsed = time.perf_counter() - started
+    print('{:<20} {:>8.3f} s {:>10.0f} rows/s'.format(name, elapsed, len(rows) / elapsed))
+    return output, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    schemas, field_metadata = get_schemas()
+    schema = schemas[STREAM_NAME]
+    stream_metadata = metadata.to_map(field_metadata[STREAM_NAME])
+    for breadcrumb in stream_metadata:
+        stream_metadata[breadcrumb]['selected'] = True
+    rows = get_rows(schema, count)
+
+    def transform_singer(row):
+        with Transformer() as transformer:
+            return transformer.transform(dict(row), schema, stream_metadata)
+
+    compiled = RecordTransformer(schema, stream_metadata)
+    expected, singer_elapsed = run('singer Transformer', transform_singer, rows)
+    output, compiled_elapsed = run('RecordTransformer', compiled.transform, rows)
+    if output != expected:
+        raise AssertionError('The compiled transformer output differs from singer')
+    print('speedup: {:.1f}x'.format(singer_elapsed / compiled_elapsed))
+
+
+if __name__ == '__main__':
+    main()
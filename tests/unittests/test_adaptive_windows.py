@@ -0,0 +1,99 @@
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatBadRequestError, SnapchatClient
+from tap_snapchat_ads.streams import STREAMS, SnapchatAds
+from tap_snapchat_ads.windows import WindowSizer, get_date_window_size
+
+NOW = strptime_to_utc("2021-01-29T00:00:00Z")
+
+class TestWindowSizer(unittest.TestCase):
+    """Test the date windows grow when the responses are small and fast, and shrink when they are slow"""
+
+    def test_grow_and_shrink(self):
+        sizer = WindowSizer(2, 7, target_seconds=20)
+
+        sizer.observe(record_count=0, latency=10)
+        self.assertEqual(sizer.days, 4)
+        sizer.observe(record_count=100, latency=1)
+        self.assertEqual(sizer.days, 7)
+        sizer.observe(record_count=100, latency=10)
+        self.assertEqual(sizer.days, 7)
+        sizer.observe(record_count=100, latency=30)
+        self.assertEqual(sizer.days, 3)
+        self.assertTrue(sizer.shrink())
+        self.assertFalse(sizer.shrink())
+        self.assertEqual(sizer.days, 1)
+
+    def test_failed_size_is_a_ceiling(self):
+        sizer = WindowSizer(7, 7)
+
+        self.assertTrue(sizer.fail())
+        sizer.observe(record_count=0, latency=1)
+        sizer.observe(record_count=0, latency=1)
+        self.assertEqual(sizer.days, 6)
+
+    def test_window_size(self):
+        stream_class = STREAMS["campaign_stats_hourly"]
+        state = {"date_window_sizes": {"campaign_stats_hourly": 2}}
+
+        self.assertEqual(get_date_window_size({}, state, "campaign_stats_hourly", stream_class), (7, 7))
+        self.assertEqual(get_date_window_size({"date_window_sizes": '{"campaign_stats_hourly": 3}'}, {},
+                                              "campaign_stats_hourly", stream_class), (3, 3))
+        # the size recorded by the last run is used in adaptive mode
+        self.assertEqual(get_date_window_size({"adaptive_date_windows": "true"}, state, "campaign_stats_hourly", stream_class), (2, 7))
+        # the syncs which do not adapt their windows (async stats, report jobs, breakdown) use the configured size
+        self.assertEqual(get_date_window_size({"adaptive_date_windows": "true"}, state, "campaign_stats_hourly", stream_class,
+                                              adaptive=False), (7, 7))
+
+    def test_configured_window_size(self):
+        windows = SnapchatAds.get_date_windows(STREAMS["campaign_stats_daily"], strptime_to_utc("2021-01-01T00:00:00Z"),
+                                               NOW, 1, date_window_size=7)
+
+        self.assertEqual(len(windows), 4)
+
+    def test_non_stats_window_whole_days(self):
+        """The single window of a non-stats stream covers all the days since the bookmark"""
+        windows = SnapchatAds.get_date_windows(STREAMS["campaigns"], strptime_to_utc("2021-01-01T00:00:00Z"), NOW, 28)
+
+        self.assertEqual(windows, [(strptime_to_utc("2021-01-01T00:00:00Z"), NOW)])
+
+def mocked_get(url, endpoint):
+    """Mocked get function: the stats requests of more than 2 days fail with E1008"""
+    query = parse_qs(urlparse(url).query)
+    start_time, end_time = strptime_to_utc(query["start_time"][0]), strptime_to_utc(query["end_time"][0])
+    if (end_time - start_time).days > 2:
+        raise SnapchatBadRequestError("400, E1008: Request takes too long to process")
+    return {"request_status": "SUCCESS", "timeseries_stats": []}
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", side_effect=mocked_get)
+@mock.patch("tap_snapchat_ads.streams.utils.now", return_value=NOW)
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+class TestAdaptiveWindowsSync(unittest.TestCase):
+    """Test the windows failing with E1008 are requested again with a smaller size"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+
+    def test_split_windows(self, mocked_write_bookmark, mocked_now, mocked_get, mocked_access_token):
+        stream_name = "campaign_stats_hourly"
+        state = {}
+        list(STREAMS[stream_name]().iter_endpoint(
+            client=self.client, config={"start_date": "2021-01-15T00:00:00Z", "adaptive_date_windows": "true"},
+            catalog=None, state=state, stream_name=stream_name, stream_class=STREAMS[stream_name],
+            sync_streams=[stream_name], selected_streams=[stream_name], parent_id="c1"))
+
+        windows = []
+        for call in mocked_get.mock_calls:
+            query = parse_qs(urlparse(call.kwargs["url"]).query)
+            windows.append((strptime_to_utc(query["start_time"][0]), strptime_to_utc(query["end_time"][0])))
+        synced_windows = [window for window in windows if (window[1] - window[0]).days <= 2]
+        # the failed windows are split, the windows synced cover the attribution window up to now
+        self.assertGreater(len(windows), len(synced_windows))
+        self.assertEqual(synced_windows[0][0], strptime_to_utc("2021-01-01T00:00:00Z"))
+        self.assertEqual(synced_windows[-1][1], NOW)
+        for previous_window, window in zip(synced_windows, synced_windows[1:]):
+            self.assertEqual(previous_window[1], window[0])
+        self.assertEqual(mocked_write_bookmark.call_count, len(synced_windows))
+        self.assertEqual(state["date_window_sizes"][stream_name], 2)
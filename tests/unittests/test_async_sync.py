@@ -0,0 +1,173 @@
+import asyncio
+import unittest
+from unittest import mock
+from singer.utils import strptime_to_utc
+import tap_snapchat_ads.client as client
+from tap_snapchat_ads.async_client import AsyncSnapchatClient, aiohttp
+from tap_snapchat_ads.async_sync import MAX_PARENT_WINDOWS
+from tap_snapchat_ads.scheduler import AsyncioExecutor, ChildBatch, SerialExecutor
+from tap_snapchat_ads.streams import SnapchatAds, STREAMS
+
+class MockedResponse:
+    """Mocked aiohttp response, used as an async context manager"""
+    def __init__(self, status, text, headers=None):
+        self.status = status
+        self._text = text
+        self.headers = headers or {}
+
+    async def text(self):
+        return self._text
+
+    async def json(self, content_type=None):
+        return {"access_token": "token", "expires_in": 3600}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+class MockedAsyncClient:
+    """Mocked AsyncSnapchatClient returning one stats record per date window"""
+    base_url = "https://adsapi.snapchat.com/v1"
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        self.urls = []
+        self.closed = False
+        self.in_flight = 0
+        self.max_in_flight = 0
+        MockedAsyncClient.instances.append(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.closed = True
+        return False
+
+    async def get(self, url, **kwargs):
+        # answer the later windows first, records must still be written in window order
+        params = dict(param.split("=") for param in url.split("?")[1].split("&"))
+        start_time = params["start_time"].replace("%3A", ":")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001 if start_time.startswith("2021-01-0") else 0)
+        self.in_flight -= 1
+        parent_id = url.split("/campaigns/")[1].split("/")[0]
+        return {
+            "request_status": "SUCCESS",
+            "timeseries_stats": [{"sub_request_status": "SUCCESS", "timeseries_stat": {
+                "id": parent_id, "type": "CAMPAIGN", "granularity": "DAY",
+                "timeseries": [{"start_time": start_time, "end_time": params["end_time"].replace("%3A", ":"), "stats": {"spend": 1}}]}}]
+        }
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+@mock.patch("time.sleep")
+@mock.patch("asyncio.sleep", new_callable=lambda: mock.AsyncMock(return_value=None))
+class TestAsyncClientErrorHandling(unittest.TestCase):
+    """Test the async client raises the same errors as SnapchatClient"""
+
+    async def request(self, status, text):
+        async with AsyncSnapchatClient("test", "test", "test", 300) as async_client:
+            with mock.patch("aiohttp.ClientSession.request", return_value=MockedResponse(status, text)):
+                return await async_client.get("https://adsapi.snapchat.com/v1/me")
+
+    @mock.patch("aiohttp.ClientSession.post", return_value=MockedResponse(200, ""))
+    def test_400_error_response_message(self, mocked_post, mocked_async_sleep, mocked_sleep):
+        """Test 400 error message from response"""
+        with self.assertRaises(client.SnapchatBadRequestError) as e:
+            asyncio.run(self.request(400, '{"debug_message": "This mesaage from response 400."}'))
+
+        self.assertEqual(str(e.exception), "400: This mesaage from response 400.")
+
+    @mock.patch("aiohttp.ClientSession.post", return_value=MockedResponse(200, ""))
+    def test_429_error_is_retried(self, mocked_post, mocked_async_sleep, mocked_sleep):
+        """Test 429 errors are retried 7 times"""
+        with mock.patch("aiohttp.ClientSession.request", return_value=MockedResponse(429, "")) as mocked_request:
+            async def request():
+                async with AsyncSnapchatClient("test", "test", "test", 300) as async_client:
+                    return await async_client.get("https://adsapi.snapchat.com/v1/me")
+
+            with self.assertRaises(client.Server429Error):
+                asyncio.run(request())
+
+        self.assertEqual(mocked_request.call_count, 7)
+
+    @mock.patch("aiohttp.ClientSession.post", return_value=MockedResponse(200, ""))
+    def test_successful_response(self, mocked_post, mocked_async_sleep, mocked_sleep):
+        """Test the json response is returned"""
+        data = asyncio.run(self.request(200, '{"request_status": "SUCCESS"}'))
+
+        self.assertEqual(data, {"request_status": "SUCCESS"})
+
+@mock.patch("tap_snapchat_ads.async_sync.AsyncSnapchatClient", MockedAsyncClient)
+@mock.patch("tap_snapchat_ads.async_sync.utils.now")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.process_records", side_effect=lambda **kwargs: (kwargs["records"][-1]["end_time"], len(kwargs["records"])))
+class TestAsyncStatsSync(unittest.TestCase):
+    """Test the asyncio stats engine"""
+
+    config = {"start_date": "2021-01-01T00:00:00Z", "client_id": "id", "client_secret": "secret", "refresh_token": "token"}
+    stream_name = "campaign_stats_daily"
+
+    def setUp(self):
+        MockedAsyncClient.instances = []
+
+    def get_scheduler(self, config=None, pool=None):
+        return mock.Mock(stream_obj=SnapchatAds(), streams=STREAMS, config=config or self.config, catalog=None, state={},
+                         client=None, pool=pool, lookback_policy=None, stats_dedupe=None,
+                         sync_streams=[self.stream_name], selected_streams=[self.stream_name])
+
+    def test_records_written_in_window_order(self, mocked_process_records, mocked_write_bookmark, mocked_now):
+        """Records and bookmarks of every parent are written in date window order"""
+        mocked_now.return_value = strptime_to_utc("2021-03-15T00:00:00Z")
+
+        with AsyncioExecutor(SerialExecutor()) as executor:
+            executor.run_batch(self.get_scheduler(), ChildBatch(self.stream_name, "campaigns", [("c1", None), ("c2", "America/Los_Angeles")]))
+
+        # 3 windows of 30 days from 2021-01-01 to 2021-03-15 for each campaign
+        self.assertEqual(mocked_process_records.call_count, 6)
+        for parent_id in ("c1", "c2"):
+            bookmarks = [call.args[2] for call in mocked_write_bookmark.mock_calls if call.args[5] == parent_id]
+            self.assertEqual(len(bookmarks), 3)
+            self.assertEqual(bookmarks, sorted(bookmarks))
+
+    def test_windows_in_flight_per_parent(self, mocked_process_records, mocked_write_bookmark, mocked_now):
+        """Only the next date windows of a parent are requested ahead"""
+        mocked_now.return_value = strptime_to_utc("2021-03-15T00:00:00Z")
+        config = dict(self.config, start_date="2020-01-01T00:00:00Z")
+
+        with AsyncioExecutor(SerialExecutor()) as executor:
+            executor.run_batch(self.get_scheduler(config), ChildBatch(self.stream_name, "campaigns", [("c1", None)]))
+
+        # 15 windows of 30 days, at most MAX_PARENT_WINDOWS requested at the same time
+        self.assertEqual(mocked_process_records.call_count, 15)
+        self.assertEqual(MockedAsyncClient.instances[-1].max_in_flight, MAX_PARENT_WINDOWS)
+
+    def test_executor_shares_the_client(self, mocked_process_records, mocked_write_bookmark, mocked_now):
+        """The batches of a sync share one client, closed when the executor exits"""
+        mocked_now.return_value = strptime_to_utc("2021-03-15T00:00:00Z")
+        scheduler = self.get_scheduler()
+
+        with AsyncioExecutor(SerialExecutor()) as executor:
+            for parent_id in ("c1", "c2"):
+                self.assertTrue(executor.run_batch(scheduler, ChildBatch(self.stream_name, "campaigns", [(parent_id, None)])))
+            self.assertEqual(len(MockedAsyncClient.instances), 1)
+            self.assertFalse(MockedAsyncClient.instances[0].closed)
+
+        self.assertTrue(MockedAsyncClient.instances[0].closed)
+        self.assertEqual(len(mocked_write_bookmark.mock_calls), 6)
+
+    def test_currently_syncing(self, mocked_process_records, mocked_write_bookmark, mocked_now):
+        """The stats streams synced from the event loop are in flight in the SyncPool"""
+        mocked_now.return_value = strptime_to_utc("2021-03-15T00:00:00Z")
+        pool = mock.Mock(parallel=True)
+        scheduler = self.get_scheduler(pool=pool)
+
+        with AsyncioExecutor(SerialExecutor()) as executor:
+            executor.run_batch(scheduler, ChildBatch(self.stream_name, "campaigns", [("c1", None)]))
+
+        pool.start_stream.assert_called_once_with(self.stream_name)
+        pool.finish_stream.assert_called_once_with(self.stream_name)
+        scheduler.update_currently_syncing.assert_not_called()
@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+from datetime import datetime
+import pytz
+from tap_snapchat_ads.checkpoint import open_checkpoints
+from tap_snapchat_ads.pruning import BOOKMARK_PRUNER
+from tap_snapchat_ads.streams import SnapchatAds
+
+NOW = datetime(2021, 3, 31, tzinfo=pytz.utc)
+
+def get_state():
+    return {
+        "bookmarks": {
+            "ad_stats_daily": {
+                "end_time(parent_ad_id:a1)": "2021-03-30T00:00:00.000000Z",
+                # deleted ads
+                "end_time(parent_ad_id:a2)": "2021-03-29T00:00:00.000000Z",
+                "end_time(parent_ad_id:a3)": "2021-01-01T00:00:00.000000Z"
+            },
+            "ad_accounts": {"updated_at": "2021-01-01T00:00:00.000000Z"},
+            # not synced in this run
+            "campaign_stats_daily": {"end_time(parent_campaign_id:c1)": "2021-01-01T00:00:00.000000Z"}
+        }
+    }
+
+@mock.patch("singer.write_state")
+class TestBookmarkPruner(unittest.TestCase):
+    """Test the bookmarks of the parents not seen in the sync are removed"""
+
+    def tearDown(self):
+        BOOKMARK_PRUNER.configure({})
+
+    def sync(self, config, state):
+        BOOKMARK_PRUNER.configure(config)
+        stream_obj = SnapchatAds()
+        stream_obj.get_bookmark(state, "ad_stats_daily", None, "end_time", "ad", "a1")
+        stream_obj.write_bookmark(state, "ad_stats_daily", "2021-03-31T00:00:00.000000Z", "end_time", "ad", "a4")
+        return BOOKMARK_PRUNER.prune(state, {"ad_stats_daily", "ad_accounts"}, NOW)
+
+    def test_prune(self, mocked_write_state):
+        state = get_state()
+        removed = self.sync({"prune_bookmarks": "true"}, state)
+
+        self.assertEqual(removed, {"ad_stats_daily": ["end_time(parent_ad_id:a2)", "end_time(parent_ad_id:a3)"]})
+        self.assertEqual(state["bookmarks"]["ad_stats_daily"], {
+            "end_time(parent_ad_id:a1)": "2021-03-30T00:00:00.000000Z",
+            "end_time(parent_ad_id:a4)": "2021-03-31T00:00:00.000000Z"})
+        self.assertEqual(state["bookmarks"]["ad_accounts"], get_state()["bookmarks"]["ad_accounts"])
+        self.assertEqual(state["bookmarks"]["campaign_stats_daily"], get_state()["bookmarks"]["campaign_stats_daily"])
+
+    def test_retention_days(self, mocked_write_state):
+        state = get_state()
+        removed = self.sync({"prune_bookmarks": "true", "bookmark_retention_days": "30"}, state)
+
+        # a2 not seen for 2 days is kept
+        self.assertEqual(removed, {"ad_stats_daily": ["end_time(parent_ad_id:a3)"]})
+        self.assertIn("end_time(parent_ad_id:a2)", state["bookmarks"]["ad_stats_daily"])
+
+    def test_disabled(self, mocked_write_state):
+        state = get_state()
+        self.assertEqual(self.sync({}, state), {})
+        self.assertEqual(len(state["bookmarks"]["ad_stats_daily"]), 4)
+
+    def test_compact_state(self, mocked_write_state):
+        state = get_state()
+        with open_checkpoints({"compact_state": "true"}, state):
+            self.sync({"prune_bookmarks": "true"}, state)
+
+        parent_bookmarks = mocked_write_state.mock_calls[-1].args[0]["bookmarks"]["ad_stats_daily"]["parent_bookmarks"]
+        self.assertEqual(parent_bookmarks["end_time(parent_ad_id)"], {
+            "watermark": "2021-03-30T00:00:00.000000Z", "ids": "a1", "exceptions": {"a4": "2021-03-31T00:00:00.000000Z"}})
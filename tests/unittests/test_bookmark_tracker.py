@@ -0,0 +1,31 @@
+import unittest
+from tap_snapchat_ads.bookmarks import BookmarkTracker, get_epoch
+
+class TestBookmarkTracker(unittest.TestCase):
+    """Test the bookmarks compared as epochs give the same max bookmark as the parsed datetimes"""
+
+    def test_max_bookmark(self):
+        tracker = BookmarkTracker("2021-03-02T00:00:00Z", None)
+
+        self.assertFalse(tracker.is_new("2021-03-01T08:00:00.000000Z"))
+        self.assertTrue(tracker.is_new("2021-03-02T00:00:00.000000Z"))
+        self.assertTrue(tracker.is_new("2021-03-02T01:00:00-08:00"))
+        self.assertTrue(tracker.is_new("2021-03-02T05:00:00.000000Z"))
+        self.assertEqual(tracker.get_max_bookmark_value(), "2021-03-02T09:00:00.000000Z")
+
+    def test_max_bookmark_not_moved(self):
+        tracker = BookmarkTracker("2021-03-01T00:00:00Z", "2021-03-05T00:00:00Z")
+        self.assertTrue(tracker.is_new("2021-03-02T00:00:00.000000Z"))
+        self.assertEqual(tracker.get_max_bookmark_value(), "2021-03-05T00:00:00Z")
+
+        # the last_datetime is the max bookmark of the records before it
+        tracker = BookmarkTracker("2021-03-01T00:00:00Z", None)
+        self.assertFalse(tracker.is_new("2021-02-01T00:00:00.000000Z"))
+        self.assertEqual(tracker.get_max_bookmark_value(), "2021-03-01T00:00:00Z")
+
+        # no record with the bookmark field
+        self.assertIsNone(BookmarkTracker("2021-03-01T00:00:00Z", None).get_max_bookmark_value())
+
+    def test_epoch(self):
+        self.assertEqual(get_epoch("1970-01-01T00:00:01.000001Z"), 1000001)
+        self.assertEqual(get_epoch("2021-03-02T01:00:00-08:00"), get_epoch("2021-03-02T09:00:00Z"))
@@ -0,0 +1,115 @@
+import tempfile
+import unittest
+from unittest import mock
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.discover import discover
+from tap_snapchat_ads.sync import sync
+
+class MockStream:
+    def __init__(self, stream):
+        self.stream = stream
+
+# mock class for Catalog, with the discovered schemas
+class MockCatalog:
+    def __init__(self, streams, config=None):
+        self.streams = streams
+        self.catalog = discover(config)
+
+    def get_selected_streams(self, *args, **kwargs):
+        return [MockStream(stream) for stream in self.streams]
+
+    def get_stream(self, stream_name):
+        return self.catalog.get_stream(stream_name)
+
+def get_age_groups(age_groups):
+    return {"request_status": "SUCCESS", "targeting_dimensions": [
+        {"sub_request_status": "SUCCESS", "age_group": {"id": age_group_id, "name": name}} for age_group_id, name in age_groups]}
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get")
+@mock.patch("tap_snapchat_ads.streams.utils.now", return_value=strptime_to_utc("2021-01-20T00:00:00Z"))
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_schema")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_record")
+@mock.patch("singer.write_state")
+class TestChangeOnly(unittest.TestCase):
+    """Test only the new or changed records of a FULL_TABLE stream are written"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.config = {"start_date": "2021-01-01T00:00:00Z", "fingerprint_cache_dir": self.cache_dir.name}
+        self.state = {}
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def sync_age_groups(self, mocked_write_record, mocked_get, age_groups, catalog=None):
+        mocked_write_record.reset_mock()
+        mocked_get.return_value = get_age_groups(age_groups)
+        sync(self.client, self.config, catalog or MockCatalog(["targeting_age_groups"]), self.state)
+        return [call.args[1] for call in mocked_write_record.mock_calls]
+
+    def test_unchanged_records_not_written(self, mocked_write_state, mocked_write_record, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        records = self.sync_age_groups(mocked_write_record, mocked_get, [("18-20", "18-20"), ("21-24", "21-24")])
+        self.assertEqual([record["id"] for record in records], ["18-20", "21-24"])
+
+        records = self.sync_age_groups(mocked_write_record, mocked_get, [("18-20", "18-20"), ("21-24", "21 to 24"), ("25-34", "25-34")])
+
+        # the changed and the new record
+        self.assertEqual([(record["id"], record["name"]) for record in records], [("21-24", "21 to 24"), ("25-34", "25-34")])
+
+    def test_state_reset(self, mocked_write_state, mocked_write_record, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        """The fingerprints are cleared when the state is not the state of the last sync"""
+        age_groups = [("18-20", "18-20"), ("21-24", "21-24")]
+        self.sync_age_groups(mocked_write_record, mocked_get, age_groups)
+        self.assertTrue(self.state["fingerprint_generation"])
+        self.assertEqual(self.sync_age_groups(mocked_write_record, mocked_get, age_groups), [])
+
+        self.state = {}
+        records = self.sync_age_groups(mocked_write_record, mocked_get, age_groups)
+
+        self.assertEqual([record["id"] for record in records], ["18-20", "21-24"])
+
+    @mock.patch("tap_snapchat_ads.fingerprints.FingerprintListing.finish", side_effect=RuntimeError("failed"))
+    def test_failed_sync(self, mocked_finish, mocked_write_state, mocked_write_record, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        """The fingerprints of a failed sync are cleared by the next sync"""
+        age_groups = [("18-20", "18-20"), ("21-24", "21-24")]
+        with self.assertRaises(RuntimeError):
+            self.sync_age_groups(mocked_write_record, mocked_get, age_groups)
+        self.assertNotIn("fingerprint_generation", self.state)
+
+        mocked_finish.side_effect = None
+        mocked_finish.return_value = []
+        records = self.sync_age_groups(mocked_write_record, mocked_get, age_groups)
+
+        self.assertEqual([record["id"] for record in records], ["18-20", "21-24"])
+
+    def test_deleted_at_discovered(self, mocked_write_state, mocked_write_record, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        """_sdc_deleted_at is added to the FULL_TABLE streams by the discovery with fingerprint_cache_dir"""
+        catalog = discover(self.config)
+        stream = catalog.get_stream("targeting_age_groups")
+        self.assertIn("_sdc_deleted_at", stream.schema.properties)
+        self.assertIn({"breadcrumb": ("properties", "_sdc_deleted_at"), "metadata": {"inclusion": "automatic"}}, stream.metadata)
+        self.assertNotIn("_sdc_deleted_at", catalog.get_stream("organizations").schema.properties)
+        self.assertNotIn("_sdc_deleted_at", discover({}).get_stream("targeting_age_groups").schema.properties)
+
+    def test_deleted_records(self, mocked_write_state, mocked_write_record, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        """The deleted records are written with _sdc_deleted_at when the schema has it"""
+        catalog = MockCatalog(["targeting_age_groups"], self.config)
+        self.sync_age_groups(mocked_write_record, mocked_get, [("18-20", "18-20"), ("21-24", "21-24")], catalog)
+
+        records = self.sync_age_groups(mocked_write_record, mocked_get, [("18-20", "18-20")], catalog)
+
+        self.assertEqual(records, [{"id": "21-24", "_sdc_deleted_at": "2021-01-20T00:00:00.000000Z"}])
+        # without the property, the deleted records are only forgotten
+        self.assertEqual(self.sync_age_groups(mocked_write_record, mocked_get, [("18-20", "18-20")]), [])
+
+    def test_incremental_streams_not_filtered(self, mocked_write_state, mocked_write_record, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        mocked_get.return_value = {"request_status": "SUCCESS", "organizations": [
+            {"sub_request_status": "SUCCESS", "organization": {"id": "org", "updated_at": "2021-01-10T00:00:00Z"}}]}
+        for _ in range(2):
+            sync(self.client, self.config, MockCatalog(["organizations"]), self.state)
+
+        self.assertEqual(mocked_write_record.call_count, 2)
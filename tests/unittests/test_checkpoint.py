@@ -0,0 +1,50 @@
+import unittest
+from unittest import mock
+from tap_snapchat_ads.checkpoint import CHECKPOINTS, open_checkpoints
+from tap_snapchat_ads.streams import SnapchatAds, update_currently_syncing
+
+@mock.patch("singer.write_state")
+class TestCheckpointManager(unittest.TestCase):
+    """Test the STATE messages are coalesced and written at the end of the streams"""
+
+    def write_bookmarks(self, state, count):
+        for idx in range(count):
+            SnapchatAds().write_bookmark(state, "ad_stats_daily", "2021-03-0{}T00:00:00Z".format(idx + 1), "end_time", "ad", "ad1")
+            CHECKPOINTS.add_records(10)
+
+    def test_every_change_by_default(self, mocked_write_state):
+        state = {}
+        with open_checkpoints({}, state):
+            self.write_bookmarks(state, 3)
+        self.assertEqual(mocked_write_state.call_count, 3)
+
+    def test_records_interval(self, mocked_write_state):
+        state = {}
+        with open_checkpoints({"state_interval_records": 25}, state):
+            self.write_bookmarks(state, 5)
+            # the 4th bookmark after 30 records
+            self.assertEqual(mocked_write_state.call_count, 1)
+
+            # the end of a stream is written
+            update_currently_syncing(state, None)
+            self.assertEqual(mocked_write_state.call_count, 2)
+        # nothing changed since
+        self.assertEqual(mocked_write_state.call_count, 2)
+
+    @mock.patch("tap_snapchat_ads.checkpoint.time.monotonic", side_effect=[0, 10, 20, 70, 80, 90])
+    def test_seconds_interval(self, mocked_monotonic, mocked_write_state):
+        state = {}
+        with self.assertRaises(RuntimeError):
+            with open_checkpoints({"state_interval_seconds": "60"}, state):
+                # at 10 and 20 seconds
+                self.write_bookmarks(state, 2)
+                self.assertEqual(mocked_write_state.call_count, 0)
+                # at 70 seconds
+                self.write_bookmarks(state, 1)
+                self.assertEqual(mocked_write_state.call_count, 1)
+                update_currently_syncing(state, "ad_stats_daily")
+                raise RuntimeError("failed sync")
+
+        # the changed state is written when the sync fails
+        self.assertEqual(mocked_write_state.call_count, 2)
+        self.assertEqual(mocked_write_state.mock_calls[1].args[0]["currently_syncing"], "ad_stats_daily")
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import unittest
+from tap_snapchat_ads.concurrency import AdaptiveConcurrencyLimiter
+
+class MockClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+class TestAdaptiveConcurrencyLimiter(unittest.TestCase):
+    """Test the AIMD limit of the requests in flight"""
+
+    def test_additive_increase(self):
+        """The limit grows by 1 after `limit` healthy responses, up to max_limit"""
+        limiter = AdaptiveConcurrencyLimiter(max_limit=5, initial_limit=2, clock=MockClock())
+
+        for _ in range(2):
+            limiter.release(limiter.acquire(), 200)
+        self.assertEqual(limiter.get_limit(), 3)
+
+        for _ in range(20):
+            limiter.release(limiter.acquire(), 200)
+        self.assertEqual(limiter.get_limit(), 5)
+
+    def test_multiplicative_decrease_once_per_burst(self):
+        """A burst of 429s from requests in flight together halves the limit once"""
+        clock = MockClock()
+        limiter = AdaptiveConcurrencyLimiter(max_limit=8, clock=clock)
+        started = [limiter.acquire() for _ in range(4)]
+        clock.now = 1
+
+        for start in started:
+            limiter.release(start, 429)
+        self.assertEqual(limiter.get_limit(), 4)
+
+        # a request started after the decrease may decrease it again
+        limiter.release(limiter.acquire(), 503)
+        self.assertEqual(limiter.get_limit(), 2)
+        limiter.release(limiter.acquire(), None)
+        self.assertEqual(limiter.get_limit(), 1)
+
+    def test_slow_response_decreases(self):
+        """A response much slower than the average latency decreases the limit"""
+        clock = MockClock()
+        limiter = AdaptiveConcurrencyLimiter(max_limit=10, clock=clock)
+        started = limiter.acquire()
+        clock.now = 1
+        limiter.release(started, 200)
+        started = limiter.acquire()
+        clock.now = 10
+
+        limiter.release(started, 200)
+        self.assertEqual(limiter.get_limit(), 9)
+
+    def test_acquire_blocks_at_limit(self):
+        """A thread waits for a slot once the limit is reached"""
+        limiter = AdaptiveConcurrencyLimiter(max_limit=1)
+        started = limiter.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: acquired.set() if limiter.acquire() is not None else None)
+        thread.start()
+
+        self.assertFalse(acquired.wait(0.05))
+        limiter.release(started, 200)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    def test_async_acquire_woken_by_thread(self):
+        """An asyncio task waiting for a slot is woken up when a thread releases one"""
+        limiter = AdaptiveConcurrencyLimiter(max_limit=1)
+        started = limiter.acquire()
+
+        async def acquire():
+            threading.Timer(0.05, limiter.release, (started, 200)).start()
+            return await asyncio.wait_for(limiter.async_acquire(), 1)
+
+        self.assertIsNotNone(asyncio.run(acquire()))
+        self.assertEqual(limiter.in_flight, 1)
@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from singer import metadata
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.discover import discover
+from tap_snapchat_ads.streams import ALL_STATS_FIELDS, STREAMS, SnapchatAds
+
+def get_catalog(stream_name, selected_fields=None):
+    """Returns the discovered catalog with only selected_fields selected (all if None) for stream_name"""
+    catalog = discover()
+    stream = catalog.get_stream(stream_name)
+    mdata = metadata.to_map(stream.metadata)
+    for breadcrumb in mdata:
+        if len(breadcrumb) == 2 and selected_fields is not None:
+            mdata[breadcrumb]['selected'] = breadcrumb[-1] in selected_fields
+    stream.metadata = metadata.to_list(mdata)
+    return catalog
+
+class TestStatsFieldProjection(unittest.TestCase):
+    """Test the stats fields requested are the fields selected in the catalog"""
+
+    stream_name = "campaign_stats_daily"
+
+    def get_params(self, catalog):
+        return SnapchatAds().get_stream_params(self.stream_name, STREAMS[self.stream_name], {}, catalog)
+
+    def test_all_fields_selected(self):
+        params = self.get_params(get_catalog(self.stream_name))
+
+        self.assertEqual(params["fields"], ALL_STATS_FIELDS)
+        self.assertEqual(params["conversion_source_types"], "web,app,total")
+
+    def test_selected_fields(self):
+        params = self.get_params(get_catalog(self.stream_name, ["impressions", "spend", "conversion_purchases_app"]))
+
+        self.assertEqual(params["fields"], "impressions,spend,conversion_purchases")
+        # no _web field selected
+        self.assertEqual(params["conversion_source_types"], "app,total")
+
+    def test_automatic_fields_only(self):
+        """The stats are requested with one field when only the automatic fields are selected"""
+        params = self.get_params(get_catalog(self.stream_name, []))
+
+        self.assertEqual(params["fields"], "android_installs")
+        self.assertEqual(params["conversion_source_types"], "total")
+
+    def test_no_catalog(self):
+        params = self.get_params(None)
+
+        self.assertEqual(params["fields"], ALL_STATS_FIELDS)
+        self.assertEqual(params["conversion_source_types"], "web,app,total")
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", return_value={"request_status": "SUCCESS", "timeseries_stats": []})
+@mock.patch("tap_snapchat_ads.streams.utils.now", return_value=strptime_to_utc("2021-01-10T00:00:00Z"))
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+class TestStatsFieldProjectionSync(unittest.TestCase):
+    """Test the stats requests have the fields selected in the catalog"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+
+    def test_request_fields(self, mocked_write_bookmark, mocked_now, mocked_get, mocked_access_token):
+        stream_name = "ad_stats_hourly"
+        catalog = get_catalog(stream_name, ["swipes", "conversion_sign_ups_web"])
+        list(STREAMS[stream_name]().iter_endpoint(
+            client=self.client, config={"start_date": "2021-01-09T00:00:00Z"}, catalog=catalog, state={}, stream_name=stream_name,
+            stream_class=STREAMS[stream_name], sync_streams=[stream_name], selected_streams=[stream_name], parent_id="a1"))
+
+        query = parse_qs(urlparse(mocked_get.mock_calls[0].kwargs["url"]).query)
+        self.assertEqual(query["fields"], ["swipes,conversion_sign_ups"])
+        self.assertEqual(query["conversion_source_types"], ["web,total"])
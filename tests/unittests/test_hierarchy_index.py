@@ -0,0 +1,142 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.hierarchy import HIERARCHY_FILE, HierarchyIndex, get_config_key
+from tap_snapchat_ads.scheduler import ChildParent, ParentPage
+from tap_snapchat_ads.sync import sync
+
+class MockStream:
+    def __init__(self, stream):
+        self.stream = stream
+
+# mock class for Catalog
+class MockCatalog:
+    def __init__(self, streams):
+        self.streams = streams
+
+    def get_selected_streams(self, *args, **kwargs):
+        return [MockStream(stream) for stream in self.streams]
+
+def mocked_get(*args, **kwargs):
+    """Mocked get function: 1 organization, 1 ad account, 2 campaigns and their stats"""
+    endpoint = kwargs.get("endpoint")
+    if endpoint == "organizations":
+        return {"request_status": "SUCCESS",
+                "organizations": [{"sub_request_status": "SUCCESS", "organization": {"id": "org"}}]}
+    if endpoint == "ad_accounts":
+        return {"request_status": "SUCCESS",
+                "adaccounts": [{"sub_request_status": "SUCCESS", "adaccount": {"id": "acc", "timezone": "America/Los_Angeles"}}]}
+    if endpoint == "campaigns":
+        return {"request_status": "SUCCESS", "campaigns": [
+            {"sub_request_status": "SUCCESS", "campaign": {"id": "c1", "updated_at": "2021-01-01T00:00:00Z", "start_time": "2021-01-05T00:00:00Z"}},
+            {"sub_request_status": "SUCCESS", "campaign": {"id": "c2", "updated_at": "2021-01-02T00:00:00Z"}}]}
+    return {"request_status": "SUCCESS", "timeseries_stats": []}
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", side_effect=mocked_get)
+@mock.patch("tap_snapchat_ads.streams.utils.now", return_value=strptime_to_utc("2021-01-20T00:00:00Z"))
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_schema")
+@mock.patch("singer.write_state")
+class TestHierarchyIndexSync(unittest.TestCase):
+    """Test the stats-only runs start from the parent records cached by the previous run"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.config = {"start_date": "2021-01-01T00:00:00Z", "hierarchy_cache_dir": self.cache_dir.name}
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def get_endpoints(self, mocked_get):
+        return [call.kwargs["endpoint"] for call in mocked_get.mock_calls]
+
+    def test_parents_requested_once(self, mocked_write_state, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        sync(self.client, self.config, MockCatalog(["campaign_stats_daily"]), {})
+        self.assertEqual(self.get_endpoints(mocked_get)[:3], ["organizations", "ad_accounts", "campaigns"])
+        first_run_urls = [call.kwargs["url"] for call in mocked_get.mock_calls[3:]]
+
+        mocked_get.reset_mock()
+        sync(self.client, self.config, MockCatalog(["campaign_stats_daily"]), {})
+
+        # only the stats are requested, with the timezone and lifetime of the cached parents
+        self.assertEqual(set(self.get_endpoints(mocked_get)), {"campaign_stats_daily"})
+        self.assertEqual([call.kwargs["url"] for call in mocked_get.mock_calls], first_run_urls)
+
+    def test_selected_parent_is_requested(self, mocked_write_state, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        """A selected stream is always requested, its records are written"""
+        sync(self.client, self.config, MockCatalog(["campaign_stats_daily"]), {})
+        mocked_get.reset_mock()
+
+        with mock.patch("tap_snapchat_ads.streams.SnapchatAds.process_records", return_value=(None, 2)):
+            sync(self.client, self.config, MockCatalog(["campaigns", "campaign_stats_daily"]), {})
+
+        self.assertEqual(self.get_endpoints(mocked_get).count("campaigns"), 1)
+        self.assertNotIn("ad_accounts", self.get_endpoints(mocked_get))
+
+    def test_full_refresh(self, mocked_write_state, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        self.config["hierarchy_refresh"] = "full"
+        sync(self.client, self.config, MockCatalog(["campaign_stats_daily"]), {})
+        mocked_get.reset_mock()
+
+        sync(self.client, self.config, MockCatalog(["campaign_stats_daily"]), {})
+
+        self.assertEqual(self.get_endpoints(mocked_get)[:3], ["organizations", "ad_accounts", "campaigns"])
+
+class TestHierarchyIndex(unittest.TestCase):
+    """Test the records of a (stream, parent_id) are cached once the stream is synced"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.cache_dir.name, HIERARCHY_FILE)
+        self.now = 1000.0
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def get_index(self, config_key="key", full_refresh=False):
+        return HierarchyIndex(self.path, config_key, 3600, clock=lambda: self.now, full_refresh=full_refresh)
+
+    def sync_pages(self, index, fail=False):
+        def pages():
+            yield ParentPage("campaigns", [ChildParent("c1", "UTC", ("2021-01-01T00:00:00Z", None))], ["2021-01-02T00:00:00Z"])
+            if fail:
+                raise RuntimeError("sync failed")
+            yield ParentPage("campaigns", [ChildParent("c2", "UTC")])
+            return 2
+        return list(index.record("campaigns", "acc", pages()))
+
+    def test_ttl(self):
+        with self.get_index() as index:
+            self.sync_pages(index)
+            self.assertEqual(index.get_child_parents("campaigns", "acc"), [
+                (("c1", "UTC", ("2021-01-01T00:00:00Z", None)), "2021-01-02T00:00:00Z"),
+                (("c2", "UTC", None), None)])
+            self.now = self.now + 3601
+            self.assertIsNone(index.get_child_parents("campaigns", "acc"))
+
+    def test_full_refresh_never_cached(self):
+        """With a full refresh the records are indexed but never handed to the child streams"""
+        with self.get_index(full_refresh=True) as index:
+            self.sync_pages(index)
+            self.assertIsNone(index.get_child_parents("campaigns", "acc"))
+        # the index is kept up to date for the runs with a ttl
+        with self.get_index() as index:
+            self.assertEqual(len(index.get_child_parents("campaigns", "acc")), 2)
+
+    def test_partial_listing_not_cached(self):
+        with self.get_index() as index:
+            self.sync_pages(index)
+            with self.assertRaises(RuntimeError):
+                self.sync_pages(index, fail=True)
+            self.assertIsNone(index.get_child_parents("campaigns", "acc"))
+
+    def test_cleared_when_profiles_change(self):
+        with self.get_index(get_config_key({"org_account_ids": [{"organisation_id": "org"}]})) as index:
+            self.sync_pages(index)
+        with self.get_index(get_config_key({"org_account_ids": [{"organisation_id": "other"}]})) as index:
+            self.assertIsNone(index.get_child_parents("campaigns", "acc"))
@@ -0,0 +1,45 @@
+import copy
+import unittest
+import humps
+from tap_snapchat_ads.normalize import KeyNormalizer
+from tap_snapchat_ads.streams import SnapchatAds, STREAMS
+
+RECORD = {
+    "id": "a1",
+    "updatedAt": "2021-03-31T00:00:00.000Z",
+    "APIResponse": "OK",
+    "adSquadID": "s1",
+    "start_time": "2021-03-01",
+    "1234": "numeric",
+    "targeting": {"geos": [{"countryCode": "us", "regionIDs": ["1", "2"]}], "demographics": []},
+    "reviewStatusReasons": ["notReviewed"]}
+
+class TestKeyNormalizer(unittest.TestCase):
+    """Test the keys are decamelized same as humps, at every level"""
+
+    def test_same_as_humps(self):
+        normalizer = KeyNormalizer()
+        for _ in range(2):
+            self.assertEqual(normalizer.normalize(copy.deepcopy(RECORD)), humps.decamelize(RECORD))
+        self.assertEqual(normalizer.keys["adSquadID"], "ad_squad_id")
+
+    def test_stats_rows(self):
+        data = {"request_status": "SUCCESS", "timeseries_stats": [{"timeseries_stat": {
+            "id": "c1", "type": "CAMPAIGN", "granularity": "DAY", "swipeUpAttributionWindow": "28_DAY",
+            "start_time": "2021-03-01T00:00:00.000-08:00", "end_time": "2021-03-03T00:00:00.000-08:00",
+            "timeseries": [
+                {"start_time": "2021-03-01T00:00:00.000-08:00", "end_time": "2021-03-02T00:00:00.000-08:00",
+                 "stats": {"impressions": 10, "conversionPurchases": 1, "type": "overwritten"}},
+                {"start_time": "2021-03-02T00:00:00.000-08:00", "end_time": "2021-03-03T00:00:00.000-08:00",
+                 "stats": {"impressions": 20}}]}}]}
+
+        records = SnapchatAds.transform_data(data, "campaign_stats_daily", STREAMS["campaign_stats_daily"])
+
+        self.assertEqual(records[0], {
+            "start_time": "2021-03-01T00:00:00.000-08:00", "end_time": "2021-03-02T00:00:00.000-08:00",
+            "id": "c1", "type": "overwritten", "granularity": "DAY", "swipe_up_attribution_window": "28_DAY",
+            "impressions": 10, "conversion_purchases": 1})
+        self.assertEqual(list(records[1]), [
+            "start_time", "end_time", "id", "type", "granularity", "swipe_up_attribution_window", "impressions"])
+        # the response is not modified
+        self.assertIn("stats", data["timeseries_stats"][0]["timeseries_stat"]["timeseries"][0])
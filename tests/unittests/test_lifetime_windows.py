@@ -0,0 +1,90 @@
+import unittest
+from unittest import mock
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.streams import STREAMS, SnapchatAds
+
+NOW = strptime_to_utc("2022-06-15T00:00:00Z")
+
+class TestLifetimeWindows(unittest.TestCase):
+    """Test the stats date windows are clipped to the lifetime of the parent entity"""
+
+    stream_class = STREAMS["campaign_stats_daily"]
+
+    def get_windows(self, last_datetime, lifetime, config=None):
+        lifetime_bounds = SnapchatAds.get_lifetime_bounds(config or {}, lifetime, 28)
+        return SnapchatAds.get_date_windows(self.stream_class, strptime_to_utc(last_datetime), NOW, 28, lifetime_bounds)
+
+    def test_new_entity_starts_at_its_start(self):
+        """An ad created yesterday is not requested from the start_date"""
+        windows = self.get_windows("2020-01-01T00:00:00Z", ("2022-06-14T10:00:00Z", None))
+
+        # the window stops at now
+        self.assertEqual(windows, [(strptime_to_utc("2022-06-14T10:00:00Z"), NOW)])
+
+    def test_ended_entity_stops_after_attribution_window(self):
+        """The windows of an entity which ended stop 28 days (attribution window) after its end"""
+        windows = self.get_windows("2021-01-01T00:00:00Z", ("2021-01-01T00:00:00Z", "2021-02-01T00:00:00Z"))
+
+        self.assertEqual(len(windows), 2)
+        self.assertEqual(windows[-1][1], strptime_to_utc("2021-03-01T00:00:00Z"))
+
+    def test_final_entity_not_requested_again(self):
+        """Once the final bookmark is written, no window is requested for the entity"""
+        lifetime = ("2021-01-01T00:00:00Z", "2021-02-01T00:00:00Z")
+        lifetime_bounds = SnapchatAds.get_lifetime_bounds({}, lifetime, 28)
+
+        final_bookmark = SnapchatAds.get_final_bookmark("2021-02-01T00:00:00Z", lifetime_bounds, NOW)
+
+        self.assertEqual(final_bookmark, "2021-03-01T00:00:00.000000Z")
+        self.assertEqual(self.get_windows(final_bookmark, lifetime), [])
+        # the bookmark does not move for an entity still running
+        self.assertIsNone(SnapchatAds.get_final_bookmark("2021-02-01T00:00:00Z", SnapchatAds.get_lifetime_bounds({}, (lifetime[0], None), 28), NOW))
+
+    def test_run_after_final_bookmark(self):
+        """An entity whose final bookmark is within the attribution window of now is not requested again"""
+        lifetime = ("2022-04-01T00:00:00Z", "2022-05-10T00:00:00Z")
+        lifetime_bounds = SnapchatAds.get_lifetime_bounds({}, lifetime, 28)
+
+        # the first run after the end of the attribution window stops at its end
+        windows = self.get_windows("2022-06-01T00:00:00Z", lifetime)
+        self.assertEqual(windows, [(strptime_to_utc("2022-05-18T00:00:00Z"), strptime_to_utc("2022-06-07T00:00:00Z"))])
+
+        final_bookmark = SnapchatAds.get_final_bookmark("2022-06-01T00:00:00Z", lifetime_bounds, NOW)
+        self.assertEqual(final_bookmark, "2022-06-07T00:00:00.000000Z")
+        self.assertEqual(self.get_windows(final_bookmark, lifetime), [])
+
+    def test_clipping_disabled(self):
+        windows = self.get_windows("2022-01-01T00:00:00Z", ("2022-06-14T10:00:00Z", None), {"clip_stats_windows": "false"})
+
+        self.assertEqual(windows[0][0], strptime_to_utc("2022-01-01T00:00:00Z"))
+
+    def test_child_parent_lifetime(self):
+        """The lifetime is the start_time (or created_at) and end_time of the parent record"""
+        campaign = SnapchatAds.get_child_parent("campaigns", ["id"], {"id": "c1", "start_time": "2021-01-01T00:00:00Z",
+                                                                      "end_time": "2021-02-01T00:00:00Z", "created_at": "2020-12-01T00:00:00Z"}, "UTC")
+        ad = SnapchatAds.get_child_parent("ads", ["id"], {"id": "a1", "created_at": "2020-12-01T00:00:00Z"}, "UTC")
+
+        self.assertEqual(campaign, ("c1", "UTC", ("2021-01-01T00:00:00Z", "2021-02-01T00:00:00Z")))
+        self.assertEqual(ad, ("a1", "UTC", ("2020-12-01T00:00:00Z", None)))
+        self.assertIsNone(SnapchatAds.get_child_parent("pixels", ["id"], {"id": "p1"}).lifetime)
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", return_value={"request_status": "SUCCESS", "timeseries_stats": []})
+@mock.patch("tap_snapchat_ads.streams.utils.now", return_value=NOW)
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+class TestLifetimeSync(unittest.TestCase):
+    """Test the final bookmark is written for an entity which ended"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+
+    def test_ended_entity_bookmark(self, mocked_write_bookmark, mocked_now, mocked_get, mocked_access_token):
+        stream_name = "campaign_stats_daily"
+        list(STREAMS[stream_name]().iter_endpoint(
+            client=self.client, config={"start_date": "2020-01-01T00:00:00Z"}, catalog=None, state={}, stream_name=stream_name,
+            stream_class=STREAMS[stream_name], sync_streams=[stream_name], selected_streams=[stream_name],
+            parent_id="c1", lifetime=("2021-01-01T00:00:00Z", "2021-02-01T00:00:00Z")))
+
+        # 2 windows from the campaign start instead of 30 from the start_date
+        self.assertEqual(mocked_get.call_count, 2)
+        self.assertEqual(mocked_write_bookmark.mock_calls[-1].args[2], "2021-03-01T00:00:00.000000Z")
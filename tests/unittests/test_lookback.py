@@ -0,0 +1,90 @@
+import unittest
+from unittest import mock
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.lookback import LookbackPolicy
+from tap_snapchat_ads.streams import STREAMS
+
+NOW = strptime_to_utc("2021-04-01T00:00:00Z")
+
+class TestLookbackPolicy(unittest.TestCase):
+    """Test the attribution window is re-synced at most once every lookback_refresh_hours"""
+
+    config = {"lookback_refresh_hours": 24, "lookback_recent_hours": 12}
+
+    def test_no_policy(self):
+        policy = LookbackPolicy({}, {}, NOW)
+
+        self.assertEqual(policy.get_lookback_days("campaign_stats_daily", 28), 28)
+        policy.finish()
+        self.assertEqual(policy.state, {})
+
+    def test_first_run_full_lookback(self):
+        state = {}
+        policy = LookbackPolicy(self.config, state, NOW)
+
+        self.assertEqual(policy.get_lookback_days("campaign_stats_daily", 28), 28)
+        policy.finish()
+        self.assertEqual(state, {"last_full_lookback": {"campaign_stats_daily": "2021-04-01T00:00:00.000000Z"}})
+
+    def test_recent_lookback(self):
+        state = {"last_full_lookback": {"campaign_stats_daily": "2021-03-31T06:00:00.000000Z"}}
+        policy = LookbackPolicy(self.config, state, NOW)
+
+        self.assertEqual(policy.get_lookback_days("campaign_stats_daily", 28), 0.5)
+        # the full lookback of another stream is due
+        self.assertEqual(policy.get_lookback_days("ad_stats_daily", 28), 28)
+        policy.finish()
+        self.assertEqual(state["last_full_lookback"]["campaign_stats_daily"], "2021-03-31T06:00:00.000000Z")
+
+        later_policy = LookbackPolicy(self.config, state, strptime_to_utc("2021-04-01T06:00:00Z"))
+        self.assertEqual(later_policy.get_lookback_days("campaign_stats_daily", 28), 28)
+
+    def test_recent_lookback_from_bookmark(self):
+        """The recent lookback starts lookback_recent_hours before a bookmark older than the recent window"""
+        state = {"last_full_lookback": {"campaign_stats_daily": "2021-03-31T06:00:00.000000Z"}}
+        policy = LookbackPolicy(self.config, state, NOW)
+
+        # the bookmark is 3 days behind now: 3 days and 12 hours
+        self.assertEqual(policy.get_lookback_days("campaign_stats_daily", 28, strptime_to_utc("2021-03-29T00:00:00Z"), NOW), 3.5)
+        # never further back than the attribution window
+        self.assertEqual(policy.get_lookback_days("campaign_stats_daily", 28, strptime_to_utc("2021-01-01T00:00:00Z"), NOW), 28)
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", return_value={"request_status": "SUCCESS", "timeseries_stats": []})
+@mock.patch("tap_snapchat_ads.streams.utils.now", return_value=NOW)
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+class TestLookbackSync(unittest.TestCase):
+    """Test the stats are requested from the bookmark when the full lookback is not due"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+    config = {"start_date": "2021-01-01T00:00:00Z", "lookback_refresh_hours": 24}
+
+    def sync_stats(self, lookback_policy, bookmark="2021-03-31T12:00:00Z"):
+        stream_name = "campaign_stats_hourly"
+        state = {"bookmarks": {stream_name: {"end_time(parent_campaign_id:c1)": bookmark}}}
+        list(STREAMS[stream_name]().iter_endpoint(
+            client=self.client, config=self.config, catalog=None, state=state, stream_name=stream_name,
+            stream_class=STREAMS[stream_name], sync_streams=[stream_name], selected_streams=[stream_name],
+            parent_id="c1", lookback_policy=lookback_policy))
+
+    def test_recent_lookback(self, mocked_write_bookmark, mocked_now, mocked_get, mocked_access_token):
+        state = {"last_full_lookback": {"campaign_stats_hourly": "2021-03-31T18:00:00.000000Z"}}
+        self.sync_stats(LookbackPolicy(self.config, state, NOW))
+
+        # one window from 24 hours before the bookmark
+        self.assertEqual(mocked_get.call_count, 1)
+        self.assertIn("start_time=2021-03-30T12%3A00%3A00Z", mocked_get.mock_calls[0].kwargs["url"])
+
+    def test_recent_lookback_lagging_bookmark(self, mocked_write_bookmark, mocked_now, mocked_get, mocked_access_token):
+        """The hours before a bookmark older than the recent window are re-synced"""
+        state = {"last_full_lookback": {"campaign_stats_hourly": "2021-03-31T18:00:00.000000Z"}}
+        self.sync_stats(LookbackPolicy(self.config, state, NOW), "2021-03-25T06:00:00Z")
+
+        self.assertIn("start_time=2021-03-24T06%3A00%3A00Z", mocked_get.mock_calls[0].kwargs["url"])
+
+    def test_full_lookback(self, mocked_write_bookmark, mocked_now, mocked_get, mocked_access_token):
+        self.sync_stats(LookbackPolicy(self.config, {}, NOW))
+
+        # 28 days of 7 days windows
+        self.assertEqual(mocked_get.call_count, 4)
@@ -0,0 +1,235 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.parallel import SyncPool
+from tap_snapchat_ads.streams import STREAMS
+from tap_snapchat_ads.sync import sync
+
+class MockStream:
+    def __init__(self, stream):
+        self.stream = stream
+
+# mock class for Catalog
+class MockCatalog:
+    def __init__(self, streams):
+        self.streams = streams
+
+    def get_selected_streams(self, *args, **kwargs):
+        return [MockStream(stream) for stream in self.streams]
+
+def mocked_process_records(catalog, stream_name, records, time_extracted, bookmark_field, max_bookmark_value, last_datetime):
+    """Mocking the process_records function, the bookmark is the max updated_at of the page"""
+    return max(record["updated_at"] for record in records), len(records)
+
+def mocked_get(*args, **kwargs):
+    """Mocked get function returning 3 ad accounts and 2 pixels per ad account"""
+    endpoint = kwargs.get("endpoint")
+    url = kwargs.get("url")
+    if endpoint == "organizations":
+        return {
+            "request_status": "SUCCESS",
+            "organizations": [{"sub_request_status": "SUCCESS", "organization": {"id": "org", "updated_at": "2022-01-01T00:00:00Z"}}]
+        }
+    if endpoint == "ad_accounts":
+        return {
+            "request_status": "SUCCESS",
+            "adaccounts": [{"sub_request_status": "SUCCESS", "adaccount": {"id": "acc{}".format(i), "updated_at": "2022-01-0{}T00:00:00Z".format(i)}}
+                           for i in range(1, 4)]
+        }
+    # pixels: the updated_at is derived from the ad account id in the url
+    account = url.split("/adaccounts/")[1].split("/")[0]
+    time.sleep(0.01)
+    return {
+        "request_status": "SUCCESS",
+        "pixels": [{"sub_request_status": "SUCCESS", "pixel": {"id": "{}_pixel{}".format(account, i), "updated_at": "2022-02-0{}T00:00:00Z".format(account[-1])}}
+                   for i in range(2)]
+    }
+
+class TestSyncPool(unittest.TestCase):
+    """Test the bounded thread pool used for the parent fan-out"""
+
+    def test_serial_pool_runs_inline(self):
+        """With max_workers = 1 every task runs in the calling thread"""
+        pool = SyncPool({}, 1, [], mock.Mock())
+        threads = pool.run_all(lambda item: threading.current_thread(), range(3))
+
+        self.assertFalse(pool.parallel)
+        self.assertEqual(threads, [threading.current_thread()] * 3)
+
+    def test_concurrency_is_bounded(self):
+        """No more than max_workers tasks (including the caller) run at the same time"""
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0}
+
+        def task(item):
+            with lock:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+            time.sleep(0.02)
+            with lock:
+                running["now"] -= 1
+            return item
+
+        with SyncPool({}, 3, [], mock.Mock()) as pool:
+            results = pool.run_all(task, range(10))
+
+        self.assertEqual(results, list(range(10)))
+        self.assertLessEqual(running["max"], 3)
+        self.assertGreater(running["max"], 1)
+
+    def test_nested_fan_out_does_not_deadlock(self):
+        """Tasks fanning out again inside the pool finish even when all workers are busy"""
+        with SyncPool({}, 2, [], mock.Mock()) as pool:
+            results = pool.run_all(lambda item: sum(pool.run_all(lambda x: x, range(item))), range(5))
+
+        self.assertEqual(results, [0, 0, 1, 3, 6])
+
+    def test_first_error_is_raised_after_all_tasks(self):
+        """The first error is raised once every task has finished"""
+        done = []
+
+        def task(item):
+            if item == 1:
+                raise ValueError("failed {}".format(item))
+            done.append(item)
+
+        with SyncPool({}, 2, [], mock.Mock()) as pool:
+            with self.assertRaises(ValueError):
+                pool.run_all(task, range(4))
+
+        self.assertEqual(sorted(done), [0, 2, 3])
+
+    def test_currently_syncing_is_earliest_stream_in_flight(self):
+        """currently_syncing points at the earliest (in STREAMS order) stream in flight"""
+        state = {}
+        mocked_update = mock.Mock(side_effect=lambda state, stream_name: state.update(currently_syncing=stream_name))
+        pool = SyncPool(state, 1, list(STREAMS), mocked_update)
+
+        pool.start_stream("ads")
+        pool.start_stream("campaigns")
+        pool.finish_stream("campaigns")
+        pool.start_stream("ad_stats_daily")
+
+        self.assertEqual(mocked_update.mock_calls, [
+            mock.call(state, "ads"),
+            mock.call(state, "campaigns"),
+            mock.call(state, "ads")
+        ])
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", side_effect=mocked_get)
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_schema")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.process_records", side_effect=mocked_process_records)
+@mock.patch("singer.write_state")
+class TestParallelSync(unittest.TestCase):
+    """Test the parallel sync writes the same bookmarks as the serial sync"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+
+    def run_sync(self, max_parallel_parents):
+        state = {}
+        config = {"start_date": "2021-01-01T00:00:00Z", "max_parallel_parents": max_parallel_parents}
+        sync(self.client, config, MockCatalog(["organizations", "ad_accounts", "pixels"]), state)
+        return state
+
+    def test_parallel_bookmarks_match_serial(self, mocked_write_state, mocked_process_records, mocked_schema, mocked_get, mocked_access_token):
+        """Per-parent bookmarks are the same whatever the number of workers"""
+        serial_state = self.run_sync(1)
+        parallel_state = self.run_sync(4)
+
+        self.assertEqual(parallel_state, serial_state)
+        self.assertEqual(parallel_state["bookmarks"]["pixels"], {
+            "updated_at(parent_ad_account_id:acc1)": "2022-02-01T00:00:00Z",
+            "updated_at(parent_ad_account_id:acc2)": "2022-02-02T00:00:00Z",
+            "updated_at(parent_ad_account_id:acc3)": "2022-02-03T00:00:00Z"
+        })
+
+def mocked_targeting_get(*args, **kwargs):
+    """Mocked get function for the targeting streams, targeting_languages fails"""
+    endpoint = kwargs.get("endpoint")
+    time.sleep(0.02)
+    if endpoint == "targeting_languages":
+        raise RuntimeError("failed {}".format(endpoint))
+    return {
+        "request_status": "SUCCESS",
+        "targeting_dimensions": [{"sub_request_status": "SUCCESS", STREAMS[endpoint].targeting_type: {"id": endpoint + "_id"}}]
+    }
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_schema")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.process_records", return_value=(None, 1))
+@mock.patch("singer.write_state")
+class TestParallelRootStreams(unittest.TestCase):
+    """Test the root streams are synced at the same time"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+    config = {"start_date": "2021-01-01T00:00:00Z", "max_parallel_parents": 3}
+
+    @mock.patch("tap_snapchat_ads.client.SnapchatClient.get", side_effect=mocked_targeting_get)
+    def test_root_streams_run_concurrently(self, mocked_get, mocked_write_state, mocked_process_records, mocked_schema, mocked_access_token):
+        """Independent root streams are requested from several threads"""
+        threads = set()
+        mocked_get.side_effect = lambda *args, **kwargs: threads.add(threading.current_thread().name) or \
+            mocked_targeting_get(*args, **kwargs)
+
+        state = {}
+        sync(self.client, self.config, MockCatalog(["targeting_age_groups", "targeting_genders", "targeting_os_types"]), state)
+
+        self.assertGreater(len(threads), 1)
+        self.assertEqual(mocked_get.call_count, 3)
+
+    @mock.patch("tap_snapchat_ads.client.SnapchatClient.get", side_effect=mocked_targeting_get)
+    def test_currently_syncing_on_failure(self, mocked_get, mocked_write_state, mocked_process_records, mocked_schema, mocked_access_token):
+        """An interrupted sync resumes from the earliest root stream that did not finish"""
+        state = {}
+        with self.assertRaises(RuntimeError):
+            sync(self.client, self.config, MockCatalog(["targeting_age_groups", "targeting_languages", "targeting_os_types"]), state)
+
+        self.assertEqual(state["currently_syncing"], "targeting_languages")
+
+def mocked_stats_get(*args, **kwargs):
+    """Mocked get function for campaign stats, the earliest date windows answer last"""
+    url = kwargs.get("url")
+    params = dict(param.split("=") for param in url.split("?")[1].split("&"))
+    start_time = params["start_time"].replace("%3A", ":")
+    end_time = params["end_time"].replace("%3A", ":")
+    time.sleep(0.05 if start_time.startswith("2021-01") else 0)
+    return {
+        "request_status": "SUCCESS",
+        "timeseries_stats": [{"sub_request_status": "SUCCESS", "timeseries_stat": {
+            "id": "campaign_id", "type": "CAMPAIGN", "granularity": "DAY",
+            "timeseries": [{"start_time": start_time, "end_time": end_time, "stats": {"spend": 1}, "thread": threading.current_thread().name}]}}]
+    }
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", side_effect=mocked_stats_get)
+@mock.patch("tap_snapchat_ads.streams.utils.now")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.process_records", side_effect=lambda **kwargs: (kwargs["records"][-1]["end_time"], len(kwargs["records"])))
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+class TestParallelDateWindows(unittest.TestCase):
+    """Test the date windows of a stats stream are requested at the same time"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+    config = {"start_date": "2021-01-01T00:00:00Z", "max_parallel_windows": 3}
+
+    def test_windows_written_in_order(self, mocked_write_bookmark, mocked_process_records, mocked_now, mocked_get):
+        """Records and bookmarks are written in date window order"""
+        mocked_now.return_value = strptime_to_utc("2021-04-15T00:00:00Z")
+        stream_name = "campaign_stats_daily"
+
+        with SyncPool({}, 4, list(STREAMS), mock.Mock()) as pool:
+            total = STREAMS[stream_name]().sync_endpoint(
+                client=self.client, config=self.config, catalog=None, state={}, stream_name=stream_name,
+                sync_streams=[stream_name], selected_streams=[stream_name],
+                parent_id="campaign_id", pool=pool)
+
+        processed = [call.kwargs["records"][0] for call in mocked_process_records.mock_calls]
+        bookmarks = [call.args[2] for call in mocked_write_bookmark.mock_calls]
+        self.assertEqual(total, 4)
+        self.assertEqual(processed, sorted(processed, key=lambda record: record["start_time"]))
+        self.assertEqual(bookmarks, sorted(bookmarks))
+        self.assertEqual(len(bookmarks), 4)
+        # the windows were requested from more than one thread
+        self.assertGreater(len({record["thread"] for record in processed}), 1)
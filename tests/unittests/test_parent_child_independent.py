@@ -1,4 +1,5 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 from singer.schema import Schema
 from tap_snapchat_ads.streams import SnapchatAds, ALL_STATS_FIELDS, get_hourly_stats_fields
@@ -63,6 +64,57 @@ class TestExtractOrgAdAccountData(unittest.TestCase):
         self.assertEqual({'ad_accounts': []}, self.stream_obj.extract_selected_profile_data(config, client,
                                                                                             stream_name, 'abc'))
 
+    def test_ad_accounts_fetched_by_id(self):
+        """
+        Test for validating a few selected ad accounts are requested by ID, in the config order
+        """
+        config = {'org_account_ids': [{"organisation_id": "org", "ad_accounts": ["acc1", "acc2"]}]}
+        client = mock.Mock()
+        client.get.side_effect = lambda url, endpoint: {
+            'adaccounts': [{'sub_request_status': 'SUCCESS', 'adaccount': {'id': url.split('/')[-1]}}]}
+
+        data = self.stream_obj.extract_selected_profile_data(config, client, 'adaccounts', 'org')
+
+        self.assertEqual([record['adaccount']['id'] for record in data['adaccounts']], ['acc1', 'acc2'])
+        self.assertEqual(sorted(call.kwargs['url'] for call in client.get.mock_calls), [
+            'https://adsapi.snapchat.com/v1/adaccounts/acc1', 'https://adsapi.snapchat.com/v1/adaccounts/acc2'])
+
+    @mock.patch("tap_snapchat_ads.streams.ThreadPoolExecutor", wraps=ThreadPoolExecutor)
+    def test_ad_accounts_fetched_with_max_profile_fetches(self, mocked_executor):
+        """
+        Test for validating the ad accounts requested by ID use up to max_profile_fetches threads
+        """
+        config = {'org_account_ids': [{"organisation_id": "org", "ad_accounts": ["acc{}".format(i) for i in range(12)]}],
+                  'max_profile_fetches': 20}
+        client = mock.Mock()
+        client.get.side_effect = lambda url, endpoint: {
+            'adaccounts': [{'sub_request_status': 'SUCCESS', 'adaccount': {'id': url.split('/')[-1]}}]}
+
+        data = self.stream_obj.extract_selected_profile_data(config, client, 'adaccounts', 'org')
+
+        self.assertEqual(len(data['adaccounts']), 12)
+        mocked_executor.assert_called_once_with(max_workers=12)
+
+    def test_ad_accounts_filtered_from_listing(self):
+        """
+        Test for validating many selected ad accounts are filtered from the pages of the ad accounts of the organization
+        """
+        config = {'org_account_ids': [{"organisation_id": "org", "ad_accounts": ["acc3", "acc1", "missing"]}],
+                  'max_profile_fetches': 2}
+        pages = [
+            {'request_status': 'SUCCESS', 'paging': {'next_link': 'https://adsapi.snapchat.com/v1/organizations/org/adaccounts?cursor=2'},
+             'adaccounts': [{'sub_request_status': 'SUCCESS', 'adaccount': {'id': 'acc{}'.format(i)}} for i in (1, 2)]},
+            {'request_status': 'SUCCESS',
+             'adaccounts': [{'sub_request_status': 'SUCCESS', 'adaccount': {'id': 'acc{}'.format(i)}} for i in (3, 4)]}]
+        client = mock.Mock()
+        client.get.side_effect = pages
+
+        data = self.stream_obj.extract_selected_profile_data(config, client, 'adaccounts', 'org')
+
+        self.assertEqual([record['adaccount']['id'] for record in data['adaccounts']], ['acc3', 'acc1'])
+        self.assertEqual(client.get.mock_calls[0].kwargs['url'], 'https://adsapi.snapchat.com/v1/organizations/org/adaccounts')
+        self.assertEqual(client.get.call_count, 2)
+
 
 class TestGetHourlyStats(unittest.TestCase):
     """
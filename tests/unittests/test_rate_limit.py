@@ -0,0 +1,92 @@
+import unittest
+from unittest import mock
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.rate_limit import RateLimiter
+
+class MockClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def get_headers(limit, remaining, reset):
+    return {"X-Rate-Limit-Limit": str(limit), "X-Rate-Limit-Remaining": str(remaining), "X-Rate-Limit-Reset": str(reset)}
+
+class TestRateLimiter(unittest.TestCase):
+    """Test the token bucket shared by the requests"""
+
+    def test_no_headers_no_wait(self):
+        """Requests are not paced until the rate limit is known"""
+        limiter = RateLimiter(clock=MockClock(1000))
+        limiter.update({})
+
+        self.assertEqual([limiter.acquire() for _ in range(3)], [0, 0, 0])
+
+    def test_requests_spread_until_reset(self):
+        """The tokens above the 5% reserve are spread evenly until the reset"""
+        limiter = RateLimiter(clock=MockClock(1000))
+        # 15 calls left of 100 (5 in reserve) for the next 10 seconds: one call per second
+        limiter.update(get_headers(100, 15, 1010))
+
+        waits = [limiter.acquire() for _ in range(3)]
+
+        self.assertEqual(waits[:2], [0, 1])
+        self.assertAlmostEqual(waits[2], 1 + 10 / 9)
+        self.assertEqual(limiter.remaining, 12)
+
+    def test_reserve_waits_for_reset(self):
+        """Every worker waits for the reset once only the reserve is left"""
+        limiter = RateLimiter(clock=MockClock(1000))
+        limiter.update(get_headers(100, 5, 1030))
+
+        self.assertEqual([limiter.acquire() for _ in range(2)], [30, 30])
+
+    def test_in_flight_tokens_kept(self):
+        """A stale response of the same window does not give back the tokens already taken"""
+        limiter = RateLimiter(clock=MockClock(1000))
+        limiter.update(get_headers(100, 50, 1010))
+        limiter.acquire()
+        limiter.acquire()
+        limiter.update(get_headers(100, 49, 1010))
+        self.assertEqual(limiter.remaining, 48)
+
+        # a new window refills the bucket
+        limiter.update(get_headers(100, 100, 1070))
+        self.assertEqual(limiter.remaining, 100)
+
+    def test_after_reset_no_wait(self):
+        """The budget is not paced once the reset time is past"""
+        clock = MockClock(1000)
+        limiter = RateLimiter(clock=clock)
+        limiter.update(get_headers(100, 1, 1010))
+        clock.now = 1011
+
+        self.assertEqual(limiter.acquire(), 0)
+
+class MockResponse:
+    def __init__(self, headers):
+        self.status_code = 200
+        self.headers = headers
+
+    def json(self):
+        return {"request_status": "SUCCESS"}
+
+@mock.patch("time.sleep")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("requests.Session.request")
+class TestClientRateLimiter(unittest.TestCase):
+    """Test the client paces its requests with the shared rate limiter"""
+
+    def test_clients_share_budget(self, mocked_request, mocked_access_token, mocked_sleep):
+        clock = MockClock(1000)
+        limiter = RateLimiter(clock=clock)
+        mocked_request.return_value = MockResponse(get_headers(100, 5, 1060))
+        client_1 = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300, rate_limiter=limiter)
+        client_2 = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300, rate_limiter=limiter)
+
+        client_1.get(url="https://adsapi.snapchat.com/v1/me", endpoint="me")
+        client_2.get(url="https://adsapi.snapchat.com/v1/me", endpoint="me")
+
+        # the second request waits for the reset the first response announced
+        mocked_sleep.assert_called_once_with(60)
@@ -0,0 +1,66 @@
+import unittest
+from singer import Transformer, metadata
+from singer.transform import SchemaMismatch
+from tap_snapchat_ads.schema import get_schemas
+from tap_snapchat_ads.transform import RecordTransformer
+
+SCHEMAS, FIELD_METADATA = get_schemas()
+
+def get_values(schema):
+    """Returns sample values (valid or not) for a property schema"""
+    if "anyOf" in schema:
+        return [value for sub_schema in schema["anyOf"] for value in get_values(sub_schema)]
+    types = schema.get("type", [])
+    types = types if isinstance(types, list) else [types]
+    values = [None, ""]
+    if schema.get("format") == "date-time":
+        values.extend(["2021-03-31T00:00:00.000-07:00", "2021-03-31", "not a date"])
+    if "integer" in types or "number" in types:
+        values.extend([12, "1,234", 1.5, "1.5", True])
+    if "string" in types:
+        values.extend(["text", 7])
+    if "boolean" in types:
+        values.extend([True, "false", "true", 0])
+    if "object" in types:
+        values.append({key: get_values(sub_schema)[-1] for key, sub_schema in schema.get("properties", {}).items()})
+        values.append({"unknown": 1})
+    if "array" in types:
+        values.append([get_values(schema.get("items", {}))[-1]])
+        values.append("not a list")
+    return values
+
+class TestRecordTransformer(unittest.TestCase):
+    """Test the compiled transformer gives the same output as singer's Transformer for every stream"""
+
+    def assert_same_output(self, schema, stream_metadata, record):
+        try:
+            with Transformer() as transformer:
+                expected = transformer.transform(dict(record), schema, stream_metadata)
+        except SchemaMismatch:
+            with self.assertRaises(SchemaMismatch):
+                RecordTransformer(schema, stream_metadata).transform(record)
+            return
+        self.assertEqual(RecordTransformer(schema, stream_metadata).transform(record), expected)
+
+    def test_all_streams(self):
+        for stream_name, schema in SCHEMAS.items():
+            stream_metadata = metadata.to_map(FIELD_METADATA[stream_name])
+            # deselect every other field
+            for idx, field in enumerate(schema["properties"]):
+                if idx % 2:
+                    stream_metadata[("properties", field)]["selected"] = False
+            properties = schema["properties"].items()
+            values = {field: get_values(field_schema) for field, field_schema in properties}
+            for idx in range(max(len(field_values) for field_values in values.values())):
+                with self.subTest(stream=stream_name, sample=idx):
+                    record = {field: field_values[idx % len(field_values)] for field, field_values in values.items()}
+                    record["not_in_schema"] = 1
+                    self.assert_same_output(schema, stream_metadata, record)
+                    self.assert_same_output(schema, {}, record)
+
+    def test_schema_mismatch(self):
+        schema = {"type": "object", "properties": {"impressions": {"type": ["null", "integer"]}}}
+
+        with self.assertRaises(SchemaMismatch):
+            RecordTransformer(schema).transform({"impressions": "many"})
+        self.assertEqual(RecordTransformer(schema).transform({"impressions": "1,000", "other": 1}), {"impressions": 1000})
@@ -0,0 +1,105 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+from unittest import mock
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.reports import StatsReportJobs
+from tap_snapchat_ads.streams import STREAMS, SnapchatAds
+
+class MockReportServer(BaseHTTPRequestHandler):
+    """Local Ads API: submits, polls (STARTED then COMPLETED) and serves the report files"""
+    polls = {}
+    requests = []
+    final_status = "COMPLETED"
+
+    def send_json(self, body):
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.requests.append(url.path)
+        if url.path.endswith("/stats"):
+            campaign_id = url.path.split("/")[3]
+            report_run_id = "{}_{}_{}".format(campaign_id, query["start_time"], query["end_time"])
+            self.send_json({"request_status": "SUCCESS", "async_stats_reports": [{"sub_request_status": "SUCCESS", "async_stats_report": {
+                "report_run_id": report_run_id, "async_status": "STARTED", "ad_account_id": "acc"}}]})
+        elif url.path == "/v1/adaccounts/acc/stats_report":
+            report_run_id = query["report_run_id"]
+            self.polls[report_run_id] = self.polls.get(report_run_id, 0) + 1
+            report = {"report_run_id": report_run_id, "async_status": "STARTED"}
+            if self.polls[report_run_id] > 1:
+                report.update(async_status=self.final_status, result="http://{}:{}/files/{}".format(
+                    *self.server.server_address, report_run_id))
+            self.send_json({"request_status": "SUCCESS", "async_stats_reports": [{"async_stats_report": report}]})
+        elif url.path.startswith("/files/"):
+            campaign_id, start_time, end_time = url.path.split("/")[2].split("_")
+            self.send_json({"request_status": "SUCCESS", "timeseries_stats": [{"sub_request_status": "SUCCESS", "timeseries_stat": {
+                "id": campaign_id, "type": "CAMPAIGN", "granularity": "DAY",
+                "timeseries": [{"start_time": start_time, "end_time": end_time, "stats": {"swipeUps": 1}}]}}]})
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.reports.utils.now", return_value=strptime_to_utc("2021-03-15T00:00:00Z"))
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.process_records", side_effect=lambda **kwargs: (kwargs["records"][-1]["end_time"], len(kwargs["records"])))
+class TestStatsReportJobs(unittest.TestCase):
+    """Test the report jobs pipeline against a local server"""
+
+    config = {"start_date": "2021-01-01T00:00:00Z", "max_report_jobs": 4, "report_poll_interval": 0.01}
+
+    def setUp(self):
+        MockReportServer.polls = {}
+        MockReportServer.requests = []
+        MockReportServer.final_status = "COMPLETED"
+        self.server = HTTPServer(("127.0.0.1", 0), MockReportServer)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+        self.client.base_url = "http://{}:{}/v1".format(*self.server.server_address)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reports_parsed_in_window_order(self, mocked_process_records, mocked_write_bookmark, mocked_now, mocked_access_token):
+        stream_name = "campaign_stats_daily"
+        jobs = StatsReportJobs(SnapchatAds(), self.client, self.config, None, {}, [stream_name], [stream_name])
+
+        total = jobs.sync(stream_name, STREAMS[stream_name], [("c1", None), ("c2", None)])
+
+        # 3 windows of 30 days from 2021-01-01 to 2021-03-15 for each campaign
+        self.assertEqual(total, 6)
+        # the records have the same fields as the stats requested synchronously
+        record = mocked_process_records.mock_calls[0].kwargs["records"][0]
+        self.assertEqual(record["id"], "c1")
+        self.assertEqual(record["swipe_ups"], 1)
+        self.assertNotIn("stats", record)
+        for parent_id in ("c1", "c2"):
+            bookmarks = [call.args[2] for call in mocked_write_bookmark.mock_calls if call.args[5] == parent_id]
+            self.assertEqual(len(bookmarks), 3)
+            self.assertEqual(bookmarks, sorted(bookmarks))
+        # 6 jobs submitted 4 at a time, each polled twice then downloaded
+        self.assertEqual(len([path for path in MockReportServer.requests if path.endswith("/stats")]), 6)
+        self.assertEqual(sorted(set(MockReportServer.polls.values())), [2])
+        self.assertEqual(len([path for path in MockReportServer.requests if path.startswith("/files/")]), 6)
+
+    def test_failed_report_raises(self, mocked_process_records, mocked_write_bookmark, mocked_now, mocked_access_token):
+        stream_name = "campaign_stats_daily"
+        jobs = StatsReportJobs(SnapchatAds(), self.client, self.config, None, {}, [stream_name], [stream_name])
+
+        MockReportServer.final_status = "FAILED"
+        with self.assertRaises(RuntimeError):
+            jobs.sync(stream_name, STREAMS[stream_name], [("c1", None)])
+        mocked_write_bookmark.assert_not_called()
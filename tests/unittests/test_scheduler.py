@@ -0,0 +1,103 @@
+import inspect
+import unittest
+from unittest import mock
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.parallel import SyncPool
+from tap_snapchat_ads.scheduler import (AsyncioExecutor, SerialExecutor, ThreadExecutor,
+                                        build_stream_dag, get_executor)
+from tap_snapchat_ads.streams import STREAMS
+
+def mocked_get(*args, **kwargs):
+    """Mocked get function returning 1 organization, 2 ad accounts and 1 campaign per ad account"""
+    endpoint = kwargs.get("endpoint")
+    url = kwargs.get("url")
+    if endpoint == "organizations":
+        return {
+            "request_status": "SUCCESS",
+            "organizations": [{"sub_request_status": "SUCCESS", "organization": {"id": "org"}}]
+        }
+    if endpoint == "ad_accounts":
+        return {
+            "request_status": "SUCCESS",
+            "adaccounts": [{"sub_request_status": "SUCCESS", "adaccount": {"id": "acc{}".format(i)}} for i in range(1, 3)]
+        }
+    account = url.split("/adaccounts/")[1].split("/")[0]
+    return {
+        "request_status": "SUCCESS",
+        "campaigns": [{"sub_request_status": "SUCCESS", "campaign": {"id": "{}_campaign".format(account)}}]
+    }
+
+class TestStreamDag(unittest.TestCase):
+    """Test the stream DAG built from STREAMS"""
+
+    def test_dag_matches_children(self):
+        """Every stream has the children declared by its class"""
+        dag = build_stream_dag(STREAMS)
+
+        for stream_name, stream_class in STREAMS.items():
+            self.assertEqual(dag[stream_name], stream_class.children)
+        self.assertIn("campaigns", dag["ad_accounts"])
+        self.assertEqual(dag["targeting_genders"], [])
+
+    def test_inconsistent_parent_raises(self):
+        """A child whose parent_stream is another stream is rejected"""
+        parent = type("Parent", (), {"children": ["child"], "parent_stream": None})
+        child = type("Child", (), {"children": [], "parent_stream": "other"})
+
+        with self.assertRaises(ValueError):
+            build_stream_dag({"parent": parent, "child": child})
+
+class TestGetExecutor(unittest.TestCase):
+    """Test the executor selected from the config"""
+
+    def test_default_executors(self):
+        serial_pool = SyncPool({}, 1, [], mock.Mock())
+        parallel_pool = SyncPool({}, 2, [], mock.Mock())
+
+        self.assertIsInstance(get_executor({}, None), SerialExecutor)
+        self.assertIsInstance(get_executor({}, serial_pool), SerialExecutor)
+        self.assertIsInstance(get_executor({}, parallel_pool), ThreadExecutor)
+        self.assertIsInstance(get_executor({"async_stats": "true"}, serial_pool), AsyncioExecutor)
+        parallel_pool.shutdown()
+
+    def test_configured_executor(self):
+        parallel_pool = SyncPool({}, 2, [], mock.Mock())
+
+        self.assertIsInstance(get_executor({"sync_executor": "serial"}, parallel_pool), SerialExecutor)
+        with self.assertRaises(ValueError):
+            get_executor({"sync_executor": "processes"}, parallel_pool)
+        parallel_pool.shutdown()
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", side_effect=mocked_get)
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_schema")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+@mock.patch("tap_snapchat_ads.streams.update_currently_syncing")
+class TestSerialScheduler(unittest.TestCase):
+    """Test the serial executor syncs the stream DAG depth first without recursion"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+    streams = ["organizations", "ad_accounts", "campaigns"]
+
+    def test_depth_first_order_and_flat_stack(self, mocked_currently_syncing, mocked_write_bookmark, mocked_schema, mocked_get, mocked_access_token):
+        processed = []
+
+        def process_records(**kwargs):
+            processed.append(([record["id"] for record in kwargs["records"]], len(inspect.stack())))
+            return None, len(kwargs["records"])
+
+        with mock.patch("tap_snapchat_ads.streams.SnapchatAds.process_records", side_effect=process_records):
+            total = STREAMS["organizations"]().sync_endpoint(
+                client=self.client, config={"start_date": "2021-01-01T00:00:00Z"}, catalog=None, state={},
+                stream_name="organizations",
+                sync_streams=self.streams, selected_streams=self.streams)
+
+        self.assertEqual(total, 1)
+        self.assertEqual([ids for ids, _ in processed], [
+            ["org"], ["acc1", "acc2"], ["acc1_campaign"], ["acc2_campaign"]
+        ])
+        # grandchildren are synced with the same stack depth as the root stream
+        self.assertEqual(len({depth for _, depth in processed}), 1)
+        self.assertEqual(mocked_currently_syncing.mock_calls, [
+            mock.call({}, "ad_accounts"), mock.call({}, "campaigns"), mock.call({}, "campaigns")
+        ])
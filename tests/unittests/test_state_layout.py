@@ -0,0 +1,104 @@
+import json
+import unittest
+from unittest import mock
+from tap_snapchat_ads.checkpoint import open_checkpoints
+from tap_snapchat_ads.state_layout import CompactStateLayout, ParentBookmarks, expand_state
+from tap_snapchat_ads.streams import SnapchatAds
+
+WATERMARK = "2021-03-04T00:00:00.000000Z"
+BEHIND = "2021-03-03T00:00:00.000000Z"
+NEXT = "2021-03-05T00:00:00.000000Z"
+
+def get_state():
+    return {
+        "currently_syncing": "ad_stats_daily",
+        "bookmarks": {
+            "ad_stats_daily": {
+                "end_time(parent_ad_id:a1)": WATERMARK,
+                "end_time(parent_ad_id:a2)": WATERMARK,
+                "end_time(parent_ad_id:a3)": BEHIND,
+                "end_time(parent_ad_account_id:acc1)": WATERMARK
+            },
+            "ad_accounts": {"updated_at": WATERMARK}
+        }
+    }
+
+class TestCompactStateLayout(unittest.TestCase):
+    """Test the per-parent bookmarks are written as a watermark and its exceptions"""
+
+    def test_encode(self):
+        encoded_state = CompactStateLayout().encode(get_state())
+        self.assertEqual(encoded_state["bookmarks"]["ad_accounts"], {"updated_at": WATERMARK})
+        self.assertEqual(encoded_state["bookmarks"]["ad_stats_daily"], {"parent_bookmarks": {
+            "version": 1,
+            "end_time(parent_ad_id)": {"watermark": WATERMARK, "ids": "a1,a2", "exceptions": {"a3": BEHIND}},
+            "end_time(parent_ad_account_id)": {"watermark": WATERMARK, "ids": "acc1", "exceptions": {}}}})
+
+        # the legacy keys are read back
+        self.assertEqual(expand_state(json.loads(json.dumps(encoded_state))), get_state())
+
+    def test_changed_keys(self):
+        state = get_state()
+        layout = CompactStateLayout()
+        layout.encode(state)
+        bookmarks = state["bookmarks"]["ad_stats_daily"]
+        bookmarks["end_time(parent_ad_id:a4)"] = NEXT
+        del bookmarks["end_time(parent_ad_account_id:acc1)"]
+        layout.mark_changed("ad_stats_daily", ["end_time(parent_ad_id:a4)", "end_time(parent_ad_account_id:acc1)"])
+
+        encoded_state = layout.encode(state)
+        self.assertEqual(encoded_state["bookmarks"]["ad_stats_daily"]["parent_bookmarks"], {
+            "version": 1,
+            "end_time(parent_ad_id)": {"watermark": WATERMARK, "ids": "a1,a2", "exceptions": {"a3": BEHIND, "a4": NEXT}}})
+        self.assertEqual(expand_state(json.loads(json.dumps(encoded_state))), state)
+
+    def test_watermark_moves(self):
+        parent_bookmarks = ParentBookmarks({"a1": WATERMARK, "a2": WATERMARK, "a3": WATERMARK, "a4": WATERMARK, "a5": BEHIND})
+        parent_bookmarks.set("a1", NEXT)
+        parent_bookmarks.set("a2", NEXT)
+        self.assertEqual(parent_bookmarks.encode(), {"watermark": WATERMARK, "ids": "a3,a4", "exceptions": {"a5": BEHIND, "a1": NEXT, "a2": NEXT}})
+
+        # more parents at the next window than at the watermark
+        parent_bookmarks.set("a3", NEXT)
+        self.assertEqual(parent_bookmarks.encode(), {"watermark": NEXT, "ids": "a1,a2,a3", "exceptions": {"a5": BEHIND, "a4": WATERMARK}})
+        parent_bookmarks.set("a4", NEXT)
+        parent_bookmarks.set("a5", None)
+        self.assertEqual(parent_bookmarks.encode(), {"watermark": NEXT, "ids": "a1,a2,a3,a4", "exceptions": {}})
+
+    def test_legacy_keys(self):
+        state = {"bookmarks": {"ad_stats_daily": {
+            "parent_bookmarks": {"version": 1, "end_time(parent_ad_id)": {"watermark": WATERMARK, "ids": "a1,a2", "exceptions": {}}},
+            # written after the compact bookmarks, by a previous version of the tap
+            "end_time(parent_ad_id:a2)": NEXT}}}
+        self.assertEqual(expand_state(state)["bookmarks"]["ad_stats_daily"], {
+            "end_time(parent_ad_id:a1)": WATERMARK,
+            "end_time(parent_ad_id:a2)": NEXT})
+        self.assertEqual(SnapchatAds().get_bookmark(state, "ad_stats_daily", None, "end_time", "ad", "a1"), WATERMARK)
+
+        # the legacy state is read as it is
+        self.assertEqual(expand_state(get_state()), get_state())
+
+    def test_unknown_version(self):
+        state = {"bookmarks": {"ad_stats_daily": {"parent_bookmarks": {"version": 2}}}}
+        with self.assertRaises(ValueError):
+            expand_state(state)
+
+    @mock.patch("singer.write_state")
+    def test_checkpoints(self, mocked_write_state):
+        state = get_state()
+        with open_checkpoints({"compact_state": "true"}, state):
+            SnapchatAds().write_bookmark(state, "ad_stats_daily", NEXT, "end_time", "ad", "a3")
+            SnapchatAds().write_bookmarks(state, "ad_stats_daily", {"a1": NEXT, "a2": NEXT}, "end_time", "ad")
+
+        self.assertEqual(mocked_write_state.call_count, 2)
+        self.assertEqual(mocked_write_state.mock_calls[1].args[0]["bookmarks"]["ad_stats_daily"]["parent_bookmarks"]["end_time(parent_ad_id)"],
+                         {"watermark": NEXT, "ids": "a3,a1,a2", "exceptions": {}})
+        # the bookmarks of the sync keep the legacy keys
+        self.assertEqual(state["bookmarks"]["ad_stats_daily"]["end_time(parent_ad_id:a1)"], NEXT)
+
+    @mock.patch("singer.write_state")
+    def test_default_layout(self, mocked_write_state):
+        state = get_state()
+        with open_checkpoints({}, state):
+            SnapchatAds().write_bookmark(state, "ad_stats_daily", NEXT, "end_time", "ad", "a3")
+        self.assertEqual(mocked_write_state.mock_calls[0].args[0]["bookmarks"]["ad_stats_daily"]["end_time(parent_ad_id:a3)"], NEXT)
@@ -0,0 +1,119 @@
+import unittest
+from unittest import mock
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.pruning import BOOKMARK_PRUNER
+from tap_snapchat_ads.scheduler import build_stream_dag
+from tap_snapchat_ads.streams import STREAMS, SnapchatAds
+from tap_snapchat_ads.sync import sync
+
+class MockStream:
+    def __init__(self, stream):
+        self.stream = stream
+
+# mock class for Catalog
+class MockCatalog:
+    def __init__(self, streams):
+        self.streams = streams
+
+    def get_selected_streams(self, *args, **kwargs):
+        return [MockStream(stream) for stream in self.streams]
+
+def get_breakdown_entity(campaign_id, days):
+    return {
+        "id": campaign_id, "type": "CAMPAIGN", "granularity": "DAY",
+        "timeseries": [{"start_time": "2021-01-{:02d}T00:00:00.000-08:00".format(day),
+                        "end_time": "2021-01-{:02d}T00:00:00.000-08:00".format(day + 1),
+                        "stats": {"spend": day}} for day in days]
+    }
+
+def mocked_get(*args, **kwargs):
+    """Mocked get function: 1 organization, 1 ad account and the campaign breakdown of its stats"""
+    endpoint = kwargs.get("endpoint")
+    url = kwargs.get("url")
+    if endpoint == "organizations":
+        return {"request_status": "SUCCESS",
+                "organizations": [{"sub_request_status": "SUCCESS", "organization": {"id": "org"}}]}
+    if endpoint == "ad_accounts":
+        return {"request_status": "SUCCESS",
+                "adaccounts": [{"sub_request_status": "SUCCESS", "adaccount": {"id": "acc", "timezone": "America/Los_Angeles"}}]}
+    if url.startswith("https://adsapi.snapchat.com/v1/adaccounts/acc/stats?") and "breakdown=campaign" in url:
+        return {"request_status": "SUCCESS", "timeseries_stats": [{"sub_request_status": "SUCCESS", "timeseries_stat": {
+            "id": "acc", "type": "AD_ACCOUNT", "granularity": "DAY",
+            "breakdown_stats": {"campaign": [get_breakdown_entity("c1", [1, 2]), get_breakdown_entity("c2", [2, 3])]}}}]}
+    raise AssertionError("unexpected request {}".format(url))
+
+def mocked_process_records(catalog, stream_name, records, time_extracted, bookmark_field, max_bookmark_value, last_datetime):
+    """Mocked process_records, the bookmark is the max end_time of the records"""
+    return max(record["end_time"] for record in records), len(records)
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", side_effect=mocked_get)
+@mock.patch("tap_snapchat_ads.streams.utils.now", return_value=strptime_to_utc("2021-01-20T00:00:00Z"))
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_schema")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.process_records", side_effect=mocked_process_records)
+@mock.patch("singer.write_state")
+class TestStatsBreakdown(unittest.TestCase):
+    """Test the campaign stats are synced with one ad account request per date window"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+    config = {"start_date": "2021-01-01T00:00:00Z", "stats_breakdown": "true"}
+
+    def test_rows_split_per_campaign(self, mocked_write_state, mocked_process_records, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        state = {}
+        sync(self.client, self.config, MockCatalog(["campaign_stats_daily"]), state)
+
+        # the campaigns are not requested, one stats request for the ad account
+        self.assertEqual([call.kwargs["endpoint"] for call in mocked_get.mock_calls],
+                         ["organizations", "ad_accounts", "campaign_stats_daily"])
+        records = {call.kwargs["records"][0]["id"]: call.kwargs["records"] for call in mocked_process_records.mock_calls}
+        self.assertEqual([record["spend"] for record in records["c1"]], [1, 2])
+        self.assertEqual([record["spend"] for record in records["c2"]], [2, 3])
+        self.assertEqual(state["bookmarks"]["campaign_stats_daily"], {
+            "end_time(parent_campaign_id:c1)": "2021-01-03T00:00:00.000-08:00",
+            "end_time(parent_campaign_id:c2)": "2021-01-04T00:00:00.000-08:00",
+            "end_time(parent_ad_account_id:acc)": "2021-01-04T00:00:00.000-08:00"
+        })
+
+    def test_campaign_bookmarks_are_used(self, mocked_write_state, mocked_process_records, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        """The bookmarks of the stats synced per campaign are used before the first breakdown sync"""
+        state = {"bookmarks": {"campaign_stats_daily": {
+            "end_time(parent_campaign_id:c1)": "2021-01-02T00:00:00Z",
+            "end_time(parent_campaign_id:c2)": "2020-12-15T00:00:00Z"}}}
+        sync(self.client, self.config, MockCatalog(["campaign_stats_daily"]), state)
+
+        last_datetimes = {call.kwargs["records"][0]["id"]: call.kwargs["last_datetime"] for call in mocked_process_records.mock_calls}
+        self.assertEqual(last_datetimes, {"c1": "2021-01-02T00:00:00Z", "c2": "2020-12-15T00:00:00Z"})
+        stats_url = mocked_get.mock_calls[2].kwargs["url"]
+        # the first window starts at the earliest campaign bookmark, truncated to the day in the ad account timezone
+        self.assertIn("start_time=2020-12-14T08%3A00%3A00Z", stats_url)
+
+    def test_bookmarks_of_entities_without_rows_kept(self, mocked_write_state, mocked_process_records, mocked_schema, mocked_now, mocked_get, mocked_access_token):
+        """With prune_bookmarks, the bookmark of a campaign without rows in the breakdown is kept"""
+        state = {"bookmarks": {"campaign_stats_daily": {
+            "end_time(parent_campaign_id:c3)": "2021-01-02T00:00:00Z",
+            "end_time(parent_ad_account_id:removed)": "2021-01-02T00:00:00Z"}}}
+        try:
+            sync(self.client, dict(self.config, prune_bookmarks="true"), MockCatalog(["campaign_stats_daily"]), state)
+        finally:
+            BOOKMARK_PRUNER.configure({})
+
+        bookmarks = state["bookmarks"]["campaign_stats_daily"]
+        self.assertEqual(bookmarks["end_time(parent_campaign_id:c3)"], "2021-01-02T00:00:00Z")
+        self.assertIn("end_time(parent_campaign_id:c1)", bookmarks)
+        # the ad accounts are listed, the bookmark of an ad account not seen is removed
+        self.assertNotIn("end_time(parent_ad_account_id:removed)", bookmarks)
+
+class TestBreakdownDag(unittest.TestCase):
+    """Test the stats streams with a breakdown are children of the ad accounts in bulk mode"""
+
+    def test_breakdown_dag(self):
+        dag = build_stream_dag(STREAMS, stats_breakdown=True)
+
+        self.assertEqual(dag["campaigns"], [])
+        self.assertEqual(dag["ads"], [])
+        for stream_name in ["campaign_stats_daily", "ad_squad_stats_hourly", "ad_stats_daily"]:
+            self.assertIn(stream_name, dag["ad_accounts"])
+        # the ad account stats have no breakdown
+        self.assertIn("ad_account_stats_daily", dag["ad_accounts"])
+        self.assertIsNone(SnapchatAds.breakdown)
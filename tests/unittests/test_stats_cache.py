@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.stats_cache import StatsWindowCache, evict_stats_cache, is_final_window
+from tap_snapchat_ads.streams import STREAMS
+
+NOW = strptime_to_utc("2021-04-01T00:00:00Z")
+
+class TestStatsWindowCache(unittest.TestCase):
+    """Test the stats responses are cached by request"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = StatsWindowCache(self.cache_dir.name)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_key_ignores_param_order(self):
+        data = {"request_status": "SUCCESS", "timeseries_stats": []}
+        self.cache.put("https://adsapi.snapchat.com/v1/campaigns/c1/stats?granularity=DAY&fields=spend", data)
+
+        self.assertEqual(self.cache.get("https://adsapi.snapchat.com/v1/campaigns/c1/stats?fields=spend&granularity=DAY"), data)
+        self.assertIsNone(self.cache.get("https://adsapi.snapchat.com/v1/campaigns/c2/stats?fields=spend&granularity=DAY"))
+        self.assertIsNone(self.cache.get("https://adsapi.snapchat.com/v1/campaigns/c1/stats?fields=spend,impressions&granularity=DAY"))
+
+    def test_unreadable_file(self):
+        url = "https://adsapi.snapchat.com/v1/campaigns/c1/stats?fields=spend"
+        path = self.cache.get_path(url)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as cache_file:
+            cache_file.write(b"not gzip")
+
+        self.assertIsNone(self.cache.get(url))
+
+    def test_eviction(self):
+        """The responses not read or written for the retention are removed"""
+        data = {"request_status": "SUCCESS", "timeseries_stats": []}
+        old_url = "https://adsapi.snapchat.com/v1/campaigns/c1/stats?fields=spend"
+        used_url = "https://adsapi.snapchat.com/v1/campaigns/c2/stats?fields=spend"
+        for url in (old_url, used_url):
+            self.cache.put(url, data)
+            os.utime(self.cache.get_path(url), (0, 0))
+        # a read keeps the response
+        self.cache.get(used_url)
+
+        self.assertEqual(evict_stats_cache({"stats_cache_dir": self.cache_dir.name, "stats_cache_retention_days": 10}), 1)
+        self.assertIsNone(self.cache.get(old_url))
+        self.assertEqual(self.cache.get(used_url), data)
+        self.assertEqual(evict_stats_cache({}), 0)
+
+    def test_final_window(self):
+        self.assertTrue(is_final_window(strptime_to_utc("2021-03-04T00:00:00Z"), NOW, 28))
+        self.assertFalse(is_final_window(strptime_to_utc("2021-03-05T00:00:00Z"), NOW, 28))
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get", return_value={"request_status": "SUCCESS", "timeseries_stats": []})
+@mock.patch("tap_snapchat_ads.streams.utils.now", return_value=NOW)
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+class TestStatsCacheSync(unittest.TestCase):
+    """Test a backfill requests only the windows of the attribution window again"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+
+    def sync_stats(self, config, state=None):
+        stream_name = "campaign_stats_daily"
+        list(STREAMS[stream_name]().iter_endpoint(
+            client=self.client, config=config, catalog=None, state=state or {}, stream_name=stream_name,
+            stream_class=STREAMS[stream_name], sync_streams=[stream_name], selected_streams=[stream_name], parent_id="c1"))
+
+    def test_backfill_from_cache(self, mocked_write_bookmark, mocked_now, mocked_get, mocked_access_token):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            config = {"start_date": "2021-01-01T00:00:00Z", "stats_cache_dir": cache_dir}
+            self.sync_stats(config)
+            # 3 windows of 30 days
+            self.assertEqual(mocked_get.call_count, 3)
+
+            mocked_get.reset_mock()
+            self.sync_stats(config)
+
+            # the 2 windows ending before the 28 days attribution window are cached
+            self.assertEqual(mocked_get.call_count, 1)
+            self.assertIn("start_time=2021-03-02", mocked_get.mock_calls[0].kwargs["url"])
+            self.assertEqual(mocked_write_bookmark.call_count, 6)
+
+    def test_adaptive_windows_from_cache(self, mocked_write_bookmark, mocked_now, mocked_get, mocked_access_token):
+        """With adaptive windows the final windows keep the configured size, a backfill reads them from the cache"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            config = {"start_date": "2021-01-01T00:00:00Z", "stats_cache_dir": cache_dir, "adaptive_date_windows": "true"}
+            self.sync_stats(config, {"date_window_sizes": {"campaign_stats_daily": 7}})
+            self.assertIn("start_time=2021-01-01", mocked_get.mock_calls[0].kwargs["url"])
+            self.assertIn("end_time=2021-01-31", mocked_get.mock_calls[0].kwargs["url"])
+
+            mocked_get.reset_mock()
+            # the adaptive size moved since the first run
+            self.sync_stats(config, {"date_window_sizes": {"campaign_stats_daily": 3}})
+
+            # only the windows of the attribution window are requested
+            start_times = [parse_qs(urlparse(call.kwargs["url"]).query)["start_time"][0] for call in mocked_get.mock_calls]
+            self.assertEqual(start_times[0], "2021-03-02T00:00:00Z")
@@ -0,0 +1,151 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+from singer.utils import strptime_to_utc
+from tap_snapchat_ads.client import SnapchatClient
+from tap_snapchat_ads.stats_dedupe import GENERATION_KEY, StatsDedupe, open_stats_dedupe
+from tap_snapchat_ads.streams import STREAMS
+
+NOW = strptime_to_utc("2021-04-01T00:00:00Z")
+
+def get_row(start_time, impressions, finalized_data_end_time="2021-03-31T00:00:00Z"):
+    return {"id": "c1", "start_time": start_time, "end_time": start_time, "impressions": impressions,
+            "finalized_data_end_time": finalized_data_end_time}
+
+class TestStatsDedupe(unittest.TestCase):
+    """Test the stats rows are written again only when their values change"""
+
+    def setUp(self):
+        self.dedupe_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dedupe_dir.cleanup()
+
+    def get_dedupe(self, state=None):
+        return StatsDedupe(self.dedupe_dir.name, 30, date(2021, 4, 1), state)
+
+    def write(self, dedupe, stream_name, records, last_datetime=None):
+        """filter_changed then record_written, as around process_records"""
+        changed_records = dedupe.filter_changed(stream_name, records)
+        dedupe.record_written(stream_name, changed_records, "end_time", last_datetime)
+        return changed_records
+
+    def test_changed_rows_across_runs(self):
+        rows = [get_row("2021-03-30T00:00:00Z", 10), get_row("2021-03-31T00:00:00Z", 20)]
+        dedupe = self.get_dedupe()
+        self.assertEqual(self.write(dedupe, "campaign_stats_daily", rows), rows)
+        # same rows in the same run
+        self.assertEqual(dedupe.filter_changed("campaign_stats_daily", rows), [])
+        dedupe.save()
+
+        dedupe = self.get_dedupe()
+        changed_row = get_row("2021-03-31T00:00:00Z", 25, "2021-04-01T00:00:00Z")
+        new_row = get_row("2021-04-01T00:00:00Z", 5)
+        records = [get_row("2021-03-30T00:00:00Z", 10, "2021-04-01T00:00:00Z"), changed_row, new_row]
+        self.assertEqual(dedupe.filter_changed("campaign_stats_daily", records), [changed_row, new_row])
+        # other stream
+        self.assertEqual(dedupe.filter_changed("campaign_stats_hourly", rows), rows)
+
+    def test_not_saved_on_failure(self):
+        rows = [get_row("2021-03-30T00:00:00Z", 10)]
+        with self.assertRaises(ValueError):
+            with open_stats_dedupe({"stats_dedupe_dir": self.dedupe_dir.name}, {}, 28) as dedupe:
+                self.write(dedupe, "campaign_stats_daily", rows)
+                raise ValueError("failed sync")
+
+        self.assertEqual(self.get_dedupe().filter_changed("campaign_stats_daily", rows), rows)
+
+    def test_retention(self):
+        old_row = get_row("2021-02-01T00:00:00Z", 10)
+        dedupe = self.get_dedupe()
+        self.write(dedupe, "campaign_stats_daily", [old_row, get_row("2021-03-30T00:00:00Z", 10)])
+        dedupe.save()
+
+        self.assertEqual(os.path.getsize(dedupe.get_path("campaign_stats_daily")), 8 + 20)
+        self.assertEqual(self.get_dedupe().filter_changed("campaign_stats_daily", [old_row]), [old_row])
+
+    def test_unreadable_file(self):
+        with open(self.get_dedupe().get_path("campaign_stats_daily"), "wb") as fingerprint_file:
+            fingerprint_file.write(b"\x05")
+
+        rows = [get_row("2021-03-30T00:00:00Z", 10)]
+        self.assertEqual(self.get_dedupe().filter_changed("campaign_stats_daily", rows), rows)
+
+    def test_no_dedupe_dir(self):
+        with open_stats_dedupe({}, {}, 28) as dedupe:
+            self.assertIsNone(dedupe)
+
+    def test_rows_not_written(self):
+        """The rows dropped by process_records (before the bookmark) are written again"""
+        rows = [get_row("2021-03-30T00:00:00Z", 10), get_row("2021-03-31T00:00:00Z", 20)]
+        dedupe = self.get_dedupe()
+        self.write(dedupe, "campaign_stats_daily", rows, "2021-03-31T00:00:00Z")
+        self.assertEqual(dedupe.filter_changed("campaign_stats_daily", rows), [rows[0]])
+
+    def test_written_copies(self):
+        """The written rows are matched by their id and start_time, not by the record object"""
+        rows = [get_row("2021-03-30T00:00:00Z", 10), get_row("2021-03-31T00:00:00Z", 20)]
+        dedupe = self.get_dedupe()
+        changed_records = dedupe.filter_changed("campaign_stats_daily", rows)
+        # only a copy of the first row is written
+        dedupe.record_written("campaign_stats_daily", [dict(changed_records[0])], "end_time")
+
+        self.assertEqual(dedupe.filter_changed("campaign_stats_daily", [get_row("2021-03-30T00:00:00Z", 10)]), [])
+        self.assertEqual(dedupe.filter_changed("campaign_stats_daily", rows), [rows[1]])
+
+    @mock.patch("singer.write_state")
+    def test_generation(self, mocked_write_state):
+        rows = [get_row("{}T00:00:00Z".format(date.today().isoformat()), 10)]
+        state = {}
+        with open_stats_dedupe({"stats_dedupe_dir": self.dedupe_dir.name}, state, 28) as dedupe:
+            self.write(dedupe, "campaign_stats_daily", rows)
+        generation = state[GENERATION_KEY]
+
+        # the state of the completed sync
+        self.assertEqual(self.get_dedupe({GENERATION_KEY: generation}).filter_changed("campaign_stats_daily", rows), [])
+        # a state reset or another generation: all the rows are written
+        self.assertEqual(self.get_dedupe({}).filter_changed("campaign_stats_daily", rows), rows)
+        self.assertEqual(self.get_dedupe({GENERATION_KEY: generation}).filter_changed("campaign_stats_daily", rows), rows)
+
+@mock.patch("tap_snapchat_ads.client.SnapchatClient.get_access_token")
+@mock.patch("tap_snapchat_ads.streams.utils.now", return_value=NOW)
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_bookmark")
+@mock.patch("tap_snapchat_ads.streams.SnapchatAds.process_records", return_value=(None, 0))
+class TestStatsDedupeSync(unittest.TestCase):
+    """Test the unchanged rows of the attribution window are not processed again"""
+
+    client = SnapchatClient(client_id="id", client_secret="secret", refresh_token="token", request_timeout=300)
+
+    def sync_stats(self, stats_dedupe):
+        stream_name = "campaign_stats_daily"
+        state = {"bookmarks": {stream_name: {"end_time(parent_campaign_id:c1)": "2021-03-31T00:00:00Z"}}}
+        list(STREAMS[stream_name]().iter_endpoint(
+            client=self.client, config={"start_date": "2021-01-01T00:00:00Z"}, catalog=None, state=state,
+            stream_name=stream_name, stream_class=STREAMS[stream_name], sync_streams=[stream_name],
+            selected_streams=[stream_name], parent_id="c1", stats_dedupe=stats_dedupe))
+
+    def test_unchanged_rows(self, mocked_process_records, mocked_write_bookmark, mocked_now, mocked_access_token):
+        def get_response(impressions):
+            return {"request_status": "SUCCESS", "timeseries_stats": [{"timeseries_stat": {
+                "id": "c1", "type": "CAMPAIGN", "granularity": "DAY",
+                "start_time": "2021-03-04T00:00:00.000-00:00", "end_time": "2021-04-01T00:00:00.000-00:00",
+                "finalized_data_end_time": "2021-03-31T00:00:00.000-00:00",
+                "timeseries": [
+                    {"start_time": "2021-03-30T00:00:00.000-00:00", "end_time": "2021-03-31T00:00:00.000-00:00",
+                     "stats": {"impressions": 10}},
+                    {"start_time": "2021-03-31T00:00:00.000-00:00", "end_time": "2021-04-01T00:00:00.000-00:00",
+                     "stats": {"impressions": impressions}}]}}]}
+
+        with tempfile.TemporaryDirectory() as dedupe_dir:
+            stats_dedupe = StatsDedupe(dedupe_dir, 30, date(2021, 4, 1))
+            with mock.patch("tap_snapchat_ads.client.SnapchatClient.get", return_value=get_response(20)):
+                self.sync_stats(stats_dedupe)
+            self.assertEqual(len(mocked_process_records.mock_calls[0].kwargs["records"]), 2)
+
+            mocked_process_records.reset_mock()
+            with mock.patch("tap_snapchat_ads.client.SnapchatClient.get", return_value=get_response(25)):
+                self.sync_stats(stats_dedupe)
+            records = mocked_process_records.mock_calls[0].kwargs["records"]
+            self.assertEqual([record["start_time"] for record in records], ["2021-03-31T00:00:00.000-00:00"])
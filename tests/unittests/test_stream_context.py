@@ -0,0 +1,39 @@
+import unittest
+from unittest import mock
+from tap_snapchat_ads.context import get_stream_context, get_timezone
+from tap_snapchat_ads.discover import discover
+from tap_snapchat_ads.streams import STREAMS, SnapchatAds
+
+class TestStreamContext(unittest.TestCase):
+    """Test the catalog entry of a stream is read once per catalog"""
+
+    stream_name = "campaign_stats_daily"
+
+    @mock.patch("tap_snapchat_ads.streams.SnapchatAds.write_record")
+    @mock.patch("tap_snapchat_ads.streams.singer.write_schema")
+    def test_built_once(self, mocked_write_schema, mocked_write_record):
+        catalog = discover()
+        records = [{"id": "c1", "start_time": "2021-03-01T00:00:00Z", "end_time": "2021-03-02T00:00:00Z", "impressions": 1}]
+        with mock.patch.object(catalog, "get_stream", wraps=catalog.get_stream) as mocked_get_stream:
+            stream_obj = SnapchatAds()
+            stream_obj.write_schema(catalog, self.stream_name, [self.stream_name], [self.stream_name])
+            for _ in range(3):
+                stream_obj.process_records(catalog, self.stream_name, records, None, "end_time", None, "2021-01-01T00:00:00Z")
+                stream_obj.get_stream_params(self.stream_name, STREAMS[self.stream_name], {}, catalog)
+
+        self.assertEqual(mocked_get_stream.call_count, 1)
+        self.assertEqual(mocked_write_record.call_count, 3)
+        self.assertEqual(mocked_write_schema.mock_calls[0].args[2], ["id", "start_time"])
+
+        # another catalog (another sync) has its own context
+        other_catalog = discover()
+        context = get_stream_context(other_catalog, self.stream_name, STREAMS[self.stream_name])
+        self.assertIs(context.catalog, other_catalog)
+        self.assertEqual(context.bookmark_field, "end_time")
+        self.assertIn("impressions", context.selected_fields)
+        with self.assertRaises(AttributeError):
+            context.schema = {}
+
+    def test_timezone(self):
+        self.assertIs(get_timezone("America/Los_Angeles"), get_timezone("America/Los_Angeles"))
+        self.assertEqual(get_timezone(None), get_timezone("UTC"))